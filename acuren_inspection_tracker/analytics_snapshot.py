@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Snapshot copy of the database for the analytics and report routes.
+
+The heavy aggregates read a separate file copied from the live database
+with SQLite's online backup API, so they never hold locks that claim,
+update and upload requests wait on. A background thread started on first
+use refreshes the copy once it is ANALYTICS_REFRESH_SECONDS old or
+ANALYTICS_REFRESH_WRITES task changes behind (counted with the change
+sequence), and the copy is swapped in with an atomic rename so readers of
+the old file finish undisturbed. Every snapshot records when it was taken;
+routes report its age.
+
+Every worker process runs the thread, but only one copies at a time: a
+refresh first claims the lease row in analytics_snapshot_lease of the live
+database under the write lock, and re-checks the snapshot once it holds
+it, since the previous holder may have just refreshed it. A lease whose
+holder died runs out after LEASE_SECONDS.
+
+    python analytics_snapshot.py inspection_tracker.db    # refresh once, e.g. from cron
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+from flask import jsonify
+
+from delta_sync import current_seq
+from instrumentation import TracedConnection
+
+DEFAULT_REFRESH_SECONDS = 300
+DEFAULT_REFRESH_WRITES = 1000
+POLL_SECONDS = 5
+LEASE_SECONDS = 600
+
+SNAPSHOT_LEASE_SQL = '''
+    CREATE TABLE IF NOT EXISTS analytics_snapshot_lease (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        holder INTEGER NOT NULL,
+        expires_at REAL NOT NULL
+    )
+'''
+
+_settings = {
+    'database': None,
+    'path': None,
+    'refresh_seconds': DEFAULT_REFRESH_SECONDS,
+    'refresh_writes': DEFAULT_REFRESH_WRITES
+}
+
+
+def create_snapshot_lease_table(conn):
+    conn.execute(SNAPSHOT_LEASE_SQL)
+
+
+def claim_lease(conn, holder, lease_seconds=LEASE_SECONDS):
+    """Take the refresh lease under the write lock unless another live holder has it"""
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT holder, expires_at FROM analytics_snapshot_lease WHERE id = 1').fetchone()
+        if row is not None and row[0] != holder and row[1] > now:
+            conn.rollback()
+            return False
+        conn.execute('INSERT OR REPLACE INTO analytics_snapshot_lease (id, holder, expires_at) VALUES (1, ?, ?)',
+                     (holder, now + lease_seconds))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def release_lease(conn, holder):
+    conn.execute('DELETE FROM analytics_snapshot_lease WHERE id = 1 AND holder = ?', (holder,))
+    conn.commit()
+
+
+def default_snapshot_path(database):
+    root, extension = os.path.splitext(database)
+    return f'{root}_analytics{extension or ".db"}'
+
+
+def take_snapshot(database, snapshot_path):
+    """Copy database to snapshot_path with the backup API; returns the snapshot info.
+
+    The copy is made in one backup step, which reads a single consistent
+    version of the database; in WAL mode writers carry on meanwhile.
+    """
+    temp_path = f'{snapshot_path}.{os.getpid()}.tmp'
+    source = sqlite3.connect(database)
+    target = sqlite3.connect(temp_path)
+    try:
+        started = time.time()
+        source.backup(target)
+        # A self-contained file that read-only connections can open
+        target.execute('PRAGMA journal_mode=DELETE')
+        target.execute('DROP TABLE IF EXISTS snapshot_info')
+        target.execute('CREATE TABLE snapshot_info (taken_at REAL, change_seq INTEGER, copy_seconds REAL)')
+        target.execute('INSERT INTO snapshot_info VALUES (?, ?, ?)',
+                       (started, current_seq(target), time.time() - started))
+        target.commit()
+    finally:
+        target.close()
+        source.close()
+    os.replace(temp_path, snapshot_path)
+    return read_snapshot_info(snapshot_path)
+
+
+def read_snapshot_info(snapshot_path):
+    """taken_at, age_seconds, change_seq and copy_seconds of a snapshot file, or None"""
+    if not os.path.exists(snapshot_path):
+        return None
+    conn = _open_read_only(snapshot_path)
+    try:
+        return connection_info(conn)
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def connection_info(conn):
+    """Snapshot info of the file an open snapshot connection reads"""
+    taken_at, change_seq, copy_seconds = conn.execute(
+        'SELECT taken_at, change_seq, copy_seconds FROM snapshot_info').fetchone()
+    return {
+        'taken_at': datetime.fromtimestamp(taken_at).isoformat(timespec='seconds'),
+        'age_seconds': round(time.time() - taken_at, 1),
+        'change_seq': change_seq,
+        'copy_seconds': round(copy_seconds, 3)
+    }
+
+
+def _open_read_only(path, factory=sqlite3.Connection):
+    return sqlite3.connect(f'file:{quote(os.path.abspath(path))}?mode=ro', uri=True, factory=factory)
+
+
+class SnapshotRefresher:
+    """Refreshes the snapshot from one background thread, started on first use"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget the thread and lock; a forked worker starts its own"""
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='analytics-snapshot', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(POLL_SECONDS)
+            try:
+                refresh_if_stale()
+            except Exception as e:
+                print(f"Analytics snapshot refresh failed: {e}")
+
+    def refresh(self, only_if_stale=False):
+        """Take a snapshot now; None when another thread or process is already taking one.
+
+        With only_if_stale the snapshot is re-checked once the lease is held
+        and returned as it is when another process has just refreshed it.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            conn = sqlite3.connect(_settings['database'], timeout=30)
+            try:
+                if not claim_lease(conn, os.getpid()):
+                    return None
+                try:
+                    info = read_snapshot_info(_settings['path'])
+                    if only_if_stale and not is_stale(info):
+                        return info
+                    return take_snapshot(_settings['database'], _settings['path'])
+                finally:
+                    release_lease(conn, os.getpid())
+            finally:
+                conn.close()
+        finally:
+            self._lock.release()
+
+
+refresher = SnapshotRefresher()
+os.register_at_fork(after_in_child=refresher.reset)
+
+
+def writes_behind(info):
+    """Task changes made on the live database since the snapshot was taken"""
+    conn = sqlite3.connect(_settings['database'])
+    try:
+        return current_seq(conn) - (info['change_seq'] or 0)
+    finally:
+        conn.close()
+
+
+def is_stale(info):
+    return (info is None or info['age_seconds'] >= _settings['refresh_seconds']
+            or writes_behind(info) >= _settings['refresh_writes'])
+
+
+def refresh_if_stale():
+    # Re-read the file: another worker process may have refreshed it already
+    info = read_snapshot_info(_settings['path'])
+    if is_stale(info):
+        return refresher.refresh(only_if_stale=True)
+    return info
+
+
+def connect():
+    """Traced read-only connection to the snapshot, taking the first one if none exists yet"""
+    path = _settings['path']
+    deadline = time.monotonic() + LEASE_SECONDS
+    # Whoever holds the lease is taking the first snapshot; wait for its file
+    while not os.path.exists(path) and refresher.refresh(only_if_stale=True) is None:
+        if time.monotonic() > deadline:
+            raise TimeoutError('No analytics snapshot was taken in time')
+        time.sleep(0.1)
+    refresher.start()
+    return _open_read_only(path, TracedConnection)
+
+
+def snapshot_status():
+    """Age of the analytics snapshot and how far the live database has moved on"""
+    info = read_snapshot_info(_settings['path'])
+    if info is not None:
+        info['writes_behind'] = writes_behind(info)
+    return jsonify({
+        'snapshot': info,
+        'refresh_seconds': _settings['refresh_seconds'],
+        'refresh_writes': _settings['refresh_writes']
+    })
+
+
+def refresh_snapshot():
+    """Refresh the snapshot now"""
+    info = refresher.refresh()
+    if info is None:
+        return jsonify({'message': 'A refresh is already running',
+                        'snapshot': read_snapshot_info(_settings['path'])}), 409
+    return jsonify({'message': 'Snapshot refreshed', 'snapshot': info})
+
+
+def init_app(app):
+    """Point the snapshot at the app's database and register its status and refresh endpoints"""
+    _settings['database'] = app.config['DATABASE']
+    _settings['path'] = app.config.get('ANALYTICS_SNAPSHOT') or default_snapshot_path(app.config['DATABASE'])
+    _settings['refresh_seconds'] = float(app.config.get('ANALYTICS_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS))
+    _settings['refresh_writes'] = int(app.config.get('ANALYTICS_REFRESH_WRITES', DEFAULT_REFRESH_WRITES))
+    app.add_url_rule('/api/analytics/snapshot', 'analytics_snapshot', snapshot_status)
+    app.add_url_rule('/api/analytics/snapshot/refresh', 'analytics_snapshot_refresh', refresh_snapshot,
+                     methods=['POST'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refresh the analytics snapshot of a database')
+    parser.add_argument('database', nargs='?', default='inspection_tracker.db')
+    parser.add_argument('--snapshot', help='Snapshot file (default: <database>_analytics.db)')
+    args = parser.parse_args()
+
+    info = take_snapshot(args.database, args.snapshot or default_snapshot_path(args.database))
+    print(f"Snapshot at change {info['change_seq']} taken in {info['copy_seconds']}s")
@@ -1,188 +1,194 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
 import pandas as pd
 import sqlite3
 import json
+import math
 from datetime import datetime, timedelta
 import os
 import uuid
 from werkzeug.utils import secure_filename
+from werkzeug.http import parse_content_range_header
 import numpy as np
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+from due_dates import COMPLETION_STATUSES, record_completion, recompute_due_dates
+from auto_assign import DEFAULT_SITE_PENALTY, apply_assignments, plan_assignments
+import instrumentation
+from instrumentation import TracedConnection
+import slow_query_log
+import analytics_snapshot
+import task_archive
+import due_alerts
+import authorization
+import single_flight
+import maintenance
+from single_flight import CoalesceTimeout, busy_response, coalesce, flights
+from blob_store import BlobStore, FileTooLarge
+from attachments import (THUMBNAIL_WORKERS, UploadError, append_chunk, complete_upload, delete_attachment,
+                         expire_uploads, get_attachment, get_upload, list_attachments, start_upload,
+                         thumbnail_path, thumbnails)
+from delta_sync import (DEFAULT_BATCH_SIZE as DEFAULT_SYNC_BATCH_SIZE, changes_since, check_conflicts,
+                        current_seq, needs_full_resync, sync_site_ids, task_seqs, validate_changes)
+import response_encoding
+from response_encoding import parse_fields
+from lookup_encoding import TASK_FIELDS, UnknownName, find_id, id_list_sql, lookup_id
+from data_loader import SCOPE_SHEET, insert_tasks
+from scope_files import find_duplicate, remove_upload_tasks, save_scope_file
+from scope_validation import validate_scope
+from migrations import migrate
+from task_links import (DEFAULT_PAGE_SIZE as DEFAULT_LINK_PAGE_SIZE, MAX_LINK_TASKS, RELATION_PATHS, RELATIONS,
+                        entity_exists, link_tasks, linked_tasks, task_links, unlink_tasks)
+from hierarchy import DEFAULT_PAGE_SIZE as DEFAULT_HIERARCHY_PAGE_SIZE, find_node, hierarchy_level
+from facets import FACET_COLUMNS, cache as facet_cache
+from xlsx_export import XLSX_MIMETYPE, export_to_temp_file, stream_and_remove
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Ensure upload directory exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Room for multipart boundaries and form fields around an uploaded file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
 
-# Database initialization (same as before)
-def init_db():
-    conn = sqlite3.connect('inspection_tracker.db')
-    cursor = conn.cursor()
+bp = Blueprint('tracker', __name__)
+
+def default_config():
+    """Settings taken from the environment unless create_app is given them"""
+    return {
+        'DATABASE': os.environ.get('DATABASE', 'inspection_tracker.db'),
+        'UPLOAD_FOLDER': os.environ.get('UPLOAD_FOLDER', UPLOAD_FOLDER),
+        'METRICS_DIR': os.environ.get('METRICS_DIR'),
+        'SLOW_QUERY_MS': float(os.environ.get('SLOW_QUERY_MS', 250)),
+        'SLOW_QUERY_LOG': os.environ.get('SLOW_QUERY_LOG', os.path.join('logs', 'slow_queries.log')),
+        'COMPRESS_MIN_BYTES': int(os.environ.get('COMPRESS_MIN_BYTES', 1024)),
+        'ATTACHMENT_FOLDER': os.environ.get('ATTACHMENT_FOLDER', 'attachments'),
+        'ATTACHMENT_MAX_BYTES': int(os.environ.get('ATTACHMENT_MAX_BYTES', 2 * 1024 ** 3)),
+        'ATTACHMENT_UPLOAD_EXPIRE_HOURS': float(os.environ.get('ATTACHMENT_UPLOAD_EXPIRE_HOURS', 24)),
+        'SCOPE_MAX_BYTES': int(os.environ.get('SCOPE_MAX_BYTES', 50 * 1024 ** 2)),
+        'THUMBNAIL_WORKERS': int(os.environ.get('THUMBNAIL_WORKERS', THUMBNAIL_WORKERS)),
+        'ANALYTICS_SNAPSHOT': os.environ.get('ANALYTICS_SNAPSHOT'),
+        'ANALYTICS_REFRESH_SECONDS': float(os.environ.get('ANALYTICS_REFRESH_SECONDS', 300)),
+        'ANALYTICS_REFRESH_WRITES': int(os.environ.get('ANALYTICS_REFRESH_WRITES', 1000)),
+        'TASK_ARCHIVE': os.environ.get('TASK_ARCHIVE'),
+        'ARCHIVE_AFTER_DAYS': float(os.environ.get('ARCHIVE_AFTER_DAYS', 180)),
+        'ARCHIVE_BATCH_SIZE': int(os.environ.get('ARCHIVE_BATCH_SIZE', 2000)),
+        'DUE_ALERT_SWEEP_SECONDS': float(os.environ.get('DUE_ALERT_SWEEP_SECONDS', 300)),
+        'DUE_SOON_DAYS': int(os.environ.get('DUE_SOON_DAYS', 7)),
+        'AUTHORIZATION': os.environ.get('AUTHORIZATION', 'audit'),
+        'AUTHORIZATION_RECHECK_SECONDS': float(os.environ.get('AUTHORIZATION_RECHECK_SECONDS', 1)),
+        'SINGLE_FLIGHT_TIMEOUT_SECONDS': float(os.environ.get('SINGLE_FLIGHT_TIMEOUT_SECONDS', 30)),
+        'MAINTENANCE_CHECK_SECONDS': float(os.environ.get('MAINTENANCE_CHECK_SECONDS', 600)),
+        'MAINTENANCE_ANALYZE_WRITES': int(os.environ.get('MAINTENANCE_ANALYZE_WRITES', 50000)),
+        'MAINTENANCE_VACUUM_SECONDS': float(os.environ.get('MAINTENANCE_VACUUM_SECONDS', 2)),
+        'MAINTENANCE_VACUUM_MIN_PAGES': int(os.environ.get('MAINTENANCE_VACUUM_MIN_PAGES', 1024)),
+        'MAINTENANCE_INTEGRITY_SECONDS': float(os.environ.get('MAINTENANCE_INTEGRITY_SECONDS', 86400)),
+        'SYNC_TOMBSTONE_DAYS': float(os.environ.get('SYNC_TOMBSTONE_DAYS', 90))
+    }
+
+def create_app(config=None):
+    """Build the app from default_config() overridden by config.
     
-    # Create tables based on the Excel data structure
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS inspection_tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            site TEXT,
-            site_project TEXT,
-            hierarchy_item_name TEXT,
-            description TEXT,
-            mechanism TEXT,
-            method TEXT,
-            extent TEXT,
-            frequency REAL,
-            interval_type TEXT,
-            inspection_priority INTEGER,
-            last_inspection_date DATE,
-            install_date DATE,
-            due_date DATE,
-            current_inspection_date DATE,
-            inspector TEXT,
-            status TEXT,
-            comments TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    Nothing touches the database here: run init_db once per deployment (the
+    production launcher does it in the master before forking workers).
+    """
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
+    CORS(app)  # Enable CORS for all routes
     
-    # Create lookup tables for dropdown values
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS inspectors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE,
-            role TEXT DEFAULT 'Field Inspector',
-            active BOOLEAN DEFAULT 1
-        )
-    ''')
+    # Per-route latency, SQL statement and response size metrics at /api/metrics
+    instrumentation.init_app(app)
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sites (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            site_code TEXT UNIQUE,
-            site_name TEXT,
-            active BOOLEAN DEFAULT 1
-        )
-    ''')
+    # Statements over SLOW_QUERY_MS are logged with their plans at /api/debug/slow-queries
+    slow_query_log.init_app(app)
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS methods (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            method_name TEXT UNIQUE,
-            description TEXT,
-            active BOOLEAN DEFAULT 1
-        )
-    ''')
+    # orjson-backed jsonify; JSON over COMPRESS_MIN_BYTES is gzip/brotli encoded
+    response_encoding.init_app(app)
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS status_types (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            status_name TEXT UNIQUE,
-            description TEXT,
-            active BOOLEAN DEFAULT 1
-        )
-    ''')
+    # Analytics and reports read a periodically refreshed copy of the database
+    analytics_snapshot.init_app(app)
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE,
-            email TEXT,
-            role TEXT,
-            active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    # Long-closed tasks move to an attached archive database; live queries read only open work
+    task_archive.init_app(app)
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS notifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            task_id INTEGER,
-            message TEXT,
-            notification_type TEXT,
-            read_status BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (task_id) REFERENCES inspection_tasks (id)
-        )
-    ''')
+    # Tasks crossing into the due-soon, due-today and overdue windows raise notifications
+    due_alerts.init_app(app)
     
-    # Add new tables for enhanced features
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS scope_uploads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT,
-            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            uploaded_by TEXT,
-            status TEXT DEFAULT 'pending_review',
-            records_count INTEGER,
-            review_notes TEXT
-        )
-    ''')
+    # Every API route requires a permission of the caller's role (X-Employee-Id header);
+    # denials are only logged unless AUTHORIZATION=enforce
+    authorization.init_app(app)
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS task_assignments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER,
-            assigned_by TEXT,
-            assigned_to TEXT,
-            assignment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            notes TEXT,
-            FOREIGN KEY (task_id) REFERENCES inspection_tasks (id)
-        )
-    ''')
+    # Identical concurrent analytics and report requests share one computation
+    single_flight.init_app(app)
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS progress_reports (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            report_date DATE,
-            site TEXT,
-            total_tasks INTEGER,
-            completed_tasks INTEGER,
-            in_progress_tasks INTEGER,
-            overdue_tasks INTEGER,
-            completion_rate REAL,
-            generated_by TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    # Planner statistics, incremental vacuum and integrity checks; size telemetry at /api/maintenance
+    maintenance.init_app(app)
+    
+    thumbnails.workers = app.config['THUMBNAIL_WORKERS']
+    app.register_blueprint(bp)
+    return app
+
+def get_db_connection():
+    """Open a connection whose statements are traced for /api/metrics.
+    
+    Connections are opened per request and never outlive it, so none is
+    ever inherited by a forked worker.
+    """
+    return sqlite3.connect(current_app.config['DATABASE'], factory=TracedConnection)
+
+def init_db(database):
+    """Bring the database up to the current schema; see migrations.py"""
+    conn = sqlite3.connect(database)
+    
+    # Lets maintenance return freed pages to the filesystem; only takes effect on a new
+    # database (existing ones: python maintenance.py --enable-incremental-vacuum)
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    
+    # Readers never block writers (or the analytics snapshot copy) in WAL mode
+    conn.execute('PRAGMA journal_mode=WAL')
+    
+    # Tables, the id-keyed task layout, change tracking, upload tracking, attachments
+    # and the data model tables, as versioned migrations recorded in schema_version
+    applied = migrate(conn)
+    if applied:
+        print(f"Applied schema migrations {applied}")
     
-    conn.commit()
     conn.close()
 
+def status_id_sql(conn, *names):
+    """Inline id list of the given statuses for IN (...) clauses"""
+    return id_list_sql(conn, 'status', names)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # API Routes
 
-@app.route('/')
+@bp.route('/')
 def index():
     return send_from_directory('static', 'index.html')
 
-@app.route('/api/health')
+@bp.route('/api/health')
 def health_check():
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
 # Enhanced Dashboard Routes
-@app.route('/api/dashboard/overview')
+@bp.route('/api/dashboard/overview')
+@coalesce()
 def dashboard_overview():
     """Get comprehensive dashboard overview with process-based metrics"""
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = get_db_connection()
+    
+    closed = status_id_sql(conn, 'Field Complete', 'Reported')
+    claimed = status_id_sql(conn, 'Claimed')
+    uninitiated = status_id_sql(conn, 'UnInitiated')
     
     # Overall statistics
-    summary_query = '''
+    summary_query = f'''
         SELECT 
             COUNT(*) as total_tasks,
-            COUNT(CASE WHEN status = 'Claimed' THEN 1 END) as claimed_tasks,
-            COUNT(CASE WHEN status IN ('Field Complete', 'Reported') THEN 1 END) as completed_tasks,
-            COUNT(CASE WHEN status = 'UnInitiated' THEN 1 END) as pending_tasks,
-            COUNT(CASE WHEN due_date < date('now') AND status NOT IN ('Field Complete', 'Reported') THEN 1 END) as overdue_tasks
+            COUNT(CASE WHEN status_id IN ({claimed}) THEN 1 END) as claimed_tasks,
+            COUNT(CASE WHEN status_id IN ({closed}) THEN 1 END) as completed_tasks,
+            COUNT(CASE WHEN status_id IN ({uninitiated}) THEN 1 END) as pending_tasks,
+            COUNT(CASE WHEN due_date < date('now') AND IFNULL(status_id, -1) NOT IN ({closed}) THEN 1 END) as overdue_tasks
         FROM inspection_tasks
     '''
     
@@ -204,28 +210,35 @@ def dashboard_overview():
         scope_data = {'total_scopes': 0, 'approved_scopes': 0, 'pending_review': 0}
     
     # Process 2: Task Assignment and Execution
-    assignment_query = '''
+    assignment_query = f'''
         SELECT 
-            COUNT(DISTINCT inspector) as active_inspectors,
-            COUNT(CASE WHEN status = 'Claimed' THEN 1 END) as assigned_tasks,
-            AVG(CASE WHEN status IN ('Field Complete', 'Reported') 
+            COUNT(DISTINCT inspector_id) as active_inspectors,
+            COUNT(CASE WHEN status_id IN ({claimed}) THEN 1 END) as assigned_tasks,
+            AVG(CASE WHEN status_id IN ({closed}) 
                 THEN julianday(current_inspection_date) - julianday(due_date) END) as avg_completion_delay
         FROM inspection_tasks
-        WHERE inspector != 'Unassigned'
+        WHERE inspector_id IS NOT NULL
     '''
     
     assignment_data = pd.read_sql_query(assignment_query, conn).iloc[0].to_dict()
     
     # Process 3: Progress Monitoring and Reporting
-    progress_query = '''
+    progress_query = f'''
         SELECT 
-            site,
-            COUNT(*) as total_tasks,
-            COUNT(CASE WHEN status IN ('Field Complete', 'Reported') THEN 1 END) as completed,
-            ROUND(COUNT(CASE WHEN status IN ('Field Complete', 'Reported') THEN 1 END) * 100.0 / COUNT(*), 2) as completion_rate
-        FROM inspection_tasks
-        WHERE site != ''
-        GROUP BY site
+            s.site_code as site,
+            p.total_tasks,
+            p.completed,
+            ROUND(p.completed * 100.0 / p.total_tasks, 2) as completion_rate
+        FROM (
+            SELECT 
+                site_id,
+                COUNT(*) as total_tasks,
+                COUNT(CASE WHEN status_id IN ({closed}) THEN 1 END) as completed
+            FROM inspection_tasks
+            WHERE site_id IS NOT NULL
+            GROUP BY site_id
+        ) p
+        JOIN sites s ON s.id = p.site_id
         ORDER BY completion_rate DESC
     '''
     
@@ -239,7 +252,7 @@ def dashboard_overview():
             inspector,
             status,
             updated_at
-        FROM inspection_tasks
+        FROM inspection_task_details
         WHERE updated_at >= datetime('now', '-24 hours')
         ORDER BY updated_at DESC
         LIMIT 10
@@ -257,10 +270,15 @@ def dashboard_overview():
         'recent_activity': recent_activity
     })
 
-@app.route('/api/analytics/process-performance')
+@bp.route('/api/analytics/process-performance')
+@coalesce()
 def process_performance():
     """Get performance metrics for each of the three main processes"""
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = analytics_snapshot.connect()
+    snapshot = analytics_snapshot.connection_info(conn)
+    
+    closed = status_id_sql(conn, 'Field Complete', 'Reported')
+    claimed = status_id_sql(conn, 'Claimed')
     
     # Process 1: Scope Preparation Efficiency
     scope_efficiency = '''
@@ -280,11 +298,11 @@ def process_performance():
         scope_data = []
     
     # Process 2: Task Assignment Efficiency
-    assignment_efficiency = '''
+    assignment_efficiency = f'''
         SELECT 
             DATE(updated_at) as date,
-            COUNT(CASE WHEN status = 'Claimed' THEN 1 END) as tasks_claimed,
-            COUNT(CASE WHEN status IN ('Field Complete', 'Reported') THEN 1 END) as tasks_completed
+            COUNT(CASE WHEN status_id IN ({claimed}) THEN 1 END) as tasks_claimed,
+            COUNT(CASE WHEN status_id IN ({closed}) THEN 1 END) as tasks_completed
         FROM inspection_tasks
         WHERE updated_at >= date('now', '-30 days')
         GROUP BY DATE(updated_at)
@@ -294,32 +312,50 @@ def process_performance():
     assignment_data = pd.read_sql_query(assignment_efficiency, conn).to_dict('records')
     
     # Process 3: Progress Monitoring Trends
-    progress_trends = '''
+    progress_trends = f'''
         SELECT 
-            site,
-            method,
-            COUNT(*) as total_tasks,
-            COUNT(CASE WHEN status IN ('Field Complete', 'Reported') THEN 1 END) as completed_tasks,
-            COUNT(CASE WHEN due_date < date('now') AND status NOT IN ('Field Complete', 'Reported') THEN 1 END) as overdue_tasks
-        FROM inspection_tasks
-        WHERE site != ''
-        GROUP BY site, method
+            s.site_code as site,
+            COALESCE(m.method_name, '') as method,
+            p.total_tasks,
+            p.completed_tasks,
+            p.overdue_tasks
+        FROM (
+            SELECT 
+                site_id,
+                method_id,
+                COUNT(*) as total_tasks,
+                COUNT(CASE WHEN status_id IN ({closed}) THEN 1 END) as completed_tasks,
+                COUNT(CASE WHEN due_date < date('now') AND IFNULL(status_id, -1) NOT IN ({closed}) THEN 1 END) as overdue_tasks
+            FROM inspection_tasks
+            WHERE site_id IS NOT NULL
+            GROUP BY site_id, method_id
+        ) p
+        JOIN sites s ON s.id = p.site_id
+        LEFT JOIN methods m ON m.id = p.method_id
         ORDER BY site, method
     '''
     
     progress_data = pd.read_sql_query(progress_trends, conn).to_dict('records')
     
     # Inspector performance
-    inspector_performance = '''
+    inspector_performance = f'''
         SELECT 
-            inspector,
-            COUNT(*) as total_assigned,
-            COUNT(CASE WHEN status IN ('Field Complete', 'Reported') THEN 1 END) as completed,
-            COUNT(CASE WHEN status = 'Claimed' THEN 1 END) as in_progress,
-            ROUND(COUNT(CASE WHEN status IN ('Field Complete', 'Reported') THEN 1 END) * 100.0 / COUNT(*), 2) as completion_rate
-        FROM inspection_tasks
-        WHERE inspector != 'Unassigned' AND inspector != ''
-        GROUP BY inspector
+            i.name as inspector,
+            p.total_assigned,
+            p.completed,
+            p.in_progress,
+            ROUND(p.completed * 100.0 / p.total_assigned, 2) as completion_rate
+        FROM (
+            SELECT 
+                inspector_id,
+                COUNT(*) as total_assigned,
+                COUNT(CASE WHEN status_id IN ({closed}) THEN 1 END) as completed,
+                COUNT(CASE WHEN status_id IN ({claimed}) THEN 1 END) as in_progress
+            FROM inspection_tasks
+            WHERE inspector_id IS NOT NULL
+            GROUP BY inspector_id
+        ) p
+        JOIN inspectors i ON i.id = p.inspector_id
         ORDER BY completion_rate DESC
     '''
     
@@ -331,27 +367,44 @@ def process_performance():
         'scope_preparation': scope_data,
         'task_assignment': assignment_data,
         'progress_monitoring': progress_data,
-        'inspector_performance': inspector_data
+        'inspector_performance': inspector_data,
+        'snapshot': snapshot
     })
 
-@app.route('/api/analytics/predictive-insights')
+@bp.route('/api/analytics/predictive-insights')
+@coalesce()
 def predictive_insights():
     """Generate predictive insights for inspection planning"""
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = analytics_snapshot.connect()
+    snapshot = analytics_snapshot.connection_info(conn)
+    
+    closed = status_id_sql(conn, 'Field Complete', 'Reported')
+    claimed = status_id_sql(conn, 'Claimed')
+    uninitiated = status_id_sql(conn, 'UnInitiated')
     
     # Predict completion dates based on current progress
-    prediction_query = '''
+    prediction_query = f'''
         SELECT 
-            site,
-            COUNT(*) as total_tasks,
-            COUNT(CASE WHEN status IN ('Field Complete', 'Reported') THEN 1 END) as completed_tasks,
-            COUNT(CASE WHEN status = 'Claimed' THEN 1 END) as in_progress_tasks,
-            COUNT(CASE WHEN status = 'UnInitiated' THEN 1 END) as pending_tasks,
-            AVG(CASE WHEN status IN ('Field Complete', 'Reported') 
-                THEN julianday(current_inspection_date) - julianday(due_date) END) as avg_completion_time
-        FROM inspection_tasks
-        WHERE site != ''
-        GROUP BY site
+            s.site_code as site,
+            p.total_tasks,
+            p.completed_tasks,
+            p.in_progress_tasks,
+            p.pending_tasks,
+            p.avg_completion_time
+        FROM (
+            SELECT 
+                site_id,
+                COUNT(*) as total_tasks,
+                COUNT(CASE WHEN status_id IN ({closed}) THEN 1 END) as completed_tasks,
+                COUNT(CASE WHEN status_id IN ({claimed}) THEN 1 END) as in_progress_tasks,
+                COUNT(CASE WHEN status_id IN ({uninitiated}) THEN 1 END) as pending_tasks,
+                AVG(CASE WHEN status_id IN ({closed}) 
+                    THEN julianday(current_inspection_date) - julianday(due_date) END) as avg_completion_time
+            FROM inspection_tasks
+            WHERE site_id IS NOT NULL
+            GROUP BY site_id
+        ) p
+        JOIN sites s ON s.id = p.site_id
     '''
     
     prediction_data = pd.read_sql_query(prediction_query, conn)
@@ -378,14 +431,21 @@ def predictive_insights():
         })
     
     # Resource allocation recommendations
-    resource_query = '''
+    resource_query = f'''
         SELECT 
-            inspector,
-            COUNT(*) as current_workload,
-            COUNT(CASE WHEN due_date < date('now', '+7 days') THEN 1 END) as urgent_tasks
-        FROM inspection_tasks
-        WHERE inspector != 'Unassigned' AND inspector != '' AND status = 'Claimed'
-        GROUP BY inspector
+            i.name as inspector,
+            p.current_workload,
+            p.urgent_tasks
+        FROM (
+            SELECT 
+                inspector_id,
+                COUNT(*) as current_workload,
+                COUNT(CASE WHEN due_date < date('now', '+7 days') THEN 1 END) as urgent_tasks
+            FROM inspection_tasks
+            WHERE inspector_id IS NOT NULL AND +status_id IN ({claimed})
+            GROUP BY inspector_id
+        ) p
+        JOIN inspectors i ON i.id = p.inspector_id
         ORDER BY current_workload DESC
     '''
     
@@ -395,11 +455,12 @@ def predictive_insights():
     
     return jsonify({
         'site_predictions': predictions,
-        'resource_allocation': resource_data
+        'resource_allocation': resource_data,
+        'snapshot': snapshot
     })
 
 # Enhanced File Upload with Process Integration
-@app.route('/api/scope/upload', methods=['POST'])
+@bp.route('/api/scope/upload', methods=['POST'])
 def upload_scope_enhanced():
     """Enhanced scope upload with process tracking"""
     if 'file' not in request.files:
@@ -412,68 +473,72 @@ def upload_scope_enhanced():
         return jsonify({'error': 'No file selected'}), 400
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        max_bytes = current_app.config['SCOPE_MAX_BYTES']
+        if request.content_length is not None and request.content_length > max_bytes + MULTIPART_OVERHEAD_BYTES:
+            return jsonify({'error': f'File exceeds the {max_bytes} byte limit'}), 413
+        
+        try:
+            filepath, filename, content_hash, file_size = save_scope_file(
+                file, current_app.config['UPLOAD_FOLDER'], max_bytes)
+        except FileTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        
+        # The same workbook was already ingested: hand back that upload without reparsing
+        conn = get_db_connection()
+        duplicate = find_duplicate(conn, content_hash)
+        if duplicate:
+            conn.close()
+            os.remove(filepath)
+            return jsonify(duplicate_upload_response(duplicate))
         
         try:
             # Process the Excel file
-            df = pd.read_excel(filepath, sheet_name='All Units Ext Scope Data')
+            df = pd.read_excel(filepath, sheet_name=SCOPE_SHEET)
             
-            # Record the upload
-            conn = sqlite3.connect('inspection_tracker.db')
+            # Record the upload; recheck under the write lock in case the same file raced us
             cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            duplicate = find_duplicate(conn, content_hash)
+            if duplicate:
+                conn.rollback()
+                conn.close()
+                os.remove(filepath)
+                return jsonify(duplicate_upload_response(duplicate))
             
             cursor.execute('''
-                INSERT INTO scope_uploads (filename, uploaded_by, records_count, status)
-                VALUES (?, ?, ?, 'pending_review')
-            ''', (filename, uploaded_by, len(df)))
+                INSERT INTO scope_uploads (filename, uploaded_by, records_count, status, content_hash, file_size)
+                VALUES (?, ?, ?, 'pending_review', ?, ?)
+            ''', (filename, uploaded_by, len(df), content_hash, file_size))
             
             upload_id = cursor.lastrowid
             
-            # Insert data into database (same as before but with upload tracking)
-            records_processed = 0
-            for _, row in df.iterrows():
-                try:
-                    cursor.execute('''
-                        INSERT INTO inspection_tasks 
-                        (site, site_project, hierarchy_item_name, description, mechanism, 
-                         method, extent, frequency, interval_type, inspection_priority,
-                         last_inspection_date, install_date, due_date, current_inspection_date,
-                         inspector, status, comments)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        str(row.get('Site', '')),
-                        str(row.get('Site & Project', '')),
-                        str(row.get('Hierarchy Item Name', '')),
-                        str(row.get('Description', '')),
-                        str(row.get('Mechanism', '')),
-                        str(row.get('Method', '')),
-                        str(row.get('Extent', '')),
-                        row.get('Frequency'),
-                        str(row.get('Interval', '')),
-                        row.get('Insp Priority'),
-                        row.get('Last Inspection Date'),
-                        row.get('Install Date'),
-                        row.get('Due Date'),
-                        row.get('Current Insp Date'),
-                        str(row.get('Inspector', 'Unassigned')),
-                        str(row.get('Status', 'UnInitiated')),
-                        str(row.get('Comments', ''))
-                    ))
-                    records_processed += 1
-                except Exception as e:
-                    print(f"Error inserting row: {e}")
-                    continue
+            # Unknown lookup names or malformed values refuse the whole sheet, with a report of the rows
+            valid, validation_report = validate_scope(conn, df)
+            if not valid.all():
+                cursor.execute('''
+                    UPDATE scope_uploads 
+                    SET status = 'invalid', records_count = 0, validation_report = ?
+                    WHERE id = ?
+                ''', (json.dumps(validation_report), upload_id))
+                conn.commit()
+                conn.close()
+                return jsonify({
+                    'error': 'Scope has invalid rows; nothing was inserted',
+                    'filename': filename,
+                    'upload_id': upload_id,
+                    'status': 'invalid',
+                    'validation': validation_report
+                }), 400
+            
+            # Encode lookup names to ids and bulk insert, tagged with this upload
+            records_processed = insert_tasks(conn, df, upload_id)
             
             # Update upload status
             cursor.execute('''
                 UPDATE scope_uploads 
-                SET status = 'processed', records_count = ?
+                SET status = 'processed', records_count = ?, validation_report = ?
                 WHERE id = ?
-            ''', (records_processed, upload_id))
+            ''', (records_processed, json.dumps(validation_report), upload_id))
             
             conn.commit()
             conn.close()
@@ -483,15 +548,41 @@ def upload_scope_enhanced():
                 'filename': filename,
                 'upload_id': upload_id,
                 'records_processed': records_processed,
-                'status': 'processed'
+                'status': 'processed',
+                'content_hash': content_hash,
+                'duplicate': False,
+                'validation': validation_report
             })
             
         except Exception as e:
+            conn.close()
             return jsonify({'error': f'Error processing file: {str(e)}'}), 500
     
     return jsonify({'error': 'Invalid file type'}), 400
 
-@app.route('/api/scope/review/<int:upload_id>', methods=['PUT'])
+def duplicate_upload_response(duplicate):
+    return {
+        'message': 'File was already uploaded; returning the earlier upload',
+        'filename': duplicate['filename'],
+        'upload_id': duplicate['upload_id'],
+        'records_processed': duplicate['records_count'],
+        'status': duplicate['status'],
+        'duplicate': True
+    }
+
+@bp.route('/api/scope/<int:upload_id>/validation', methods=['GET'])
+def scope_validation_report(upload_id):
+    """Rows that failed validation in an upload and why"""
+    conn = get_db_connection()
+    row = conn.execute('SELECT validation_report FROM scope_uploads WHERE id = ?', (upload_id,)).fetchone()
+    conn.close()
+    
+    if row is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    return jsonify({'upload_id': upload_id, 'validation': json.loads(row[0]) if row[0] else None})
+
+@bp.route('/api/scope/review/<int:upload_id>', methods=['PUT'])
 def review_scope(upload_id):
     """Review and approve/reject uploaded scope"""
     data = request.get_json()
@@ -502,19 +593,26 @@ def review_scope(upload_id):
     if status not in ['approved', 'rejected']:
         return jsonify({'error': 'Invalid status'}), 400
     
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
+    current = cursor.execute('SELECT status FROM scope_uploads WHERE id = ?', (upload_id,)).fetchone()
+    if current is None:
+        conn.close()
+        return jsonify({'error': 'Upload not found'}), 404
+    if current[0] == 'rejected' and status == 'approved':
+        conn.close()
+        return jsonify({'error': 'Rejected scope has been removed; upload the file again'}), 409
+    if current[0] == 'invalid' and status == 'approved':
+        conn.close()
+        return jsonify({'error': 'Scope failed validation; upload a corrected file'}), 409
+    
     cursor.execute('''
         UPDATE scope_uploads 
         SET status = ?, review_notes = ?
         WHERE id = ?
     ''', (status, notes, upload_id))
     
-    if cursor.rowcount == 0:
-        conn.close()
-        return jsonify({'error': 'Upload not found'}), 404
-    
     # Create notification
     cursor.execute('''
         INSERT INTO notifications (message, notification_type)
@@ -522,12 +620,15 @@ def review_scope(upload_id):
     ''', (f'Scope upload {upload_id} {status} by {reviewer}', 'scope_review'))
     
     conn.commit()
+    
+    # Rejected scope leaves the tracker in short batches; rejecting again finishes an interrupted removal
+    tasks_removed = remove_upload_tasks(conn, upload_id) if status == 'rejected' else 0
     conn.close()
     
-    return jsonify({'message': f'Scope {status} successfully'})
+    return jsonify({'message': f'Scope {status} successfully', 'tasks_removed': tasks_removed})
 
 # Enhanced Task Management
-@app.route('/api/tasks/assign', methods=['POST'])
+@bp.route('/api/tasks/assign', methods=['POST'])
 def assign_task():
     """Assign task to inspector with tracking"""
     data = request.get_json()
@@ -536,15 +637,22 @@ def assign_task():
     assigned_by = data.get('assigned_by', 'System')
     notes = data.get('notes', '')
     
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
+    # Only existing inspectors can be assigned; request names never add lookup rows
+    try:
+        inspector_id = find_id(conn, 'inspector', assigned_to)
+    except UnknownName as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 400
+    
     # Update task
     cursor.execute('''
         UPDATE inspection_tasks 
-        SET inspector = ?, status = 'Claimed', updated_at = CURRENT_TIMESTAMP
+        SET inspector_id = ?, status_id = ?, updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
-    ''', (assigned_to, task_id))
+    ''', (inspector_id, lookup_id(conn, 'status', 'Claimed'), task_id))
     
     if cursor.rowcount == 0:
         conn.close()
@@ -567,63 +675,166 @@ def assign_task():
     
     return jsonify({'message': 'Task assigned successfully'})
 
+def bounded_number(data, key, minimum, integer=False, default=None):
+    """data[key] as a finite number no smaller than minimum, or raise ValueError"""
+    value = data.get(key)
+    if value is None:
+        return default
+    kind = 'an integer' if integer else 'a number'
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be {kind}')
+    if not math.isfinite(number) or (integer and not number.is_integer()):
+        raise ValueError(f'{key} must be {kind}')
+    if number < minimum:
+        raise ValueError(f'{key} must be at least {minimum}')
+    return int(number) if integer else number
+
+@bp.route('/api/tasks/auto-assign', methods=['POST'])
+def auto_assign_tasks():
+    """Balance unassigned tasks across active inspectors (dry run by default)"""
+    data = request.get_json(silent=True) or {}
+    dry_run = data.get('dry_run', True)
+    assigned_by = data.get('assigned_by', 'System')
+    try:
+        max_tasks = bounded_number(data, 'max_tasks_per_inspector', 1, integer=True)
+        limit = bounded_number(data, 'limit', 1, integer=True)
+        site_penalty = bounded_number(data, 'site_penalty', 0, default=DEFAULT_SITE_PENALTY)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    plan = plan_assignments(
+        conn,
+        site=data.get('site'),
+        max_tasks_per_inspector=max_tasks,
+        site_penalty=site_penalty,
+        limit=limit
+    )
+    
+    if dry_run:
+        conn.close()
+        return jsonify({
+            'dry_run': True,
+            'planned_assignments': len(plan['assignments']),
+            **plan
+        })
+    
+    applied = apply_assignments(conn, plan['assignments'], assigned_by,
+                                data.get('notes', 'Auto-assigned'))
+    conn.close()
+    
+    return jsonify({
+        'dry_run': False,
+        'message': 'Tasks auto-assigned successfully',
+        'planned_assignments': len(plan['assignments']),
+        'tasks_assigned': applied,
+        'unassignable_task_ids': plan['unassignable_task_ids'],
+        'workload': plan['workload']
+    })
+
 # Progress Reporting
-@app.route('/api/reports/generate', methods=['POST'])
+@bp.route('/api/reports/generate', methods=['POST'])
 def generate_progress_report():
     """Generate comprehensive progress report"""
     data = request.get_json()
     report_date = data.get('report_date', datetime.now().strftime('%Y-%m-%d'))
     generated_by = data.get('generated_by', 'System')
+    upload_id = data.get('upload_id')
+    include_archived = task_archive.include_archived_requested(data.get('include_archived', False))
     
-    conn = sqlite3.connect('inspection_tracker.db')
+    # Site rollups read the analytics snapshot; a single upload's report is a cheap indexed
+    # read of the live tables, so a scope that was just uploaded is always in it
+    upload_filter = ''
+    params = []
+    if upload_id is not None:
+        conn = get_db_connection()
+        upload_filter = ' AND upload_id = ?'
+        params.append(int(upload_id))
+        snapshot = None
+    else:
+        conn = analytics_snapshot.connect()
+        snapshot = analytics_snapshot.connection_info(conn)
+    
+    # Archived tasks are closed, so they only add to the totals and completions
+    tasks_table = 'inspection_tasks'
+    if include_archived:
+        task_archive.attach_archive(conn)
+        tasks_table = task_archive.ALL_TASKS
+    
+    closed = status_id_sql(conn, 'Field Complete', 'Reported')
+    claimed = status_id_sql(conn, 'Claimed')
     
     # Generate report data for each site
-    report_query = '''
+    report_query = f'''
         SELECT 
-            site,
-            COUNT(*) as total_tasks,
-            COUNT(CASE WHEN status IN ('Field Complete', 'Reported') THEN 1 END) as completed_tasks,
-            COUNT(CASE WHEN status = 'Claimed' THEN 1 END) as in_progress_tasks,
-            COUNT(CASE WHEN due_date < date('now') AND status NOT IN ('Field Complete', 'Reported') THEN 1 END) as overdue_tasks,
-            ROUND(COUNT(CASE WHEN status IN ('Field Complete', 'Reported') THEN 1 END) * 100.0 / COUNT(*), 2) as completion_rate
-        FROM inspection_tasks
-        WHERE site != ''
-        GROUP BY site
+            s.site_code as site,
+            r.total_tasks,
+            r.completed_tasks,
+            r.in_progress_tasks,
+            r.overdue_tasks,
+            ROUND(r.completed_tasks * 100.0 / r.total_tasks, 2) as completion_rate
+        FROM (
+            SELECT 
+                site_id,
+                COUNT(*) as total_tasks,
+                COUNT(CASE WHEN status_id IN ({closed}) THEN 1 END) as completed_tasks,
+                COUNT(CASE WHEN status_id IN ({claimed}) THEN 1 END) as in_progress_tasks,
+                COUNT(CASE WHEN due_date < date('now') AND IFNULL(status_id, -1) NOT IN ({closed}) THEN 1 END) as overdue_tasks
+            FROM {tasks_table}
+            WHERE site_id IS NOT NULL{upload_filter}
+            GROUP BY site_id
+        ) r
+        JOIN sites s ON s.id = r.site_id
     '''
     
-    report_data = pd.read_sql_query(report_query, conn)
-    
-    # Save report to database
-    cursor = conn.cursor()
-    for _, row in report_data.iterrows():
-        cursor.execute('''
-            INSERT INTO progress_reports 
-            (report_date, site, total_tasks, completed_tasks, in_progress_tasks, 
-             overdue_tasks, completion_rate, generated_by)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            report_date, row['site'], row['total_tasks'], row['completed_tasks'],
-            row['in_progress_tasks'], row['overdue_tasks'], row['completion_rate'],
-            generated_by
-        ))
+    # Concurrent requests for the same report share one run of the aggregate
+    try:
+        report_data, _ = flights.do((report_query, tuple(params)),
+                                    lambda: pd.read_sql_query(report_query, conn, params=params), 'report')
+    except CoalesceTimeout as e:
+        return busy_response(e)
+    finally:
+        conn.close()
     
-    conn.commit()
-    conn.close()
+    # Save report to database; progress_reports is tracker-wide history, so per-upload reports are not kept
+    if upload_id is None:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        for _, row in report_data.iterrows():
+            cursor.execute('''
+                INSERT INTO progress_reports 
+                (report_date, site, total_tasks, completed_tasks, in_progress_tasks, 
+                 overdue_tasks, completion_rate, generated_by)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                report_date, row['site'], row['total_tasks'], row['completed_tasks'],
+                row['in_progress_tasks'], row['overdue_tasks'], row['completion_rate'],
+                generated_by
+            ))
+        conn.commit()
+        conn.close()
     
     return jsonify({
         'message': 'Progress report generated successfully',
         'report_date': report_date,
+        'upload_id': upload_id,
+        'include_archived': include_archived,
         'sites_included': len(report_data),
-        'report_data': report_data.to_dict('records')
+        'report_data': report_data.to_dict('records'),
+        'snapshot': snapshot
     })
 
 # All other routes from the original app.py remain the same...
 # (Including tasks, dashboard/summary, dashboard/charts, lookups, notifications, etc.)
 
 # Copy all the remaining routes from the original app.py
-@app.route('/api/tasks', methods=['GET'])
+@bp.route('/api/tasks', methods=['GET'])
 def get_tasks():
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = get_db_connection()
     
     # Get query parameters for filtering
     site = request.args.get('site')
@@ -633,55 +844,65 @@ def get_tasks():
     priority = request.args.get('priority')
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 50))
+    include_archived = task_archive.include_archived_requested(request.args.get('include_archived'))
     
-    # Build query with filters
-    query = 'SELECT * FROM inspection_tasks WHERE 1=1'
+    try:
+        fields = parse_fields(request.args.get('fields'), TASK_FIELDS)
+    except ValueError as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 400
+    
+    # Only the hot table unless archived tasks are asked for
+    if include_archived:
+        task_archive.attach_archive(conn)
+    
+    # Build filters on the encoded columns so they can use the indexes
+    where = ' WHERE 1=1'
     params = []
     
     if site:
-        query += ' AND site = ?'
+        where += ' AND site_id = (SELECT id FROM sites WHERE site_code = ?)'
         params.append(site)
-    if inspector:
-        query += ' AND inspector = ?'
+    if inspector == 'Unassigned':
+        where += ' AND inspector_id IS NULL'
+    elif inspector:
+        where += ' AND inspector_id = (SELECT id FROM inspectors WHERE name = ?)'
         params.append(inspector)
     if status:
-        query += ' AND status = ?'
+        where += ' AND status_id = (SELECT id FROM status_types WHERE status_name = ?)'
         params.append(status)
     if method:
-        query += ' AND method = ?'
+        where += ' AND method_id = (SELECT id FROM methods WHERE method_name = ?)'
         params.append(method)
     if priority:
-        query += ' AND inspection_priority = ?'
+        where += ' AND inspection_priority = ?'
         params.append(priority)
     
     # Add pagination
     offset = (page - 1) * per_page
-    query += ' ORDER BY due_date ASC LIMIT ? OFFSET ?'
-    params.extend([per_page, offset])
-    
-    df = pd.read_sql_query(query, conn, params=params)
+    if include_archived:
+        window = offset + per_page
+        query = task_archive.tasks_page_sql(fields, where)
+        rows = conn.execute(query, params + [window] + params + [window, per_page, offset]).fetchall()
+    else:
+        query = f'SELECT {", ".join(fields)} FROM inspection_task_details{where} ORDER BY due_date ASC LIMIT ? OFFSET ?'
+        rows = conn.execute(query, params + [per_page, offset]).fetchall()
+    tasks = [dict(zip(fields, row)) for row in rows]
     
     # Get total count for pagination
-    count_query = 'SELECT COUNT(*) as total FROM inspection_tasks WHERE 1=1'
-    count_params = params[:-2]  # Remove LIMIT and OFFSET params
-    
-    if site:
-        count_query += ' AND site = ?'
-    if inspector:
-        count_query += ' AND inspector = ?'
-    if status:
-        count_query += ' AND status = ?'
-    if method:
-        count_query += ' AND method = ?'
-    if priority:
-        count_query += ' AND inspection_priority = ?'
-    
-    total_count = pd.read_sql_query(count_query, conn, params=count_params).iloc[0]['total']
+    if include_archived:
+        # Counted apart, so the hot count can still use an index
+        count_query = (f'SELECT (SELECT COUNT(*) FROM inspection_tasks{where}) + '
+                       f'(SELECT COUNT(*) FROM {task_archive.ARCHIVED_TASKS}{where})')
+        total_count = conn.execute(count_query, params + params).fetchone()[0]
+    else:
+        count_query = f'SELECT COUNT(*) as total FROM inspection_tasks{where}'
+        total_count = conn.execute(count_query, params).fetchone()[0]
     
     conn.close()
     
     return jsonify({
-        'tasks': df.to_dict('records'),
+        'tasks': tasks,
         'pagination': {
             'page': page,
             'per_page': per_page,
@@ -690,18 +911,46 @@ def get_tasks():
         }
     })
 
-@app.route('/api/tasks/<int:task_id>', methods=['GET'])
+# Counts per filter value for the task list filters
+@bp.route('/api/tasks/facets', methods=['GET'])
+def get_task_facets():
+    """Task counts per site, inspector, status, method and priority under the task list filters.
+    
+    Each facet is counted with every filter but its own, so the UI can show
+    what picking another value would return.
+    """
+    filters = {facet: request.args.get(facet) for facet in FACET_COLUMNS}
+    
+    conn = get_db_connection()
+    facets, total, seq, cached = facet_cache.get(conn, filters)
+    conn.close()
+    
+    return jsonify({
+        'filters': {facet: value for facet, value in filters.items() if value},
+        'total': total,
+        'facets': facets,
+        'change_seq': seq,
+        'cached': cached
+    })
+
+@bp.route('/api/tasks/<int:task_id>', methods=['GET'])
 def get_task(task_id):
-    conn = sqlite3.connect('inspection_tracker.db')
-    df = pd.read_sql_query('SELECT * FROM inspection_tasks WHERE id = ?', conn, params=[task_id])
+    try:
+        fields = parse_fields(request.args.get('fields'), TASK_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    row = conn.execute(f'SELECT {", ".join(fields)} FROM inspection_task_details WHERE id = ?',
+                       (task_id,)).fetchone()
     conn.close()
     
-    if df.empty:
+    if row is None:
         return jsonify({'error': 'Task not found'}), 404
     
-    return jsonify(df.iloc[0].to_dict())
+    return jsonify(dict(zip(fields, row)))
 
-@app.route('/api/tasks/<int:task_id>/claim', methods=['POST'])
+@bp.route('/api/tasks/<int:task_id>/claim', methods=['POST'])
 def claim_task(task_id):
     data = request.get_json()
     inspector = data.get('inspector')
@@ -709,15 +958,21 @@ def claim_task(task_id):
     if not inspector:
         return jsonify({'error': 'Inspector name required'}), 400
     
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
+    try:
+        inspector_id = find_id(conn, 'inspector', inspector)
+    except UnknownName as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 400
+    
     # Update task
     cursor.execute('''
         UPDATE inspection_tasks 
-        SET inspector = ?, status = 'Claimed', updated_at = CURRENT_TIMESTAMP
+        SET inspector_id = ?, status_id = ?, updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
-    ''', (inspector, task_id))
+    ''', (inspector_id, lookup_id(conn, 'status', 'Claimed'), task_id))
     
     if cursor.rowcount == 0:
         conn.close()
@@ -734,29 +989,41 @@ def claim_task(task_id):
     
     return jsonify({'message': 'Task claimed successfully'})
 
-@app.route('/api/tasks/<int:task_id>/update', methods=['PUT'])
-def update_task(task_id):
-    data = request.get_json()
+# Task fields clients may edit; status, method and inspector are stored as lookup ids
+TASK_UPDATE_FIELDS = [
+    'status', 'method', 'inspection_priority', 'current_inspection_date',
+    'mechanism', 'comments', 'inspector', 'last_inspection_date',
+    'frequency', 'interval_type'
+]
+ENCODED_UPDATE_FIELDS = ['status', 'method', 'inspector']
+SCHEDULE_FIELDS = ['last_inspection_date', 'frequency', 'interval_type']
+
+def apply_task_update(conn, task_id, data):
+    """Apply an edit to one task, rescheduling and notifying as needed.
     
-    conn = sqlite3.connect('inspection_tracker.db')
+    Returns False when the task does not exist and raises UnknownName, before
+    changing anything, for a status, method or inspector not in its lookup.
+    The caller commits.
+    """
     cursor = conn.cursor()
     
     # Build update query dynamically
     update_fields = []
     params = []
     
-    allowed_fields = [
-        'status', 'method', 'inspection_priority', 'current_inspection_date',
-        'mechanism', 'comments', 'inspector'
-    ]
-    
-    for field in allowed_fields:
+    for field in TASK_UPDATE_FIELDS:
         if field in data:
-            update_fields.append(f'{field} = ?')
-            params.append(data[field])
-    
-    if not update_fields:
-        return jsonify({'error': 'No valid fields to update'}), 400
+            if field in ENCODED_UPDATE_FIELDS:
+                update_fields.append(f'{field}_id = ?')
+                params.append(find_id(conn, field, data[field]))
+            else:
+                update_fields.append(f'{field} = ?')
+                params.append(data[field])
+    
+    cursor.execute('SELECT status FROM inspection_task_details WHERE id = ?', (task_id,))
+    previous = cursor.fetchone()
+    if previous is None:
+        return False
     
     update_fields.append('updated_at = CURRENT_TIMESTAMP')
     params.append(task_id)
@@ -764,9 +1031,11 @@ def update_task(task_id):
     query = f'UPDATE inspection_tasks SET {", ".join(update_fields)} WHERE id = ?'
     cursor.execute(query, params)
     
-    if cursor.rowcount == 0:
-        conn.close()
-        return jsonify({'error': 'Task not found'}), 404
+    # Reschedule the task when it is completed or its schedule changes
+    if data.get('status') in COMPLETION_STATUSES and previous[0] not in COMPLETION_STATUSES:
+        record_completion(conn, [task_id])
+    elif any(field in data for field in SCHEDULE_FIELDS):
+        recompute_due_dates(conn, [task_id])
     
     # Create notification for status changes
     if 'status' in data:
@@ -775,41 +1044,441 @@ def update_task(task_id):
             VALUES (?, ?, ?)
         ''', (task_id, f'Task status changed to {data["status"]}', 'status_change'))
     
+    return True
+
+@bp.route('/api/tasks/<int:task_id>/update', methods=['PUT'])
+def update_task(task_id):
+    data = request.get_json()
+    
+    if not any(field in data for field in TASK_UPDATE_FIELDS):
+        return jsonify({'error': 'No valid fields to update'}), 400
+    
+    conn = get_db_connection()
+    
+    try:
+        updated = apply_task_update(conn, task_id, data)
+    except UnknownName as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 400
+    if not updated:
+        conn.close()
+        return jsonify({'error': 'Task not found'}), 404
+    
     conn.commit()
     conn.close()
     
     return jsonify({'message': 'Task updated successfully'})
 
+@bp.route('/api/tasks/due-dates/recompute', methods=['POST'])
+def recompute_task_due_dates():
+    """Recompute due dates from frequency and interval for all or selected tasks"""
+    data = request.get_json(silent=True) or {}
+    task_ids = data.get('task_ids')
+    
+    conn = get_db_connection()
+    started = datetime.now()
+    updated = recompute_due_dates(conn, task_ids, commit_batches=True)
+    conn.commit()
+    conn.close()
+    
+    return jsonify({
+        'message': 'Due dates recomputed successfully',
+        'tasks_updated': updated,
+        'duration_seconds': round((datetime.now() - started).total_seconds(), 3)
+    })
+
+# Delta Sync for offline clients
+@bp.route('/api/sync', methods=['GET'])
+def sync_tasks():
+    """Tasks changed or deleted since a change sequence, for the inspector's sites.
+    
+    A since below the sync horizon gets a full resync from sequence 0
+    (full_resync: true): the client drops its copy and pages on with full=1.
+    """
+    since = int(request.args.get('since', 0))
+    limit = int(request.args.get('limit', DEFAULT_SYNC_BATCH_SIZE))
+    inspector = request.args.get('inspector')
+    sites = [site for site in request.args.get('sites', '').split(',') if site]
+    
+    conn = get_db_connection()
+    full_resync = request.args.get('full') != '1' and needs_full_resync(conn, since)
+    if full_resync:
+        since = 0
+    site_ids = sync_site_ids(conn, sites, inspector)
+    tasks, deleted, next_since, has_more = changes_since(conn, since, site_ids, limit)
+    seq = current_seq(conn)
+    conn.close()
+    
+    return jsonify({
+        'tasks': tasks,
+        'deleted': deleted,
+        'full_resync': full_resync,
+        'since': since,
+        'next_since': next_since,
+        'has_more': has_more,
+        'current_seq': seq
+    })
+
+@bp.route('/api/sync/push', methods=['POST'])
+def push_task_changes():
+    """Apply a batch of offline edits, reporting those whose task changed meanwhile or that name unknown lookups"""
+    data = request.get_json(silent=True) or {}
+    changes = data.get('changes') or []
+    
+    try:
+        validate_changes(changes)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    # Hold the write lock so nothing lands between the conflict check and the updates
+    conn.execute('BEGIN IMMEDIATE')
+    accepted, conflicts = check_conflicts(conn, changes)
+    
+    applied_ids = []
+    rejected = []
+    for change in accepted:
+        try:
+            if apply_task_update(conn, int(change['id']), change.get('fields') or {}):
+                applied_ids.append(int(change['id']))
+        except UnknownName as e:
+            rejected.append({'id': int(change['id']), 'error': str(e)})
+    
+    seqs = task_seqs(conn, applied_ids)
+    conn.commit()
+    seq = current_seq(conn)
+    conn.close()
+    
+    return jsonify({
+        'applied': [{'id': task_id, 'change_seq': seqs.get(task_id)} for task_id in applied_ids],
+        'conflicts': conflicts,
+        'rejected': rejected,
+        'current_seq': seq
+    })
+
+# Attachments: resumable chunked uploads into a content-addressed store
+def attachment_store():
+    return BlobStore(current_app.config['ATTACHMENT_FOLDER'])
+
+def upload_error_response(error):
+    return jsonify(dict(error.details, error=str(error))), error.status
+
+def optional_int(value):
+    return int(value) if value not in (None, '') else None
+
+@bp.route('/api/attachments/uploads', methods=['POST'])
+def start_attachment_upload():
+    """Open a resumable upload, dropping sessions abandoned for ATTACHMENT_UPLOAD_EXPIRE_HOURS"""
+    data = request.get_json(silent=True) or {}
+    store = attachment_store()
+    
+    conn = get_db_connection()
+    try:
+        expire_uploads(conn, store, current_app.config['ATTACHMENT_UPLOAD_EXPIRE_HOURS'])
+        conn.commit()
+        result = start_upload(
+            conn, store,
+            filename=secure_filename(data.get('filename', '')) or 'attachment',
+            size=data.get('size'),
+            content_type=data.get('content_type'),
+            kind=data.get('kind', 'photo'),
+            record_id=optional_int(data.get('record_id')),
+            task_id=optional_int(data.get('task_id')),
+            uploaded_by=data.get('uploaded_by', 'Unknown'),
+            expected_sha256=data.get('sha256'),
+            max_bytes=current_app.config['ATTACHMENT_MAX_BYTES']
+        )
+    except UploadError as e:
+        conn.close()
+        return upload_error_response(e)
+    conn.commit()
+    conn.close()
+    
+    return jsonify(result), 201
+
+@bp.route('/api/attachments/uploads/<upload_id>', methods=['GET'])
+def attachment_upload_status(upload_id):
+    """Bytes received so far, for resuming an interrupted upload"""
+    conn = get_db_connection()
+    upload = get_upload(conn, upload_id)
+    conn.close()
+    
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(upload)
+
+@bp.route('/api/attachments/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+def append_attachment_chunk(upload_id):
+    """Append the request body at ?offset= (or the Content-Range start)"""
+    offset = request.args.get('offset')
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    if offset is None and content_range is not None:
+        offset = content_range.start
+    if offset is None:
+        return jsonify({'error': 'offset or Content-Range is required'}), 400
+    
+    conn = get_db_connection()
+    try:
+        upload = append_chunk(conn, attachment_store(), upload_id, int(offset), request.stream)
+    except UploadError as e:
+        conn.commit()
+        conn.close()
+        return upload_error_response(e)
+    conn.commit()
+    conn.close()
+    
+    return jsonify(upload)
+
+@bp.route('/api/attachments/uploads/<upload_id>/complete', methods=['POST'])
+def complete_attachment_upload(upload_id):
+    """Verify, hash and store the assembled file, then queue its thumbnail"""
+    store = attachment_store()
+    conn = get_db_connection()
+    try:
+        attachment, deduplicated = complete_upload(conn, store, upload_id)
+    except UploadError as e:
+        conn.close()
+        return upload_error_response(e)
+    conn.commit()
+    conn.close()
+    
+    if attachment['thumbnail_status'] == 'pending':
+        thumbnails.submit(current_app.config['DATABASE'], store, attachment['sha256'])
+    
+    return jsonify({'attachment': attachment, 'deduplicated': deduplicated}), 201
+
+@bp.route('/api/attachments', methods=['GET'])
+def get_attachments():
+    conn = get_db_connection()
+    attachments = list_attachments(conn, optional_int(request.args.get('record_id')),
+                                   optional_int(request.args.get('task_id')))
+    conn.close()
+    return jsonify({'attachments': attachments})
+
+@bp.route('/api/attachments/<int:attachment_id>', methods=['GET'])
+def download_attachment(attachment_id):
+    """Stream an attachment from disk with Range, ETag and conditional request support"""
+    conn = get_db_connection()
+    attachment = get_attachment(conn, attachment_id)
+    conn.close()
+    
+    if attachment is None:
+        return jsonify({'error': 'Attachment not found'}), 404
+    
+    # Content never changes for a digest, so the digest is a strong ETag
+    return send_file(
+        attachment_store().path(attachment['sha256']),
+        mimetype=attachment['content_type'],
+        as_attachment=request.args.get('download') == '1',
+        download_name=attachment['filename'],
+        conditional=True,
+        etag=attachment['sha256'],
+        max_age=86400
+    )
+
+@bp.route('/api/attachments/<int:attachment_id>/thumbnail', methods=['GET'])
+def download_attachment_thumbnail(attachment_id):
+    store = attachment_store()
+    conn = get_db_connection()
+    attachment = get_attachment(conn, attachment_id)
+    conn.close()
+    
+    if attachment is None:
+        return jsonify({'error': 'Attachment not found'}), 404
+    if attachment['thumbnail_status'] == 'pending':
+        # Re-queue in case the process restarted before the thumbnail was rendered
+        thumbnails.submit(current_app.config['DATABASE'], store, attachment['sha256'])
+        return jsonify({'status': 'pending'}), 202
+    if attachment['thumbnail_status'] != 'ready':
+        return jsonify({'error': 'No thumbnail available', 'status': attachment['thumbnail_status']}), 404
+    
+    return send_file(thumbnail_path(store, attachment['sha256']), mimetype='image/jpeg',
+                     conditional=True, etag=f"{attachment['sha256']}-thumb", max_age=86400)
+
+@bp.route('/api/attachments/<int:attachment_id>', methods=['DELETE'])
+def remove_attachment(attachment_id):
+    conn = get_db_connection()
+    deleted = delete_attachment(conn, attachment_store(), attachment_id)
+    conn.commit()
+    conn.close()
+    
+    if not deleted:
+        return jsonify({'error': 'Attachment not found'}), 404
+    return jsonify({'message': 'Attachment deleted successfully'})
+
+# Task links: the many-to-many joins of tasks with employees, roles, scopes and notifications
+LINK_ENTITIES = 'any(employees, roles, scopes, notifications)'
+
+def link_request_task_ids(data):
+    """task_ids of a link/unlink body as ints, or raise ValueError"""
+    task_ids = data.get('task_ids')
+    if not isinstance(task_ids, list) or not task_ids:
+        raise ValueError('task_ids must be a non-empty list')
+    if len(task_ids) > MAX_LINK_TASKS:
+        raise ValueError(f'At most {MAX_LINK_TASKS} task_ids per request')
+    return list(dict.fromkeys(int(task_id) for task_id in task_ids))
+
+@bp.route(f'/api/<{LINK_ENTITIES}:entity>/<int:entity_id>/tasks', methods=['GET'])
+def get_linked_tasks(entity, entity_id):
+    """Tasks linked to an employee, role, scope or notification, in task id pages (?after=&per_page=)"""
+    relation = RELATION_PATHS[entity]
+    attribute_column = RELATIONS[relation][2]
+    try:
+        fields = parse_fields(request.args.get('fields'), TASK_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    tasks, total, next_after = linked_tasks(
+        conn, relation, entity_id,
+        after=int(request.args.get('after', 0)),
+        limit=int(request.args.get('per_page', DEFAULT_LINK_PAGE_SIZE)),
+        attribute=request.args.get(attribute_column) if attribute_column else None,
+        fields=fields
+    )
+    conn.close()
+    
+    return jsonify({
+        f'{relation}_id': entity_id,
+        'tasks': tasks,
+        'total': total,
+        'next_after': next_after
+    })
+
+@bp.route(f'/api/<{LINK_ENTITIES}:entity>/<int:entity_id>/tasks', methods=['POST'])
+def link_entity_tasks(entity, entity_id):
+    """Link tasks in bulk: {"task_ids": [...], "relationship_type" or "access_level": ...}"""
+    relation = RELATION_PATHS[entity]
+    attribute_column = RELATIONS[relation][2]
+    data = request.get_json() or {}
+    try:
+        task_ids = link_request_task_ids(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    if not entity_exists(conn, relation, entity_id):
+        conn.close()
+        return jsonify({'error': f'{relation.capitalize()} not found'}), 404
+    
+    linked, unknown = link_tasks(conn, relation, entity_id, task_ids,
+                                 data.get(attribute_column) if attribute_column else None)
+    conn.commit()
+    conn.close()
+    
+    return jsonify({'message': f'Linked {linked} tasks', 'linked': linked, 'unknown_task_ids': unknown})
+
+@bp.route(f'/api/<{LINK_ENTITIES}:entity>/<int:entity_id>/tasks', methods=['DELETE'])
+def unlink_entity_tasks(entity, entity_id):
+    """Unlink tasks in bulk: {"task_ids": [...]}, or {"all": true} for every task of the entity"""
+    relation = RELATION_PATHS[entity]
+    attribute_column = RELATIONS[relation][2]
+    data = request.get_json(silent=True) or {}
+    task_ids = None
+    if not data.get('all'):
+        try:
+            task_ids = link_request_task_ids(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    removed = unlink_tasks(conn, relation, entity_id, task_ids,
+                           data.get(attribute_column) if attribute_column else None)
+    conn.commit()
+    conn.close()
+    
+    return jsonify({'message': f'Unlinked {removed} tasks', 'unlinked': removed})
+
+@bp.route(f'/api/tasks/<int:task_id>/<{LINK_ENTITIES}:entity>', methods=['GET'])
+def get_task_links(task_id, entity):
+    """Employees, roles, scopes or notifications a task is linked to"""
+    relation = RELATION_PATHS[entity]
+    conn = get_db_connection()
+    if conn.execute('SELECT 1 FROM inspection_tasks WHERE id = ?', (task_id,)).fetchone() is None:
+        conn.close()
+        return jsonify({'error': 'Task not found'}), 404
+    links = task_links(conn, relation, task_id)
+    conn.close()
+    
+    return jsonify({'task_id': task_id, entity: links})
+
+@bp.route('/api/export/xlsx')
+def export_xlsx():
+    """The tracker as a workbook in the scope upload layout (?site=&status=, each repeatable)"""
+    sites = request.args.getlist('site')
+    statuses = request.args.getlist('status')
+    
+    conn = get_db_connection()
+    try:
+        path, count = export_to_temp_file(conn, sites, statuses)
+    finally:
+        conn.close()
+    
+    filename = f"tracker_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    return Response(stream_and_remove(path), mimetype=XLSX_MIMETYPE, headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'Content-Length': str(os.path.getsize(path)),
+        'X-Task-Count': str(count)
+    })
+
+# Asset hierarchy: subtree task counts by status, one level at a time
+@bp.route('/api/hierarchy')
+def get_hierarchy():
+    """A hierarchy node's subtree counts and a page of its children (?path= or ?node=, &limit=&offset=).
+    
+    Without path or node, the whole tree and its top-level nodes.
+    """
+    node_id = request.args.get('node', type=int)
+    path = request.args.get('path')
+    if request.args.get('node') and node_id is None:
+        return jsonify({'error': 'node must be an integer id'}), 400
+    
+    conn = get_db_connection()
+    node = None
+    if node_id is not None or path:
+        node = find_node(conn, node_id=node_id, path=path)
+        if node is None:
+            conn.close()
+            return jsonify({'error': 'Hierarchy node not found'}), 404
+    
+    level = hierarchy_level(conn, node,
+                            limit=request.args.get('limit', DEFAULT_HIERARCHY_PAGE_SIZE, type=int),
+                            offset=request.args.get('offset', 0, type=int))
+    conn.close()
+    
+    return jsonify({'node': node, **level})
+
 # Lookup Data Routes
-@app.route('/api/lookups/inspectors')
+@bp.route('/api/lookups/inspectors')
 def get_inspectors():
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = get_db_connection()
     df = pd.read_sql_query('SELECT * FROM inspectors WHERE active = 1', conn)
     conn.close()
     return jsonify(df.to_dict('records'))
 
-@app.route('/api/lookups/sites')
+@bp.route('/api/lookups/sites')
 def get_sites():
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = get_db_connection()
     df = pd.read_sql_query('SELECT * FROM sites WHERE active = 1', conn)
     conn.close()
     return jsonify(df.to_dict('records'))
 
-@app.route('/api/lookups/methods')
+@bp.route('/api/lookups/methods')
 def get_methods():
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = get_db_connection()
     df = pd.read_sql_query('SELECT * FROM methods WHERE active = 1', conn)
     conn.close()
     return jsonify(df.to_dict('records'))
 
-@app.route('/api/lookups/status-types')
+@bp.route('/api/lookups/status-types')
 def get_status_types():
-    conn = sqlite3.connect('inspection_tracker.db')
+    conn = get_db_connection()
     df = pd.read_sql_query('SELECT * FROM status_types WHERE active = 1', conn)
     conn.close()
     return jsonify(df.to_dict('records'))
 
 if __name__ == '__main__':
-    init_db()
+    # Development server; serve.py runs the app under a multi-worker WSGI server
+    app = create_app()
+    init_db(app.config['DATABASE'])
     app.run(host='0.0.0.0', port=5000, debug=False)
-
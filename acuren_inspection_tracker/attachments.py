@@ -0,0 +1,405 @@
+"""
+Photo and document attachments for inspection records and tasks.
+
+Uploads are resumable: a client opens an upload session, appends chunks at
+the offset the server reports, and completes the session. Sessions left
+unfinished for UPLOAD_EXPIRE_HOURS are dropped with their partial files. The
+assembled file is hashed and moved into a content-addressed BlobStore, so
+identical files are stored once however often they are attached. The bytes
+are always uploaded: a digest alone is never enough to attach a stored blob,
+or anyone who learned it could attach someone else's file. Image thumbnails
+are rendered with Pillow by a background thread pool.
+
+Blobs enter the store before the transaction that records them and leave
+it only after the transaction that forgets them, so every attachment_blobs
+row has its file. The removal re-checks for the row under the write lock,
+which completing an upload also takes before re-adding its blob.
+"""
+
+import json
+import logging
+import mimetypes
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from blob_store import FileTooLarge, hash_file, stream_to_file
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_WORKERS = 2
+UPLOAD_EXPIRE_HOURS = 24
+ATTACHMENT_KINDS = ('photo', 'document')
+
+logger = logging.getLogger('acuren.attachments')
+
+ATTACHMENT_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS attachment_blobs (
+        sha256 TEXT PRIMARY KEY,
+        size INTEGER,
+        content_type TEXT,
+        thumbnail_status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS attachments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sha256 TEXT NOT NULL,
+        record_id INTEGER,
+        task_id INTEGER,
+        kind TEXT,
+        filename TEXT,
+        uploaded_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (sha256) REFERENCES attachment_blobs (sha256),
+        FOREIGN KEY (task_id) REFERENCES inspection_tasks (id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_attachments_record ON attachments (record_id)',
+    'CREATE INDEX IF NOT EXISTS idx_attachments_task ON attachments (task_id)',
+    'CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON attachments (sha256)',
+    '''
+    CREATE TABLE IF NOT EXISTS attachment_uploads (
+        id TEXT PRIMARY KEY,
+        filename TEXT,
+        content_type TEXT,
+        size INTEGER,
+        received INTEGER DEFAULT 0,
+        expected_sha256 TEXT,
+        record_id INTEGER,
+        task_id INTEGER,
+        kind TEXT,
+        uploaded_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    '''
+]
+
+ATTACHMENT_FIELDS = ['id', 'sha256', 'record_id', 'task_id', 'kind', 'filename', 'uploaded_by',
+                     'created_at', 'size', 'content_type', 'thumbnail_status']
+
+
+class UploadError(ValueError):
+    """An upload request that cannot be honoured; carries the HTTP status"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def create_attachment_tables(conn):
+    cursor = conn.cursor()
+    for statement in ATTACHMENT_TABLES_SQL:
+        cursor.execute(statement)
+
+
+def _partial_path(store, upload_id):
+    return store.temp_path(f'upload-{upload_id}')
+
+
+def start_upload(conn, store, filename, size, content_type=None, kind='photo', record_id=None,
+                 task_id=None, uploaded_by=None, expected_sha256=None, max_bytes=DEFAULT_MAX_BYTES):
+    """Open an upload session; expected_sha256, when given, is checked on completion"""
+    if kind not in ATTACHMENT_KINDS:
+        raise UploadError(f'kind must be one of {", ".join(ATTACHMENT_KINDS)}')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('size must be the file size in bytes')
+    if size < 0:
+        raise UploadError('size must be the file size in bytes')
+    if size > max_bytes:
+        raise UploadError(f'File exceeds the {max_bytes} byte limit', 413)
+    content_type = content_type or mimetypes.guess_type(filename or '')[0] or 'application/octet-stream'
+
+    upload_id = uuid.uuid4().hex
+    conn.execute('''
+        INSERT INTO attachment_uploads
+        (id, filename, content_type, size, expected_sha256, record_id, task_id, kind, uploaded_by)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (upload_id, filename, content_type, size, expected_sha256, record_id, task_id, kind, uploaded_by))
+    open(_partial_path(store, upload_id), 'wb').close()
+    return {'upload': get_upload(conn, upload_id)}
+
+
+def expire_uploads(conn, store, max_age_hours=UPLOAD_EXPIRE_HOURS):
+    """Drop sessions not written to for max_age_hours, and their partial files; returns how many"""
+    expired = [upload_id for (upload_id,) in conn.execute(
+        "SELECT id FROM attachment_uploads WHERE updated_at < datetime('now', ?)",
+        (f'-{float(max_age_hours)} hours',))]
+    for upload_id in expired:
+        conn.execute('DELETE FROM attachment_uploads WHERE id = ?', (upload_id,))
+        try:
+            os.remove(_partial_path(store, upload_id))
+        except FileNotFoundError:
+            pass
+    return len(expired)
+
+
+def get_upload(conn, upload_id):
+    row = conn.execute('''
+        SELECT id, filename, content_type, size, received, kind, record_id, task_id
+        FROM attachment_uploads WHERE id = ?
+    ''', (upload_id,)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(['upload_id', 'filename', 'content_type', 'size', 'received', 'kind',
+                     'record_id', 'task_id'], row))
+
+
+def append_chunk(conn, store, upload_id, offset, stream):
+    """Append a chunk at offset, which must equal the bytes received so far"""
+    upload = get_upload(conn, upload_id)
+    if upload is None:
+        raise UploadError('Upload not found', 404)
+
+    path = _partial_path(store, upload_id)
+    on_disk = os.path.getsize(path) if os.path.exists(path) else 0
+    if on_disk < upload['received']:
+        # The partial file lost data (e.g. a crash before fsync); resume from what is there
+        upload['received'] = on_disk
+        conn.execute('UPDATE attachment_uploads SET received = ? WHERE id = ?', (on_disk, upload_id))
+    if offset != upload['received']:
+        raise UploadError('Chunk does not start at the received offset', 409, received=upload['received'])
+
+    remaining = upload['size'] - upload['received']
+    with open(path, 'ab') as handle:
+        # Drop anything past the recorded offset left by an interrupted chunk
+        handle.truncate(upload['received'])
+    try:
+        written = stream_to_file(stream, path, mode='ab', max_bytes=remaining)
+    except FileTooLarge:
+        with open(path, 'ab') as handle:
+            handle.truncate(upload['received'])
+        raise UploadError('Chunk runs past the declared file size', 416, received=upload['received'])
+
+    received = upload['received'] + written
+    conn.execute('''
+        UPDATE attachment_uploads SET received = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+    ''', (received, upload_id))
+    upload['received'] = received
+    return upload
+
+
+def complete_upload(conn, store, upload_id):
+    """Hash the assembled file, store it by digest and record the attachment.
+
+    Returns (attachment, deduplicated).
+    """
+    row = conn.execute('''
+        SELECT filename, content_type, size, received, expected_sha256, record_id, task_id, kind, uploaded_by
+        FROM attachment_uploads WHERE id = ?
+    ''', (upload_id,)).fetchone()
+    if row is None:
+        raise UploadError('Upload not found', 404)
+    filename, content_type, size, received, expected, record_id, task_id, kind, uploaded_by = row
+    if received != size:
+        raise UploadError('Upload is incomplete', 409, received=received)
+
+    path = _partial_path(store, upload_id)
+    digest = hash_file(path)
+    if expected and expected.lower() != digest:
+        raise UploadError('Uploaded content does not match sha256', 422, sha256=digest)
+
+    # The blob goes into the store before the transaction, so a rollback can
+    # at worst leave an unreferenced file, never a row without one. The
+    # partial file is kept until the commit in case a concurrent
+    # delete_attachment removes the blob before the write lock is taken.
+    store.link(path, digest)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if conn.execute('SELECT 1 FROM attachment_uploads WHERE id = ?', (upload_id,)).fetchone() is None:
+            raise UploadError('Upload not found', 404)
+        store.link(path, digest)
+        known = conn.execute('SELECT 1 FROM attachment_blobs WHERE sha256 = ?', (digest,)).fetchone()
+        if not known:
+            conn.execute('''
+                INSERT INTO attachment_blobs (sha256, size, content_type, thumbnail_status)
+                VALUES (?, ?, ?, ?)
+            ''', (digest, size, content_type, 'pending' if content_type.startswith('image/') else 'none'))
+
+        attachment_id = _add_attachment(conn, digest, record_id, task_id, kind, filename, uploaded_by)
+        conn.execute('DELETE FROM attachment_uploads WHERE id = ?', (upload_id,))
+        attachment = get_attachment(conn, attachment_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    _remove_file(path)
+    return attachment, bool(known)
+
+
+def _add_attachment(conn, digest, record_id, task_id, kind, filename, uploaded_by):
+    cursor = conn.execute('''
+        INSERT INTO attachments (sha256, record_id, task_id, kind, filename, uploaded_by)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (digest, record_id, task_id, kind, filename, uploaded_by))
+    attachment_id = cursor.lastrowid
+    if record_id is not None:
+        _link_to_record(conn, record_id, kind, f'/api/attachments/{attachment_id}')
+    return attachment_id
+
+
+def _link_to_record(conn, record_id, kind, url):
+    """Keep inspection_records.photos/documents listing the record's attachments"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'inspection_records'").fetchone()
+    if not exists:
+        return
+    column = 'photos' if kind == 'photo' else 'documents'
+    row = conn.execute(f'SELECT {column} FROM inspection_records WHERE id = ?', (record_id,)).fetchone()
+    if row is None:
+        return
+    try:
+        paths = json.loads(row[0]) if row[0] else []
+    except ValueError:
+        paths = []
+    paths.append(url)
+    conn.execute(f'UPDATE inspection_records SET {column} = ? WHERE id = ?', (json.dumps(paths), record_id))
+
+
+def get_attachment(conn, attachment_id):
+    fields = ', '.join(f'a.{field}' for field in ATTACHMENT_FIELDS[:8])
+    row = conn.execute(f'''
+        SELECT {fields}, b.size, b.content_type, b.thumbnail_status
+        FROM attachments a JOIN attachment_blobs b ON b.sha256 = a.sha256
+        WHERE a.id = ?
+    ''', (attachment_id,)).fetchone()
+    return dict(zip(ATTACHMENT_FIELDS, row)) if row else None
+
+
+def list_attachments(conn, record_id=None, task_id=None):
+    fields = ', '.join(f'a.{field}' for field in ATTACHMENT_FIELDS[:8])
+    query = f'''
+        SELECT {fields}, b.size, b.content_type, b.thumbnail_status
+        FROM attachments a JOIN attachment_blobs b ON b.sha256 = a.sha256
+        WHERE 1=1
+    '''
+    params = []
+    if record_id is not None:
+        query += ' AND a.record_id = ?'
+        params.append(record_id)
+    if task_id is not None:
+        query += ' AND a.task_id = ?'
+        params.append(task_id)
+    query += ' ORDER BY a.id'
+    return [dict(zip(ATTACHMENT_FIELDS, row)) for row in conn.execute(query, params).fetchall()]
+
+
+def delete_attachment(conn, store, attachment_id):
+    """Remove an attachment, and its blob and thumbnail once nothing else references them.
+
+    Files are only removed after the rows are committed, so a failed commit
+    never leaves a row pointing at a missing blob.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT sha256 FROM attachments WHERE id = ?', (attachment_id,)).fetchone()
+        if row is None:
+            conn.rollback()
+            return False
+        digest = row[0]
+        conn.execute('DELETE FROM attachments WHERE id = ?', (attachment_id,))
+        unreferenced = conn.execute('SELECT 1 FROM attachments WHERE sha256 = ? LIMIT 1', (digest,)).fetchone() is None
+        if unreferenced:
+            conn.execute('DELETE FROM attachment_blobs WHERE sha256 = ?', (digest,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if unreferenced:
+        _remove_blob(conn, store, digest)
+    return True
+
+
+def _remove_blob(conn, store, digest):
+    """Delete a blob's files unless an upload completed with the same content meanwhile.
+
+    The check and the removal hold the write lock, which complete_upload
+    also takes before it re-adds the blob and records its row.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if conn.execute('SELECT 1 FROM attachment_blobs WHERE sha256 = ?', (digest,)).fetchone() is None:
+            store.delete(digest)
+            _remove_file(thumbnail_path(store, digest))
+    finally:
+        conn.rollback()
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def thumbnail_path(store, digest):
+    return os.path.join(store.root, 'thumbnails', digest[:2], f'{digest}.jpg')
+
+
+class ThumbnailWorker:
+    """Renders image thumbnails on a small thread pool started on first use"""
+
+    def __init__(self, workers=THUMBNAIL_WORKERS):
+        self.workers = workers
+        self.reset()
+
+    def reset(self):
+        """Forget the pool and queue; a forked worker process must not reuse its parent's threads"""
+        self._executor = None
+        self._queued = set()
+        self._lock = threading.Lock()
+
+    def submit(self, database, store, digest):
+        with self._lock:
+            if digest in self._queued:
+                return
+            self._queued.add(digest)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='thumbnail')
+        self._executor.submit(self._render, database, store, digest)
+
+    def _render(self, database, store, digest):
+        try:
+            status = render_thumbnail(store, digest)
+        except Exception:
+            logger.exception('Thumbnail failed for %s', digest)
+            status = 'failed'
+        finally:
+            with self._lock:
+                self._queued.discard(digest)
+        conn = sqlite3.connect(database, timeout=30)
+        conn.execute('UPDATE attachment_blobs SET thumbnail_status = ? WHERE sha256 = ?', (status, digest))
+        conn.commit()
+        conn.close()
+
+
+def render_thumbnail(store, digest):
+    """Write a JPEG thumbnail of a stored image; returns the new thumbnail_status"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return 'unavailable'
+
+    destination = thumbnail_path(store, digest)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    temp = f'{destination}.{uuid.uuid4().hex}.tmp'
+    with Image.open(store.path(digest)) as image:
+        # draft() lets JPEG decode at reduced size instead of the full resolution
+        image.draft('RGB', THUMBNAIL_SIZE)
+        image.thumbnail(THUMBNAIL_SIZE)
+        image.convert('RGB').save(temp, 'JPEG', quality=80)
+    os.replace(temp, destination)
+    return 'ready'
+
+
+thumbnails = ThumbnailWorker()
+os.register_at_fork(after_in_child=thumbnails.reset)
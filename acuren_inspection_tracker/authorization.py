@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Role-permission checks on every API route.
+
+The caller names themselves with the X-Employee-Id header (the employee_id
+of complete_schema's employees table). Each endpoint maps to the
+permissions that allow it, checked against the JSON permission list of the
+caller's role. Employees and roles are compiled into one in-process dict of
+frozensets, so a check is two dict lookups and a set intersection; the dict
+is rebuilt only when triggers on roles and employees have bumped
+authorization_version, which is read at most once every
+AUTHORIZATION_RECHECK_SECONDS.
+
+The header is whatever the client sends, so the check is only as good as
+the proxy in front: it must authenticate the user, drop any X-Employee-Id
+the client sent and set its own. Until there is one, AUTHORIZATION stays
+'audit' (the default: log and count denials but let the request through);
+'enforce' rejects them and 'off' skips the check. The roles are seeded by
+migration 13; employees are added per deployment.
+
+    python authorization.py inspection_tracker.db EMP004    # show an employee's permissions
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from instrumentation import STATEMENT_BUCKETS, registry
+
+EMPLOYEE_HEADER = 'X-Employee-Id'
+MODES = ('enforce', 'audit', 'off')
+DEFAULT_RECHECK_SECONDS = 1.0
+
+logger = logging.getLogger('acuren.authorization')
+
+VIEW = frozenset(['view_all', 'view_tasks', 'view_assigned'])
+ANALYTICS = frozenset(['generate_analytics', 'generate_reports'])
+# Operational endpoints are for the role that manages users (the Inspection Manager)
+ADMIN = frozenset(['manage_users'])
+# Any known, active employee
+IDENTIFIED = frozenset()
+PUBLIC = None
+
+# Endpoint -> permissions, any one of which allows it; endpoints missing here need ADMIN
+ROUTE_PERMISSIONS = {
+    'static': PUBLIC,
+    'tracker.index': PUBLIC,
+    'tracker.health_check': PUBLIC,
+    'authorization': IDENTIFIED,
+
+    'tracker.dashboard_overview': VIEW,
+    'tracker.get_tasks': VIEW,
+    'tracker.get_task': VIEW,
+    'tracker.get_task_facets': VIEW,
+    'tracker.sync_tasks': VIEW,
+    'tracker.get_hierarchy': VIEW,
+    'tracker.get_linked_tasks': VIEW,
+    'tracker.get_task_links': VIEW,
+    'tracker.get_attachments': VIEW,
+    'tracker.download_attachment': VIEW,
+    'tracker.download_attachment_thumbnail': VIEW,
+    'tracker.attachment_upload_status': VIEW,
+    'tracker.get_inspectors': VIEW,
+    'tracker.get_sites': VIEW,
+    'tracker.get_methods': VIEW,
+    'tracker.get_status_types': VIEW,
+    'due_alert_status': VIEW,
+    'tracker.export_xlsx': frozenset(['view_all', 'view_tasks', 'generate_reports']),
+
+    'tracker.process_performance': ANALYTICS,
+    'tracker.predictive_insights': ANALYTICS,
+    'analytics_snapshot': ANALYTICS,
+    'tracker.generate_progress_report': frozenset(['generate_reports']),
+
+    'tracker.upload_scope_enhanced': frozenset(['upload_scope']),
+    'tracker.scope_validation_report': frozenset(['upload_scope', 'review_scope']),
+    'tracker.review_scope': frozenset(['review_scope']),
+    'tracker.assign_task': frozenset(['assign_tasks']),
+    'tracker.auto_assign_tasks': frozenset(['assign_tasks']),
+    'tracker.link_entity_tasks': frozenset(['assign_tasks']),
+    'tracker.unlink_entity_tasks': frozenset(['assign_tasks']),
+    'tracker.claim_task': frozenset(['claim_tasks']),
+    'tracker.update_task': frozenset(['update_status']),
+    'tracker.push_task_changes': frozenset(['update_status']),
+    'tracker.start_attachment_upload': frozenset(['upload_results']),
+    'tracker.append_attachment_chunk': frozenset(['upload_results']),
+    'tracker.complete_attachment_upload': frozenset(['upload_results']),
+    'tracker.remove_attachment': frozenset(['upload_results']),
+
+    'tracker.recompute_task_due_dates': ADMIN,
+    'analytics_snapshot_refresh': ADMIN,
+    'task_archive_status': ADMIN,
+    'task_archive_run': ADMIN,
+    'due_alert_sweep': ADMIN,
+    'maintenance_status': ADMIN,
+    'maintenance_run': ADMIN,
+    'metrics': ADMIN,
+    'slow_queries': ADMIN
+}
+
+AUTHORIZATION_TABLES_SQL = [
+    # One row, bumped by the triggers below whenever a role or employee changes
+    '''
+    CREATE TABLE IF NOT EXISTS authorization_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''',
+    'INSERT OR IGNORE INTO authorization_version (id, version) VALUES (1, 1)'
+] + [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {table}_authorization_{event.lower()}
+    AFTER {event} ON {table}
+    BEGIN
+        UPDATE authorization_version SET version = version + 1 WHERE id = 1;
+    END
+    '''
+    for table in ('roles', 'employees') for event in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+_settings = {
+    'database': None,
+    'mode': 'audit',
+    'recheck_seconds': DEFAULT_RECHECK_SECONDS
+}
+
+
+def create_authorization_tables(conn):
+    cursor = conn.cursor()
+    for statement in AUTHORIZATION_TABLES_SQL:
+        cursor.execute(statement)
+
+
+def parse_permissions(text):
+    """A role's JSON permission list as a frozenset; malformed lists grant nothing"""
+    try:
+        permissions = json.loads(text or '[]')
+    except ValueError:
+        return frozenset()
+    if not isinstance(permissions, list):
+        return frozenset()
+    return frozenset(str(permission) for permission in permissions)
+
+
+def compile_permissions(conn):
+    """employee_id -> (employee id, role name, permissions) for every active employee.
+
+    Each role's JSON is parsed once; an inactive role grants nothing.
+    """
+    roles = {role_id: (role_name, parse_permissions(permissions) if active else frozenset())
+             for role_id, role_name, permissions, active in
+             conn.execute('SELECT id, role_name, permissions, active FROM roles')}
+    compiled = {}
+    for row_id, employee_id, role_id in conn.execute(
+            'SELECT id, employee_id, role_id FROM employees WHERE active = 1 AND employee_id IS NOT NULL'):
+        role_name, permissions = roles.get(role_id, (None, frozenset()))
+        compiled[employee_id] = (row_id, role_name, permissions)
+    return compiled
+
+
+def authorization_version(conn):
+    return conn.execute('SELECT version FROM authorization_version WHERE id = 1').fetchone()[0]
+
+
+class PermissionCache:
+    """Compiled permissions of one process, rebuilt when authorization_version moves"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget everything; a forked worker compiles its own"""
+        self._lock = threading.Lock()
+        self.version = None
+        self.checked_at = None
+        self.employees = {}
+
+    def lookup(self, employee_id):
+        """(employee id, role name, permissions) of an active employee, or None"""
+        checked_at = self.checked_at
+        if checked_at is None or time.monotonic() - checked_at >= _settings['recheck_seconds']:
+            self.refresh()
+        return self.employees.get(employee_id)
+
+    def refresh(self):
+        """Read the version and recompile if it moved; one thread does it while the others keep the old dict"""
+        if not self._lock.acquire(blocking=self.checked_at is None):
+            return
+        try:
+            conn = sqlite3.connect(_settings['database'], timeout=30)
+            try:
+                version = authorization_version(conn)
+                if version != self.version:
+                    self.employees = compile_permissions(conn)
+                    self.version = version
+            finally:
+                conn.close()
+            self.checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+
+cache = PermissionCache()
+os.register_at_fork(after_in_child=cache.reset)
+
+
+def _deny(status, message, reason):
+    registry.inc('acuren_authorization_denied_total', (('endpoint', request.endpoint), ('reason', reason)),
+                 help_text='Requests denied by the role-permission check.')
+    if _settings['mode'] == 'audit':
+        # Debug level: in audit mode nearly every request may land here; acuren_authorization_denied_total
+        # gives the volume
+        logger.debug('Audit: %s %s would be denied: %s', request.method, request.path, message)
+        return None
+    return jsonify({'error': message}), status
+
+
+def _check_request():
+    """before_request hook: resolve the caller and check the endpoint's permissions"""
+    if request.method == 'OPTIONS' or request.url_rule is None:
+        return None
+    required = ROUTE_PERMISSIONS.get(request.endpoint, ADMIN)
+    if required is PUBLIC:
+        return None
+
+    started = time.perf_counter()
+    try:
+        employee_id = request.headers.get(EMPLOYEE_HEADER)
+        if not employee_id:
+            return _deny(401, f'{EMPLOYEE_HEADER} header is required', 'missing')
+        caller = cache.lookup(employee_id)
+        if caller is None:
+            return _deny(401, f'Unknown or inactive employee {employee_id}', 'unknown')
+        g.employee = caller
+        if required and caller[2].isdisjoint(required):
+            return _deny(403, f'Requires one of: {", ".join(sorted(required))}', 'forbidden')
+        return None
+    finally:
+        registry.observe('acuren_authorization_seconds', (), (time.perf_counter() - started,), STATEMENT_BUCKETS,
+                         'Time spent resolving the caller and checking permissions.')
+
+
+def current_permissions():
+    """The caller's role and permissions; none for an unknown caller let through in audit mode"""
+    row_id, role_name, permissions = g.get('employee') or (None, None, frozenset())
+    return jsonify({
+        'employee_id': request.headers.get(EMPLOYEE_HEADER),
+        'id': row_id,
+        'role': role_name,
+        'permissions': sorted(permissions),
+        'version': cache.version
+    })
+
+
+def init_app(app):
+    """Check every request against ROUTE_PERMISSIONS unless AUTHORIZATION is 'off'"""
+    mode = app.config.get('AUTHORIZATION', 'audit')
+    if mode not in MODES:
+        raise ValueError(f'AUTHORIZATION must be one of {", ".join(MODES)}, not {mode!r}')
+    _settings['database'] = app.config['DATABASE']
+    _settings['mode'] = mode
+    _settings['recheck_seconds'] = float(app.config.get('AUTHORIZATION_RECHECK_SECONDS', DEFAULT_RECHECK_SECONDS))
+    cache.reset()
+    if mode == 'off':
+        return
+    app.before_request(_check_request)
+    app.add_url_rule('/api/authorization', 'authorization', current_permissions)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show an employee's role and compiled permissions")
+    parser.add_argument('database', nargs='?', default='inspection_tracker.db')
+    parser.add_argument('employee_id')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    started = time.perf_counter()
+    compiled = compile_permissions(conn)
+    elapsed = time.perf_counter() - started
+    caller = compiled.get(args.employee_id)
+    if caller is None:
+        print(f"{args.employee_id} is not an active employee")
+    else:
+        print(f"{args.employee_id}: {caller[1]} {sorted(caller[2])}")
+    print(f"Compiled {len(compiled)} employees in {elapsed * 1000:.1f}ms (version {authorization_version(conn)})")
+    conn.close()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Workload-balanced auto-assignment of unassigned inspection tasks.
+
+Tasks are handed out most urgent first to the least loaded qualified
+inspector. Candidate inspectors are kept in priority queues keyed by their
+current load (one per distinct candidate set of a method or site/method
+pair), and stale heap entries are refreshed lazily when they surface.
+"""
+
+import heapq
+import json
+import sqlite3
+from datetime import date, timedelta
+
+from lookup_encoding import id_list_sql, lookup_id
+
+# Extra load carried by a task due within the urgent window
+URGENT_WEIGHT = 1.0
+URGENT_DAYS = 7
+
+# How much more loaded a site-local inspector may be before a remote one is preferred
+DEFAULT_SITE_PENALTY = 5.0
+
+# Method categories that require a certified inspector
+CERTIFIED_CATEGORIES = ('NDT',)
+
+
+def _load_inspectors(conn):
+    rows = conn.execute('''
+        SELECT name FROM inspectors
+        WHERE active = 1 AND name IS NOT NULL AND name NOT IN ('', 'Unassigned')
+        ORDER BY name
+    ''').fetchall()
+    return [name for (name,) in rows]
+
+
+def _load_workloads(conn, urgent_date):
+    rows = conn.execute('''
+        SELECT
+            i.name,
+            COUNT(*) as claimed_tasks,
+            COUNT(CASE WHEN t.due_date < ? THEN 1 END) as urgent_tasks
+        FROM inspection_tasks t
+        JOIN inspectors i ON i.id = t.inspector_id
+        WHERE t.inspector_id IS NOT NULL AND +t.status_id IN ({})
+        GROUP BY t.inspector_id
+    '''.format(id_list_sql(conn, 'status', ['Claimed'])), (urgent_date,)).fetchall()
+    return {inspector: (claimed, urgent) for inspector, claimed, urgent in rows}
+
+
+def _load_site_affinity(conn):
+    rows = conn.execute('''
+        SELECT i.name, s.site_code
+        FROM (
+            SELECT DISTINCT inspector_id, site_id
+            FROM inspection_tasks
+            WHERE inspector_id IS NOT NULL AND site_id IS NOT NULL
+        ) pairs
+        JOIN inspectors i ON i.id = pairs.inspector_id
+        JOIN sites s ON s.id = pairs.site_id
+    ''').fetchall()
+    affinity = {}
+    for inspector, site in rows:
+        affinity.setdefault(inspector, set()).add(site)
+    return affinity
+
+
+def _load_qualifications(conn):
+    """Read specializations and certification from complete_schema, when present.
+
+    Returns (qualified_methods, certified, certified_methods): inspectors absent
+    from qualified_methods may work any method.
+    """
+    try:
+        inspector_rows = conn.execute('''
+            SELECT e.first_name || ' ' || e.last_name, ir.specializations, ir.certification_level
+            FROM inspector_records ir
+            JOIN employees e ON e.id = ir.employee_id
+            WHERE ir.active = 1
+        ''').fetchall()
+        method_rows = conn.execute('''
+            SELECT method_name FROM connection_methods
+            WHERE category IN ({})
+        '''.format(', '.join('?' for _ in CERTIFIED_CATEGORIES)), CERTIFIED_CATEGORIES).fetchall()
+    except sqlite3.OperationalError:
+        return {}, set(), set()
+
+    qualified_methods = {}
+    certified = set()
+    for name, specializations, certification_level in inspector_rows:
+        if certification_level:
+            certified.add(name)
+        try:
+            methods = json.loads(specializations) if specializations else []
+        except ValueError:
+            methods = []
+        if methods:
+            qualified_methods[name] = set(methods)
+
+    return qualified_methods, certified, {method for (method,) in method_rows}
+
+
+def _load_unassigned_tasks(conn, site=None, limit=None):
+    # Unassigned tasks are a large share of the table, so scan it rather than
+    # fetching each row through the inspector index (unary + disables it)
+    query = '''
+        SELECT t.id, s.site_code, m.method_name, t.due_date
+        FROM inspection_tasks t
+        LEFT JOIN sites s ON s.id = t.site_id
+        LEFT JOIN methods m ON m.id = t.method_id
+        WHERE +t.inspector_id IS NULL AND IFNULL(t.status_id, -1) NOT IN ({})
+    '''.format(id_list_sql(conn, 'status', ['Field Complete', 'Reported']))
+    params = []
+    if site:
+        query += ' AND t.site_id = (SELECT id FROM sites WHERE site_code = ?)'
+        params.append(site)
+    query += ' ORDER BY t.due_date IS NULL, t.due_date ASC, t.inspection_priority ASC, t.id ASC'
+    if limit:
+        query += ' LIMIT ?'
+        params.append(int(limit))
+    return conn.execute(query, params).fetchall()
+
+
+class _Balancer:
+    """Least-loaded selection over lazily refreshed heaps"""
+
+    def __init__(self, inspectors, loads, task_counts, affinity, qualified_methods,
+                 certified, certified_methods, max_tasks=None):
+        self.inspectors = inspectors
+        self.load = loads
+        self.task_counts = task_counts
+        self.affinity = affinity
+        self.qualified_methods = qualified_methods
+        self.certified = certified
+        self.certified_methods = certified_methods
+        self.max_tasks = max_tasks
+        self.assigned = dict.fromkeys(inspectors, 0)
+        self.heaps = {}
+        self.member_heaps = {}
+
+    def _qualified(self, inspector, method):
+        if method in self.certified_methods and inspector not in self.certified:
+            return False
+        methods = self.qualified_methods.get(inspector)
+        return methods is None or method in methods
+
+    def _heap(self, site, method):
+        key = (site, method)
+        heap = self.heaps.get(key)
+        if heap is None:
+            members = frozenset(
+                inspector for inspector in self.inspectors
+                if self._qualified(inspector, method)
+                and (site is None or site in self.affinity.get(inspector, ()))
+            )
+            # Keys with the same candidates share one heap, so a load change
+            # only has to be refreshed once per distinct candidate set
+            heap = self.member_heaps.get(members)
+            if heap is None:
+                heap = [(self.load[inspector], inspector) for inspector in members]
+                heapq.heapify(heap)
+                self.member_heaps[members] = heap
+            self.heaps[key] = heap
+        return heap
+
+    def _best(self, heap):
+        while heap:
+            load, inspector = heap[0]
+            if self.max_tasks is not None and self.task_counts[inspector] >= self.max_tasks:
+                heapq.heappop(heap)
+            elif load != self.load[inspector]:
+                heapq.heapreplace(heap, (self.load[inspector], inspector))
+            else:
+                return load, inspector
+        return None
+
+    def pick(self, site, method, weight, site_penalty):
+        best = self._best(self._heap(None, method))
+        if site:
+            local = self._best(self._heap(site, method))
+            if local is not None and (best is None or local[0] <= best[0] + site_penalty):
+                best = local
+        if best is None:
+            return None
+
+        inspector = best[1]
+        self.load[inspector] += weight
+        self.task_counts[inspector] += 1
+        self.assigned[inspector] += 1
+        return inspector
+
+
+def plan_assignments(conn, site=None, max_tasks_per_inspector=None,
+                     site_penalty=DEFAULT_SITE_PENALTY, limit=None):
+    """Build an assignment plan for unassigned tasks without writing anything"""
+    urgent_date = (date.today() + timedelta(days=URGENT_DAYS)).isoformat()
+
+    inspectors = _load_inspectors(conn)
+    workloads = _load_workloads(conn, urgent_date)
+    qualified_methods, certified, certified_methods = _load_qualifications(conn)
+
+    loads = {}
+    task_counts = {}
+    for inspector in inspectors:
+        claimed, urgent = workloads.get(inspector, (0, 0))
+        loads[inspector] = claimed + urgent * URGENT_WEIGHT
+        task_counts[inspector] = claimed
+
+    balancer = _Balancer(
+        inspectors, loads, task_counts, _load_site_affinity(conn), qualified_methods,
+        certified, certified_methods, max_tasks=max_tasks_per_inspector
+    )
+
+    assignments = []
+    unassignable = []
+    for task_id, task_site, method, due_date in _load_unassigned_tasks(conn, site, limit):
+        urgent = due_date is not None and str(due_date) < urgent_date
+        weight = 1 + URGENT_WEIGHT if urgent else 1
+        inspector = balancer.pick(task_site or None, method, weight, site_penalty)
+        if inspector is None:
+            unassignable.append(task_id)
+            continue
+        assignments.append({
+            'task_id': task_id,
+            'inspector': inspector,
+            'site': task_site,
+            'method': method,
+            'due_date': due_date,
+            'urgent': urgent
+        })
+
+    workload = [
+        {
+            'inspector': inspector,
+            'new_tasks': balancer.assigned[inspector],
+            'projected_tasks': task_counts[inspector],
+            'projected_load': round(balancer.load[inspector], 2)
+        }
+        for inspector in inspectors
+    ]
+    workload.sort(key=lambda row: row['projected_load'], reverse=True)
+
+    return {
+        'assignments': assignments,
+        'unassignable_task_ids': unassignable,
+        'workload': workload
+    }
+
+
+def apply_assignments(conn, assignments, assigned_by='System', notes='Auto-assigned'):
+    """Apply a plan in one transaction; tasks claimed in the meantime are skipped"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS auto_assign_plan (
+            task_id INTEGER PRIMARY KEY,
+            inspector TEXT
+        )
+    ''')
+    cursor.execute('DELETE FROM temp.auto_assign_plan')
+    cursor.executemany(
+        'INSERT INTO temp.auto_assign_plan (task_id, inspector) VALUES (?, ?)',
+        ((row['task_id'], row['inspector']) for row in assignments)
+    )
+
+    claimed_id = lookup_id(conn, 'status', 'Claimed')
+    applied = cursor.execute('''
+        UPDATE inspection_tasks
+        SET inspector_id = i.id, status_id = ?, updated_at = CURRENT_TIMESTAMP
+        FROM temp.auto_assign_plan AS plan
+        JOIN inspectors i ON i.name = plan.inspector
+        WHERE inspection_tasks.id = plan.task_id AND inspection_tasks.inspector_id IS NULL
+        RETURNING inspection_tasks.id
+    ''', (claimed_id,)).fetchall()
+    planned = {row['task_id']: row['inspector'] for row in assignments}
+    applied = [(task_id, planned[task_id]) for (task_id,) in applied]
+
+    cursor.executemany('''
+        INSERT INTO task_assignments (task_id, assigned_by, assigned_to, notes)
+        VALUES (?, ?, ?, ?)
+    ''', ((task_id, assigned_by, inspector, notes) for task_id, inspector in applied))
+
+    cursor.executemany('''
+        INSERT INTO notifications (task_id, message, notification_type)
+        VALUES (?, ?, ?)
+    ''', (
+        (task_id, f'Task assigned to {inspector} by {assigned_by}', 'task_assignment')
+        for task_id, inspector in applied
+    ))
+
+    cursor.execute('DELETE FROM temp.auto_assign_plan')
+    conn.commit()
+    return len(applied)
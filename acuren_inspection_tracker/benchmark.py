@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+Repeatable API benchmark.
+
+Exercises every API route through the Flask test client against a copy of
+a (typically synthetic) database and emits p50/p95/p99 latency and
+throughput per route as JSON, tagged with the git commit so runs can be
+compared across commits. Every endpoint in the app's URL map must have a
+route entry, and any non-2xx response stops the run: a benchmark that
+times error responses measures nothing.
+
+    python synthetic_data.py bench.db --rows 100000
+    python benchmark.py bench.db --iterations 50 --output results.json
+    python benchmark.py bench.db --compare results.json
+
+Requests carry X-Employee-Id (--employee). On the working copy that
+employee is given a role holding every permission, and authorization is
+enforced, so the permission check is timed on every route.
+
+With --base-url the same routes are sent over HTTP to a running server,
+for example to compare the development server with serve.py; the employee
+must exist in the server's database:
+
+    python serve.py --database bench.db --workers 4 &
+    python benchmark.py bench.db --base-url http://127.0.0.1:5000 --concurrency 8 --employee EMP001
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from authorization import EMPLOYEE_HEADER, ROUTE_PERMISSIONS
+from lookup_encoding import intern_names
+from synthetic_data import METHODS, STATUSES, TaskGenerator, write_xlsx
+
+DEFAULT_EMPLOYEE = 'BENCH001'
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def copy_database(source, destination):
+    """Snapshot the benchmark database so write routes leave the source untouched"""
+    source_conn = sqlite3.connect(source)
+    destination_conn = sqlite3.connect(destination)
+    source_conn.backup(destination_conn)
+    destination_conn.close()
+    source_conn.close()
+
+
+def add_benchmark_employee(database, employee_id):
+    """Give employee_id a role with every permission a route requires"""
+    permissions = sorted(set().union(*(required for required in ROUTE_PERMISSIONS.values() if required)))
+    conn = sqlite3.connect(database)
+    conn.execute('INSERT OR REPLACE INTO roles (role_name, description, permissions) VALUES (?, ?, ?)',
+                 ('Benchmark', 'Every route permission, for benchmark runs', json.dumps(permissions)))
+    role_id = conn.execute("SELECT id FROM roles WHERE role_name = 'Benchmark'").fetchone()[0]
+    conn.execute('INSERT OR REPLACE INTO employees (employee_id, first_name, role_id, active) VALUES (?, ?, ?, 1)',
+                 (employee_id, 'Benchmark', role_id))
+    conn.commit()
+    conn.close()
+
+
+def add_workbook_lookups(database, rows, seed):
+    """Add the lookup names of the workbook for seed, as the bulk ingest does from its dropdown sheets.
+
+    Scope uploads refuse names missing from the lookups, and each seed draws its own inspectors.
+    """
+    generator = TaskGenerator(rows, seed=seed)
+    conn = sqlite3.connect(database)
+    for field, names in [('inspector', generator.inspectors), ('site', generator.sites),
+                         ('method', METHODS), ('status', STATUSES)]:
+        intern_names(conn, field, names)
+    conn.commit()
+    conn.close()
+
+
+def scope_workbook(rows, seed):
+    generator = TaskGenerator(rows, seed=seed)
+    buffer = io.BytesIO()
+    write_xlsx(generator, buffer)
+    return buffer.getvalue()
+
+
+class BenchmarkContext:
+    """Random but seeded request parameters drawn from the benchmark database"""
+
+    def __init__(self, database, seed, upload_rows=500, employee_id=DEFAULT_EMPLOYEE):
+        self.rng = random.Random(seed)
+        self.database = database
+        self.headers = {EMPLOYEE_HEADER: employee_id}
+        conn = sqlite3.connect(database)
+        self.task_ids = [task_id for (task_id,) in conn.execute('SELECT id FROM inspection_tasks ORDER BY id')] or [1]
+        self.sites = [site for (site,) in conn.execute(
+            'SELECT site_code FROM sites WHERE id IN (SELECT DISTINCT site_id FROM inspection_tasks)')] or ['']
+        self.inspectors = [name for (name,) in conn.execute('SELECT name FROM inspectors')] or ['Inspector']
+        self.task_count = len(self.task_ids)
+        employee = conn.execute('SELECT id FROM employees WHERE employee_id = ?', (employee_id,)).fetchone()
+        self.employee_row_id = employee[0] if employee else 1
+        conn.close()
+        self.upload_ids = []
+        self.upload_rows = upload_rows
+        self.seed = seed
+        self.workbooks = 0
+        # Attachment uploads move through these as the start, chunk and complete routes run
+        self.attachment_uploads = []
+        self.filled_uploads = []
+        self.attachment_ids = []
+        add_workbook_lookups(database, upload_rows, seed)
+
+    def task_id(self):
+        return self.rng.choice(self.task_ids)
+
+    def task_seq(self, task_id):
+        """The task's current change_seq, as an offline client would have it"""
+        conn = sqlite3.connect(self.database)
+        seq = conn.execute('SELECT change_seq FROM inspection_tasks WHERE id = ?', (task_id,)).fetchone()[0]
+        conn.close()
+        return seq
+
+    def site(self):
+        return self.rng.choice(self.sites)
+
+    def inspector(self):
+        return self.rng.choice(self.inspectors)
+
+    def page(self, per_page=50):
+        return self.rng.randint(1, max(1, self.task_count // per_page))
+
+    def fresh_workbook(self):
+        """A workbook not uploaded before, so the upload is parsed rather than deduplicated"""
+        self.workbooks += 1
+        add_workbook_lookups(self.database, self.upload_rows, self.seed + self.workbooks)
+        return scope_workbook(self.upload_rows, self.seed + self.workbooks)
+
+    def take(self, values, name):
+        """The oldest value an earlier route produced; consuming routes run after their producers"""
+        if not values:
+            raise BenchmarkError(f'{name}: no values left from the route that produces them')
+        return values.pop(0)
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def attachment_image():
+    """A small JPEG, so the attachment routes also render and serve a thumbnail"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (40, 90, 160)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+# One benchmarked request: endpoint is the Flask endpoint it covers,
+# after(ctx, response) records what later routes need from the response,
+# and serial routes (which answer 409 while another run is in progress)
+# are sent one at a time whatever --concurrency is
+Route = namedtuple('Route', 'name endpoint method path kwargs after serial', defaults=(None, None, False))
+
+# Endpoints with nothing worth timing
+UNTIMED_ENDPOINTS = {'static', 'tracker.index'}
+
+
+def build_routes(upload_bytes, attachment_bytes):
+    """Route entries for every API endpoint, producers before the routes consuming their results"""
+    return [
+        Route('health', 'tracker.health_check', 'GET', lambda ctx: '/api/health'),
+        Route('authorization', 'authorization', 'GET', lambda ctx: '/api/authorization'),
+        Route('dashboard_overview', 'tracker.dashboard_overview', 'GET', lambda ctx: '/api/dashboard/overview'),
+        Route('process_performance', 'tracker.process_performance', 'GET',
+              lambda ctx: '/api/analytics/process-performance'),
+        Route('predictive_insights', 'tracker.predictive_insights', 'GET',
+              lambda ctx: '/api/analytics/predictive-insights'),
+        Route('analytics_snapshot', 'analytics_snapshot', 'GET', lambda ctx: '/api/analytics/snapshot'),
+        Route('analytics_snapshot_refresh', 'analytics_snapshot_refresh', 'POST',
+              lambda ctx: '/api/analytics/snapshot/refresh', serial=True),
+        Route('get_tasks', 'tracker.get_tasks', 'GET', lambda ctx: f'/api/tasks?page={ctx.page()}&per_page=50'),
+        Route('get_tasks_by_site', 'tracker.get_tasks', 'GET',
+              lambda ctx: f'/api/tasks?site={ctx.site()}&status=UnInitiated&per_page=50'),
+        Route('get_task', 'tracker.get_task', 'GET', lambda ctx: f'/api/tasks/{ctx.task_id()}'),
+        Route('task_facets', 'tracker.get_task_facets', 'GET',
+              lambda ctx: f'/api/tasks/facets?site={ctx.site()}&status=UnInitiated'),
+        Route('hierarchy', 'tracker.get_hierarchy', 'GET', lambda ctx: '/api/hierarchy'),
+        Route('export_xlsx_site', 'tracker.export_xlsx', 'GET', lambda ctx: f'/api/export/xlsx?site={ctx.site()}'),
+        Route('sync', 'tracker.sync_tasks', 'GET', lambda ctx: f'/api/sync?since={max(0, ctx.task_seq(ctx.task_id()) - 1000)}'),
+        Route('claim_task', 'tracker.claim_task', 'POST', lambda ctx: f'/api/tasks/{ctx.task_id()}/claim',
+              lambda ctx: {'json': {'inspector': ctx.inspector()}}),
+        Route('update_task', 'tracker.update_task', 'PUT', lambda ctx: f'/api/tasks/{ctx.task_id()}/update',
+              lambda ctx: {'json': {'status': ctx.rng.choice(['Claimed', 'Field Complete']),
+                                    'comments': 'Benchmark update'}}),
+        Route('sync_push', 'tracker.push_task_changes', 'POST', lambda ctx: '/api/sync/push',
+              lambda ctx: {'json': {'changes': [
+                  {'id': task_id, 'base_seq': ctx.task_seq(task_id), 'fields': {'comments': 'Benchmark push'}}
+                  for task_id in {ctx.task_id() for _ in range(20)}]}}),
+        Route('assign_task', 'tracker.assign_task', 'POST', lambda ctx: '/api/tasks/assign',
+              lambda ctx: {'json': {'task_id': ctx.task_id(), 'assigned_to': ctx.inspector(),
+                                    'assigned_by': 'Benchmark'}}),
+        Route('auto_assign_dry_run', 'tracker.auto_assign_tasks', 'POST', lambda ctx: '/api/tasks/auto-assign',
+              lambda ctx: {'json': {'dry_run': True, 'limit': 1000}}),
+        Route('recompute_due_dates', 'tracker.recompute_task_due_dates', 'POST',
+              lambda ctx: '/api/tasks/due-dates/recompute',
+              lambda ctx: {'json': {'task_ids': [ctx.task_id() for _ in range(100)]}}),
+        Route('link_tasks', 'tracker.link_entity_tasks', 'POST',
+              lambda ctx: f'/api/employees/{ctx.employee_row_id}/tasks',
+              lambda ctx: {'json': {'task_ids': [ctx.task_id() for _ in range(50)],
+                                    'relationship_type': 'inspector'}}),
+        Route('linked_tasks', 'tracker.get_linked_tasks', 'GET',
+              lambda ctx: f'/api/employees/{ctx.employee_row_id}/tasks?per_page=50'),
+        Route('task_links', 'tracker.get_task_links', 'GET', lambda ctx: f'/api/tasks/{ctx.task_id()}/employees'),
+        Route('unlink_tasks', 'tracker.unlink_entity_tasks', 'DELETE',
+              lambda ctx: f'/api/employees/{ctx.employee_row_id}/tasks',
+              lambda ctx: {'json': {'task_ids': [ctx.task_id() for _ in range(50)]}}),
+        Route('generate_report', 'tracker.generate_progress_report', 'POST', lambda ctx: '/api/reports/generate',
+              lambda ctx: {'json': {'generated_by': 'Benchmark'}}),
+        Route('upload_scope', 'tracker.upload_scope_enhanced', 'POST', lambda ctx: '/api/scope/upload',
+              lambda ctx: {'data': {'file': (io.BytesIO(ctx.fresh_workbook()), 'benchmark_scope.xlsx'),
+                                    'uploaded_by': 'Benchmark'},
+                           'content_type': 'multipart/form-data'},
+              lambda ctx, response: ctx.upload_ids.append(response.get_json().get('upload_id'))),
+        Route('upload_scope_duplicate', 'tracker.upload_scope_enhanced', 'POST', lambda ctx: '/api/scope/upload',
+              lambda ctx: {'data': {'file': (io.BytesIO(upload_bytes), 'benchmark_scope.xlsx'),
+                                    'uploaded_by': 'Benchmark'},
+                           'content_type': 'multipart/form-data'}),
+        Route('scope_validation', 'tracker.scope_validation_report', 'GET',
+              lambda ctx: f'/api/scope/{ctx.rng.choice(ctx.upload_ids or [1])}/validation'),
+        Route('review_scope', 'tracker.review_scope', 'PUT',
+              lambda ctx: f'/api/scope/review/{ctx.rng.choice(ctx.upload_ids or [1])}',
+              lambda ctx: {'json': {'status': 'approved', 'reviewer': 'Benchmark'}}),
+        Route('start_attachment_upload', 'tracker.start_attachment_upload', 'POST',
+              lambda ctx: '/api/attachments/uploads',
+              lambda ctx: {'json': {'filename': 'benchmark.jpg', 'size': len(attachment_bytes),
+                                    'content_type': 'image/jpeg', 'task_id': ctx.task_id()}},
+              lambda ctx, response: ctx.attachment_uploads.append(response.get_json()['upload']['upload_id'])),
+        Route('attachment_upload_status', 'tracker.attachment_upload_status', 'GET',
+              lambda ctx: f'/api/attachments/uploads/{ctx.rng.choice(ctx.attachment_uploads)}'),
+        Route('append_attachment_chunk', 'tracker.append_attachment_chunk', 'PUT',
+              lambda ctx: f'/api/attachments/uploads/{ctx.take(ctx.attachment_uploads, "append_attachment_chunk")}'
+                          f'?offset=0',
+              lambda ctx: {'data': attachment_bytes},
+              lambda ctx, response: ctx.filled_uploads.append(response.get_json()['upload_id'])),
+        Route('complete_attachment_upload', 'tracker.complete_attachment_upload', 'POST',
+              lambda ctx: f'/api/attachments/uploads/{ctx.take(ctx.filled_uploads, "complete_attachment_upload")}'
+                          f'/complete',
+              after=lambda ctx, response: ctx.attachment_ids.append(response.get_json()['attachment']['id'])),
+        Route('get_attachments', 'tracker.get_attachments', 'GET',
+              lambda ctx: f'/api/attachments?task_id={ctx.task_id()}'),
+        Route('download_attachment', 'tracker.download_attachment', 'GET',
+              lambda ctx: f'/api/attachments/{ctx.rng.choice(ctx.attachment_ids)}'),
+        Route('download_attachment_thumbnail', 'tracker.download_attachment_thumbnail', 'GET',
+              lambda ctx: f'/api/attachments/{ctx.rng.choice(ctx.attachment_ids)}/thumbnail'),
+        Route('remove_attachment', 'tracker.remove_attachment', 'DELETE',
+              lambda ctx: f'/api/attachments/{ctx.take(ctx.attachment_ids, "remove_attachment")}'),
+        Route('due_alerts', 'due_alert_status', 'GET', lambda ctx: '/api/alerts/due'),
+        Route('due_alert_sweep', 'due_alert_sweep', 'POST', lambda ctx: '/api/alerts/due/sweep'),
+        Route('archive_status', 'task_archive_status', 'GET', lambda ctx: '/api/tasks/archive'),
+        # A cutoff past every task: the scan is timed, but no task leaves the routes above
+        Route('archive_run', 'task_archive_run', 'POST', lambda ctx: '/api/tasks/archive',
+              lambda ctx: {'json': {'after_days': 36500}}),
+        Route('lookup_inspectors', 'tracker.get_inspectors', 'GET', lambda ctx: '/api/lookups/inspectors'),
+        Route('lookup_sites', 'tracker.get_sites', 'GET', lambda ctx: '/api/lookups/sites'),
+        Route('lookup_methods', 'tracker.get_methods', 'GET', lambda ctx: '/api/lookups/methods'),
+        Route('lookup_status_types', 'tracker.get_status_types', 'GET', lambda ctx: '/api/lookups/status-types'),
+        Route('maintenance_status', 'maintenance_status', 'GET', lambda ctx: '/api/maintenance'),
+        Route('maintenance_analyze', 'maintenance_run', 'POST', lambda ctx: '/api/maintenance/run?task=analyze'),
+        Route('slow_queries', 'slow_queries', 'GET', lambda ctx: '/api/debug/slow-queries?limit=20'),
+        Route('metrics', 'metrics', 'GET', lambda ctx: '/api/metrics')
+    ]
+
+
+def uncovered_endpoints(app, routes):
+    """Endpoints of the app that no route entry exercises"""
+    covered = {route.endpoint for route in routes} | UNTIMED_ENDPOINTS
+    return sorted({rule.endpoint for rule in app.url_map.iter_rules()} - covered)
+
+
+class HttpResponse:
+    """The parts of a test-client response the benchmark reads, over real HTTP"""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self._response = response
+
+    def get_data(self):
+        return self._response.content
+
+    def get_json(self):
+        return self._response.json()
+
+
+class HttpClient:
+    """Sends the benchmark's test-client style requests to a running server"""
+
+    def __init__(self, base_url):
+        try:
+            import requests
+        except ImportError:
+            raise SystemExit('--base-url needs the requests package (pip install requests)')
+        self._requests = requests
+        self.base_url = base_url.rstrip('/')
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        return session
+
+    def open(self, url, method='GET', json=None, data=None, content_type=None, headers=None):
+        files = None
+        if data and content_type == 'multipart/form-data':
+            files = {key: (value[1], value[0]) for key, value in data.items() if isinstance(value, tuple)}
+            data = {key: value for key, value in data.items() if not isinstance(value, tuple)}
+        response = self._session().request(method, self.base_url + url, json=json, data=data, files=files,
+                                          headers=headers)
+        return HttpResponse(response)
+
+
+def run_route(client, ctx, route, iterations, warmup, concurrency=1):
+    """Time route; raises BenchmarkError on the first non-2xx response rather than timing errors"""
+    name, _, method, path, kwargs, after, serial = route
+    if serial:
+        concurrency = 1
+
+    def next_request():
+        request_kwargs = kwargs(ctx) if kwargs else {}
+        return path(ctx), request_kwargs
+
+    def send(spec):
+        url, request_kwargs = spec
+        started = time.perf_counter()
+        response = client.open(url, method=method, headers=ctx.headers, **request_kwargs)
+        body = response.get_data()
+        elapsed = time.perf_counter() - started
+        if not 200 <= response.status_code < 300:
+            raise BenchmarkError(f'{name}: {method} {url} returned {response.status_code}: {body[:300]!r}')
+        if after:
+            after(ctx, response)
+        return elapsed, len(body)
+
+    for _ in range(warmup):
+        send(next_request())
+
+    if concurrency > 1:
+        # Requests are drawn up front so the seeded parameters match a sequential run
+        specs = [next_request() for _ in range(iterations)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(send, specs))
+        wall = time.perf_counter() - started
+    else:
+        samples = [send(next_request()) for _ in range(iterations)]
+
+    timings = sorted(elapsed for elapsed, _ in samples)
+    response_bytes = sum(size for _, size in samples)
+    total = sum(timings)
+    elapsed_total = wall if concurrency > 1 else total
+    return {
+        'method': method,
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'mean_ms': round(total / len(timings) * 1000, 3),
+        'throughput_rps': round(len(timings) / elapsed_total, 2) if elapsed_total else None,
+        'avg_response_bytes': response_bytes // len(timings)
+    }
+
+
+def run_routes(client, ctx, routes, iterations, warmup, only, concurrency):
+    results = {}
+    for route in routes:
+        if only and route.name not in only:
+            continue
+        print(f"Benchmarking {route.name}...")
+        results[route.name] = run_route(client, ctx, route, iterations, warmup, concurrency)
+    return results
+
+
+def run_benchmark(database, iterations=20, warmup=2, seed=7, upload_rows=500, only=None,
+                  base_url=None, concurrency=1, employee_id=DEFAULT_EMPLOYEE):
+    """Benchmark through the test client on a copy of database, or against a running server.
+    
+    With base_url the requests go over HTTP to a server that should be
+    serving (a copy of) database, which is only read to draw parameters;
+    write routes change the server's data.
+    """
+    summary = {
+        'git_commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'database': os.path.abspath(database),
+        'target': base_url or 'test-client',
+        'concurrency': concurrency,
+        'iterations': iterations
+    }
+
+    from app import create_app, init_db
+    from maintenance import scheduler
+
+    routes = build_routes(scope_workbook(upload_rows, seed), attachment_image())
+    # create_app does not touch the database, so the route table can be read in either mode
+    missing = uncovered_endpoints(create_app({'DATABASE': database}), routes)
+    if missing:
+        raise BenchmarkError(f'No benchmark route for endpoints: {", ".join(missing)}')
+
+    if base_url:
+        ctx = BenchmarkContext(database, seed, upload_rows, employee_id)
+        results = run_routes(HttpClient(base_url), ctx, routes, iterations, warmup, only, concurrency)
+        return dict(summary, tasks=ctx.task_count, routes=results)
+
+    workdir = tempfile.mkdtemp(prefix='acuren_bench_')
+    try:
+        working_copy = os.path.join(workdir, 'benchmark.db')
+        copy_database(database, working_copy)
+        app = create_app({'DATABASE': working_copy, 'UPLOAD_FOLDER': workdir,
+                          'ATTACHMENT_FOLDER': os.path.join(workdir, 'attachments'), 'AUTHORIZATION': 'enforce'})
+        # Bring databases generated by older commits up to the current schema
+        init_db(working_copy)
+        add_benchmark_employee(working_copy, employee_id)
+
+        ctx = BenchmarkContext(working_copy, seed, upload_rows, employee_id)
+        results = run_routes(app.test_client(), ctx, routes, iterations, warmup, only, concurrency)
+        return dict(summary, tasks=ctx.task_count, routes=results)
+    finally:
+        # maintenance_analyze only queues its run; let it finish before the copy goes
+        scheduler.drain()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(baseline, current):
+    """Print per-route p50/p95 changes of current relative to baseline"""
+    print(f"{'route':<24} {'p50 base':>10} {'p50 now':>10} {'p95 base':>10} {'p95 now':>10} {'change':>8}")
+    for name, stats in current['routes'].items():
+        base = baseline['routes'].get(name)
+        if not base:
+            continue
+        change = (stats['p50_ms'] - base['p50_ms']) / base['p50_ms'] * 100 if base['p50_ms'] else 0
+        print(f"{name:<24} {base['p50_ms']:>10.2f} {stats['p50_ms']:>10.2f} "
+              f"{base['p95_ms']:>10.2f} {stats['p95_ms']:>10.2f} {change:>7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every API route through the Flask test client')
+    parser.add_argument('database', help='SQLite database to benchmark against (copied first)')
+    parser.add_argument('--base-url', help='Send requests over HTTP to a server running on (a copy of) database')
+    parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight at once per route')
+    parser.add_argument('--iterations', type=int, default=20, help='Measured requests per route')
+    parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per route')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--employee', default=DEFAULT_EMPLOYEE, help='X-Employee-Id sent with every request')
+    parser.add_argument('--upload-rows', type=int, default=500, help='Rows in the uploaded scope workbook')
+    parser.add_argument('--routes', nargs='*', help='Only run these route names')
+    parser.add_argument('--output', help='Write results JSON to this file')
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    args = parser.parse_args()
+
+    try:
+        results = run_benchmark(args.database, args.iterations, args.warmup, args.seed,
+                                args.upload_rows, args.routes, args.base_url, args.concurrency, args.employee)
+    except BenchmarkError as e:
+        raise SystemExit(f'Benchmark failed: {e}')
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            compare(json.load(handle), results)
+
+
+if __name__ == '__main__':
+    main()
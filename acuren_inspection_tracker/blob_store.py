@@ -0,0 +1,111 @@
+"""
+Content-addressed file storage.
+
+Blobs are stored once per SHA-256 digest under root/blobs/ab/cd/<digest>.
+Files are streamed to disk in fixed-size chunks while they are hashed, so
+large uploads never sit in memory in one piece, and land in the store with
+an atomic rename.
+"""
+
+import hashlib
+import os
+import shutil
+import uuid
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class FileTooLarge(ValueError):
+    """Raised when a stream exceeds the allowed number of bytes"""
+
+
+def stream_to_file(stream, path, mode='wb', max_bytes=None, hasher=None, chunk_size=CHUNK_SIZE):
+    """Copy a readable stream to path chunk by chunk; returns the bytes written.
+
+    The hasher, when given, is updated with every chunk. Raises FileTooLarge
+    as soon as more than max_bytes have been read.
+    """
+    written = 0
+    with open(path, mode) as handle:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            written += len(chunk)
+            if max_bytes is not None and written > max_bytes:
+                raise FileTooLarge(f'File exceeds the {max_bytes} byte limit')
+            if hasher is not None:
+                hasher.update(chunk)
+            handle.write(chunk)
+    return written
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """SHA-256 hex digest of a file, read in chunks"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class BlobStore:
+    """Deduplicating store of files keyed by their SHA-256 digest"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        return os.path.join(self.root, 'blobs', digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def temp_path(self, name=None):
+        """A path in the store's temp folder, on the same filesystem as the blobs"""
+        folder = os.path.join(self.root, 'tmp')
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, name or uuid.uuid4().hex)
+
+    def put(self, source_path, digest):
+        """Move a file whose digest is known into the store.
+
+        Returns False when the blob was already stored, in which case the
+        source file is removed instead.
+        """
+        destination = self.path(digest)
+        if os.path.exists(destination):
+            os.remove(source_path)
+            return False
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(source_path, destination)
+        return True
+
+    def link(self, source_path, digest):
+        """Add a file whose digest is known to the store, leaving the source in place.
+
+        Hard-links where the filesystem allows it and copies otherwise.
+        Returns False when the blob was already stored.
+        """
+        destination = self.path(digest)
+        if os.path.exists(destination):
+            return False
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.link(source_path, destination)
+        except FileExistsError:
+            return False
+        except OSError:
+            temp = self.temp_path()
+            shutil.copyfile(source_path, temp)
+            os.replace(temp, destination)
+        return True
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
@@ -1,274 +1,224 @@
 #!/usr/bin/env python3
 """
 Complete database schema implementation based on the provided data model
+
+The tables are created by the migration runner (migrations.py) alongside
+the tracker's own, so this script never drops or recreates anything.
 """
 
 import sqlite3
 from datetime import datetime
 
-def create_complete_schema():
-    """Create the complete database schema matching the data model"""
-    
-    conn = sqlite3.connect('inspection_tracker.db')
+# Tables of the data model beyond the tracker's own. inspection_tasks is the
+# id-keyed table of lookup_encoding, and notifications the tracker's table
+# widened with the data model's columns below.
+DATA_MODEL_TABLES_SQL = [
+    # Employee
+    '''
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id TEXT UNIQUE,
+        first_name TEXT,
+        last_name TEXT,
+        email TEXT,
+        role_id INTEGER,
+        department TEXT,
+        active BOOLEAN DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (role_id) REFERENCES roles (id)
+    )
+    ''',
+    # Role
+    '''
+    CREATE TABLE IF NOT EXISTS roles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        role_name TEXT UNIQUE,
+        description TEXT,
+        permissions TEXT, -- JSON string of permissions
+        active BOOLEAN DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Inspection Scope
+    '''
+    CREATE TABLE IF NOT EXISTS inspection_scopes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scope_name TEXT,
+        description TEXT,
+        site_id INTEGER,
+        created_by INTEGER,
+        status TEXT DEFAULT 'draft',
+        start_date DATE,
+        end_date DATE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (site_id) REFERENCES site_records (id),
+        FOREIGN KEY (created_by) REFERENCES employees (id)
+    )
+    ''',
+    # Inspection Record
+    '''
+    CREATE TABLE IF NOT EXISTS inspection_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER,
+        inspector_id INTEGER,
+        inspection_date DATE,
+        findings TEXT,
+        recommendations TEXT,
+        photos TEXT, -- JSON array of photo paths
+        documents TEXT, -- JSON array of document paths
+        status TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (task_id) REFERENCES inspection_tasks (id),
+        FOREIGN KEY (inspector_id) REFERENCES employees (id)
+    )
+    ''',
+    # Connection Method
+    '''
+    CREATE TABLE IF NOT EXISTS connection_methods (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        method_name TEXT UNIQUE,
+        description TEXT,
+        category TEXT,
+        active BOOLEAN DEFAULT 1
+    )
+    ''',
+    # Site Record
+    '''
+    CREATE TABLE IF NOT EXISTS site_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        site_code TEXT UNIQUE,
+        site_name TEXT,
+        location TEXT,
+        manager_id INTEGER,
+        active BOOLEAN DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (manager_id) REFERENCES employees (id)
+    )
+    ''',
+    # Time Interval
+    '''
+    CREATE TABLE IF NOT EXISTS time_intervals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        interval_name TEXT UNIQUE,
+        interval_value INTEGER,
+        interval_unit TEXT, -- days, weeks, months, years
+        description TEXT
+    )
+    ''',
+    # Service Status
+    '''
+    CREATE TABLE IF NOT EXISTS service_status (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        status_name TEXT UNIQUE,
+        description TEXT,
+        color_code TEXT,
+        active BOOLEAN DEFAULT 1
+    )
+    ''',
+    # Frequency Record
+    '''
+    CREATE TABLE IF NOT EXISTS frequency_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        frequency_value REAL,
+        frequency_unit TEXT,
+        description TEXT
+    )
+    ''',
+    # Inspector Record
+    '''
+    CREATE TABLE IF NOT EXISTS inspector_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id INTEGER,
+        certification_level TEXT,
+        specializations TEXT, -- JSON array
+        active BOOLEAN DEFAULT 1,
+        last_training_date DATE,
+        next_training_due DATE,
+        FOREIGN KEY (employee_id) REFERENCES employees (id)
+    )
+    ''',
+    # Inspection Task and Employee Join
+    '''
+    CREATE TABLE IF NOT EXISTS inspection_task_employee_join (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER,
+        employee_id INTEGER,
+        relationship_type TEXT, -- assigned, reviewed, approved, etc.
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (task_id) REFERENCES inspection_tasks (id),
+        FOREIGN KEY (employee_id) REFERENCES employees (id)
+    )
+    ''',
+    # Inspection Task and Notification Join
+    '''
+    CREATE TABLE IF NOT EXISTS inspection_task_notification_join (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER,
+        notification_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (task_id) REFERENCES inspection_tasks (id),
+        FOREIGN KEY (notification_id) REFERENCES notifications (id)
+    )
+    ''',
+    # Inspection Task and Role Join
+    '''
+    CREATE TABLE IF NOT EXISTS inspection_task_role_join (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER,
+        role_id INTEGER,
+        access_level TEXT, -- read, write, approve, etc.
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (task_id) REFERENCES inspection_tasks (id),
+        FOREIGN KEY (role_id) REFERENCES roles (id)
+    )
+    ''',
+    # Inspection Task and Inspection Scope Join
+    '''
+    CREATE TABLE IF NOT EXISTS inspection_task_inspection_scope_join (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER,
+        scope_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (task_id) REFERENCES inspection_tasks (id),
+        FOREIGN KEY (scope_id) REFERENCES inspection_scopes (id)
+    )
+    '''
+]
+
+# Data model columns added to the tracker's notifications table
+NOTIFICATION_COLUMNS = {
+    'recipient_id': 'INTEGER REFERENCES employees (id)',
+    'sender_id': 'INTEGER REFERENCES employees (id)',
+    'priority': "TEXT DEFAULT 'normal'"
+}
+
+def create_data_model_tables(conn):
+    """Create the data model tables that are missing and widen notifications, keeping all data"""
     cursor = conn.cursor()
+    for statement in DATA_MODEL_TABLES_SQL:
+        cursor.execute(statement)
     
-    # Drop existing tables to recreate with proper schema
-    tables_to_drop = [
-        'inspection_task_inspection_scope_join',
-        'inspection_task_role_join', 
-        'inspection_task_notification_join',
-        'inspection_task_employee_join',
-        'inspection_tasks',
-        'employees',
-        'notifications',
-        'roles',
-        'inspection_scopes',
-        'inspection_records',
-        'connection_methods',
-        'site_records',
-        'time_intervals',
-        'service_status',
-        'frequency_records',
-        'inspector_records'
-    ]
-    
-    for table in tables_to_drop:
-        cursor.execute(f'DROP TABLE IF EXISTS {table}')
-    
-    print("Creating complete database schema...")
-    
-    # 1. Inspection Task (Main entity)
-    cursor.execute('''
-        CREATE TABLE inspection_tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            site TEXT,
-            site_project TEXT,
-            hierarchy_item_name TEXT,
-            description TEXT,
-            mechanism TEXT,
-            method TEXT,
-            extent TEXT,
-            frequency REAL,
-            interval_type TEXT,
-            inspection_priority INTEGER,
-            last_inspection_date DATE,
-            install_date DATE,
-            due_date DATE,
-            current_inspection_date DATE,
-            inspector TEXT,
-            status TEXT,
-            comments TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 2. Employee
-    cursor.execute('''
-        CREATE TABLE employees (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            employee_id TEXT UNIQUE,
-            first_name TEXT,
-            last_name TEXT,
-            email TEXT,
-            role_id INTEGER,
-            department TEXT,
-            active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (role_id) REFERENCES roles (id)
-        )
-    ''')
-    
-    # 3. Notification
-    cursor.execute('''
-        CREATE TABLE notifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            recipient_id INTEGER,
-            sender_id INTEGER,
-            message TEXT,
-            notification_type TEXT,
-            read_status BOOLEAN DEFAULT 0,
-            priority TEXT DEFAULT 'normal',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (recipient_id) REFERENCES employees (id),
-            FOREIGN KEY (sender_id) REFERENCES employees (id)
-        )
-    ''')
-    
-    # 4. Role
-    cursor.execute('''
-        CREATE TABLE roles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            role_name TEXT UNIQUE,
-            description TEXT,
-            permissions TEXT, -- JSON string of permissions
-            active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # 5. Inspection Scope
-    cursor.execute('''
-        CREATE TABLE inspection_scopes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            scope_name TEXT,
-            description TEXT,
-            site_id INTEGER,
-            created_by INTEGER,
-            status TEXT DEFAULT 'draft',
-            start_date DATE,
-            end_date DATE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (site_id) REFERENCES site_records (id),
-            FOREIGN KEY (created_by) REFERENCES employees (id)
-        )
-    ''')
-    
-    # 6. Inspection Record
-    cursor.execute('''
-        CREATE TABLE inspection_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER,
-            inspector_id INTEGER,
-            inspection_date DATE,
-            findings TEXT,
-            recommendations TEXT,
-            photos TEXT, -- JSON array of photo paths
-            documents TEXT, -- JSON array of document paths
-            status TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (task_id) REFERENCES inspection_tasks (id),
-            FOREIGN KEY (inspector_id) REFERENCES employees (id)
-        )
-    ''')
-    
-    # 7. Connection Method
-    cursor.execute('''
-        CREATE TABLE connection_methods (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            method_name TEXT UNIQUE,
-            description TEXT,
-            category TEXT,
-            active BOOLEAN DEFAULT 1
-        )
-    ''')
-    
-    # 8. Site Record
-    cursor.execute('''
-        CREATE TABLE site_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            site_code TEXT UNIQUE,
-            site_name TEXT,
-            location TEXT,
-            manager_id INTEGER,
-            active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (manager_id) REFERENCES employees (id)
-        )
-    ''')
-    
-    # 9. Time Interval
-    cursor.execute('''
-        CREATE TABLE time_intervals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            interval_name TEXT UNIQUE,
-            interval_value INTEGER,
-            interval_unit TEXT, -- days, weeks, months, years
-            description TEXT
-        )
-    ''')
-    
-    # 10. Service Status
-    cursor.execute('''
-        CREATE TABLE service_status (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            status_name TEXT UNIQUE,
-            description TEXT,
-            color_code TEXT,
-            active BOOLEAN DEFAULT 1
-        )
-    ''')
-    
-    # 11. Frequency Record
-    cursor.execute('''
-        CREATE TABLE frequency_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            frequency_value REAL,
-            frequency_unit TEXT,
-            description TEXT
-        )
-    ''')
-    
-    # 12. Inspector Record
-    cursor.execute('''
-        CREATE TABLE inspector_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            employee_id INTEGER,
-            certification_level TEXT,
-            specializations TEXT, -- JSON array
-            active BOOLEAN DEFAULT 1,
-            last_training_date DATE,
-            next_training_due DATE,
-            FOREIGN KEY (employee_id) REFERENCES employees (id)
-        )
-    ''')
-    
-    # Join Tables
-    
-    # 13. Inspection Task and Employee Join
-    cursor.execute('''
-        CREATE TABLE inspection_task_employee_join (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER,
-            employee_id INTEGER,
-            relationship_type TEXT, -- assigned, reviewed, approved, etc.
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (task_id) REFERENCES inspection_tasks (id),
-            FOREIGN KEY (employee_id) REFERENCES employees (id)
-        )
-    ''')
-    
-    # 14. Inspection Task and Notification Join
-    cursor.execute('''
-        CREATE TABLE inspection_task_notification_join (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER,
-            notification_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (task_id) REFERENCES inspection_tasks (id),
-            FOREIGN KEY (notification_id) REFERENCES notifications (id)
-        )
-    ''')
-    
-    # 15. Inspection Task and Role Join
-    cursor.execute('''
-        CREATE TABLE inspection_task_role_join (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER,
-            role_id INTEGER,
-            access_level TEXT, -- read, write, approve, etc.
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (task_id) REFERENCES inspection_tasks (id),
-            FOREIGN KEY (role_id) REFERENCES roles (id)
-        )
-    ''')
-    
-    # 16. Inspection Task and Inspection Scope Join
-    cursor.execute('''
-        CREATE TABLE inspection_task_inspection_scope_join (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER,
-            scope_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (task_id) REFERENCES inspection_tasks (id),
-            FOREIGN KEY (scope_id) REFERENCES inspection_scopes (id)
-        )
-    ''')
-    
-    conn.commit()
-    print("Database schema created successfully!")
-    
-    return conn
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(notifications)').fetchall()]
+    for column, definition in NOTIFICATION_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE notifications ADD COLUMN {column} {definition}')
+
+# Roles and the permissions authorization.py checks; seeded by migration
+ROLES = [
+    ('Inspection Manager', 'Manager responsible for overseeing all inspection activities', '["view_all", "assign_tasks", "generate_reports", "manage_users"]'),
+    ('Analyst', 'Employee reviewing scope, validating data, and monitoring progress', '["view_tasks", "review_scope", "update_status", "generate_analytics"]'),
+    ('Scope Builder', 'Employee preparing inspection scopes', '["upload_scope", "create_scope", "view_tasks"]'),
+    ('Field Inspector', 'Employee performing inspections', '["claim_tasks", "update_status", "upload_results", "view_assigned"]')
+]
+
+def seed_roles(conn):
+    """Add the ROLES that are missing; existing roles keep their permissions"""
+    cursor = conn.cursor()
+    for role_name, description, permissions in ROLES:
+        cursor.execute('''
+            INSERT OR IGNORE INTO roles (role_name, description, permissions)
+            VALUES (?, ?, ?)
+        ''', (role_name, description, permissions))
 
 def populate_lookup_data(conn):
     """Populate lookup tables with initial data"""
@@ -277,18 +227,7 @@ def populate_lookup_data(conn):
     print("Populating lookup data...")
     
     # Roles
-    roles = [
-        ('Inspection Manager', 'Manager responsible for overseeing all inspection activities', '["view_all", "assign_tasks", "generate_reports", "manage_users"]'),
-        ('Analyst', 'Employee reviewing scope, validating data, and monitoring progress', '["view_tasks", "review_scope", "update_status", "generate_analytics"]'),
-        ('Scope Builder', 'Employee preparing inspection scopes', '["upload_scope", "create_scope", "view_tasks"]'),
-        ('Field Inspector', 'Employee performing inspections', '["claim_tasks", "update_status", "upload_results", "view_assigned"]')
-    ]
-    
-    for role_name, description, permissions in roles:
-        cursor.execute('''
-            INSERT OR IGNORE INTO roles (role_name, description, permissions)
-            VALUES (?, ?, ?)
-        ''', (role_name, description, permissions))
+    seed_roles(conn)
     
     # Connection Methods
     methods = [
@@ -408,8 +347,12 @@ def migrate_existing_data(conn):
     conn.commit()
 
 if __name__ == '__main__':
+    from migrations import migrate
+    
     print("Creating complete database schema...")
-    conn = create_complete_schema()
+    conn = sqlite3.connect('inspection_tracker.db')
+    migrate(conn, verbose=True)
+    print("Database schema created successfully!")
     populate_lookup_data(conn)
     migrate_existing_data(conn)
     conn.close()
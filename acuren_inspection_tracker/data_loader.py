@@ -5,14 +5,73 @@ Data loader script to populate the Acuren Inspection database with real Excel da
 
 import pandas as pd
 import sqlite3
+import argparse
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import os
+from blob_store import hash_file
+from hierarchy import index_new_tasks
+from lookup_encoding import intern_names
+from maintenance import run_maintenance
+from migrations import migrate
+from scope_files import find_duplicate
+
+# Workbook sheet holding the tracker rows, and its columns mapped to inspection_tasks
+SCOPE_SHEET = 'All Units Ext Scope Data'
+SCOPE_COLUMNS = [
+    ('Site', 'site'),
+    ('Site & Project', 'site_project'),
+    ('Hierarchy Item Name', 'hierarchy_item_name'),
+    ('Description', 'description'),
+    ('Mechanism', 'mechanism'),
+    ('Method', 'method'),
+    ('Extent', 'extent'),
+    ('Frequency', 'frequency'),
+    ('Interval', 'interval_type'),
+    ('Insp Priority', 'inspection_priority'),
+    ('Last Inspection Date', 'last_inspection_date'),
+    ('Install Date', 'install_date'),
+    ('Due Date', 'due_date'),
+    ('Current Insp Date', 'current_inspection_date'),
+    ('Inspector', 'inspector'),
+    ('Status', 'status'),
+    ('Comments', 'comments')
+]
+
+# Dropdown sheets and the column holding their values
+LOOKUP_SHEETS = [
+    ('Inspectors', 'Inspectors'),
+    ('Site', 'Site'),
+    ('Method', 'Method'),
+    ('Status', 'Status Type'),
+    ('Inspection Priority', 'Inspection Priority'),
+    ('Interval', 'Interval'),
+    ('Frequency', 'Frequency')
+]
+
+# Tracker columns stored as lookup ids in inspection_tasks
+ENCODED_COLUMNS = {
+    'site': 'site_id',
+    'method': 'method_id',
+    'inspector': 'inspector_id',
+    'status': 'status_id'
+}
+DATE_COLUMNS = ['last_inspection_date', 'install_date', 'due_date', 'current_inspection_date']
+TASK_INSERT_COLUMNS = [ENCODED_COLUMNS.get(column, column) for _, column in SCOPE_COLUMNS]
+
+# Dropdown sheets interned into lookup tables by the bulk ingest, by tracker field
+LOOKUP_SHEET_FIELDS = {'Inspectors': 'inspector', 'Site': 'site', 'Method': 'method', 'Status': 'status'}
+INGEST_BATCH_SIZE = 5000
+INGEST_EXTENSIONS = ('.xlsx', '.xls', '.csv')
 
 def load_excel_data():
     """Load and process the Excel data"""
     try:
         # Read the main data sheet
-        df_main = pd.read_excel('AllUnitsEXTTracker.xlsx', sheet_name='All Units Ext Scope Data')
+        df_main = pd.read_excel('AllUnitsEXTTracker.xlsx', sheet_name=SCOPE_SHEET)
         
         # Read dropdown sheets
         df_inspectors = pd.read_excel('AllUnitsEXTTracker.xlsx', sheet_name='Inspectors')
@@ -39,6 +98,11 @@ def load_excel_data():
 
 def clean_data(df):
     """Clean and prepare the main data"""
+    # Uploaded scopes may omit columns; treat them as empty
+    missing = [header for header, _ in SCOPE_COLUMNS if header not in df.columns]
+    if missing:
+        df = df.assign(**{header: None for header in missing})
+    
     # Replace NaN values with appropriate defaults
     df = df.fillna({
         'Site': '',
@@ -68,6 +132,214 @@ def clean_data(df):
     
     return df
 
+def normalize_task_frame(df):
+    """Clean a tracker sheet into inspection_tasks columns, lookup fields still as names.
+    
+    Needs no database, so it can run in a parser process.
+    """
+    df = clean_data(df)
+    columns = {}
+    for header, column in SCOPE_COLUMNS:
+        series = df[header]
+        if column in ENCODED_COLUMNS:
+            columns[column] = series.astype(str).str.strip()
+        elif column in DATE_COLUMNS:
+            columns[column] = series.dt.strftime('%Y-%m-%d')
+        elif column == 'inspection_priority':
+            columns[column] = series.astype('Int64')
+        elif column == 'frequency':
+            columns[column] = series.astype(float)
+        else:
+            columns[column] = series.astype(str)
+    return pd.DataFrame(columns)
+
+def encode_task_frame(conn, frame):
+    """Encode a normalized frame into inspection_tasks rows.
+    
+    Site, method, inspector and status names are interned into their lookup
+    tables once per distinct value and mapped to ids column-wise.
+    """
+    columns = {}
+    for column in frame.columns:
+        series = frame[column]
+        if column in ENCODED_COLUMNS:
+            mapping = intern_names(conn, column, series.unique().tolist())
+            series = series.map(mapping).astype('Int64')
+        columns[column] = series
+    
+    frame = pd.DataFrame(columns).astype(object)
+    frame = frame.where(pd.notna(frame), None)
+    return list(frame.itertuples(index=False, name=None))
+
+def build_task_records(conn, df):
+    """Clean a tracker sheet and encode it into inspection_tasks rows"""
+    return encode_task_frame(conn, normalize_task_frame(df))
+
+def insert_task_records(conn, records, upload_id=None):
+    """Bulk insert encoded rows, tagged with the scope upload that created them when given.
+    
+    The new tasks are mapped into the asset hierarchy in the same transaction.
+    """
+    columns = TASK_INSERT_COLUMNS
+    if upload_id is not None:
+        columns = columns + ['upload_id']
+        records = [record + (upload_id,) for record in records]
+    conn.executemany('''
+        INSERT INTO inspection_tasks ({})
+        VALUES ({})
+    '''.format(', '.join(columns), ', '.join('?' for _ in columns)), records)
+    index_new_tasks(conn)
+    return len(records)
+
+def insert_tasks(conn, df, upload_id=None):
+    """Bulk insert a tracker sheet into inspection_tasks; returns the row count"""
+    return insert_task_records(conn, build_task_records(conn, df), upload_id)
+
+def parse_file(path, batch_size=INGEST_BATCH_SIZE):
+    """Parser process: read and normalize one tracker file without touching the database.
+    
+    The workbook is opened once and its dropdown and scope sheets read from
+    it, since every open re-reads the shared strings of the whole file.
+    Returns the lookup names per field, lookup sheets that could not be
+    read, and the normalized rows split into batches.
+    """
+    lookups = []
+    lookup_errors = []
+    if path.lower().endswith('.csv'):
+        df = pd.read_csv(path)
+    else:
+        with pd.ExcelFile(path) as workbook:
+            df = workbook.parse(SCOPE_SHEET)
+            for sheet, header in LOOKUP_SHEETS:
+                if sheet not in LOOKUP_SHEET_FIELDS:
+                    continue
+                try:
+                    names = workbook.parse(sheet)[header].dropna().astype(str).str.strip()
+                except (ValueError, KeyError) as e:
+                    lookup_errors.append((sheet, str(e)))
+                    continue
+                lookups.append((LOOKUP_SHEET_FIELDS[sheet], names.unique().tolist()))
+    
+    frame = normalize_task_frame(df)
+    return {
+        'lookups': lookups,
+        'lookup_errors': lookup_errors,
+        'rows': len(frame),
+        'batches': [frame.iloc[start:start + batch_size] for start in range(0, len(frame), batch_size)]
+    }
+
+def _parsed_in_order(paths, workers, batch_size):
+    """Yield (path, parsed, error) in input order while up to 2 * workers files parse ahead"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        paths = iter(paths)
+        while True:
+            while len(pending) < workers * 2:
+                path = next(paths, None)
+                if path is None:
+                    break
+                pending.append((path, executor.submit(parse_file, path, batch_size)))
+            if not pending:
+                return
+            path, future = pending.popleft()
+            try:
+                yield path, future.result(), None
+            except Exception as e:
+                yield path, None, e
+
+def write_file(conn, path, parsed, content_hash, uploaded_by):
+    """Writer: intern a file's lookup names and insert its rows as one scope upload.
+    
+    Returns (upload_id, rows inserted), or the earlier upload of the same
+    file as (upload_id, None).
+    """
+    for field, names in parsed['lookups']:
+        intern_names(conn, field, names)
+    
+    # An identical file earlier in this run
+    duplicate = find_duplicate(conn, content_hash)
+    if duplicate:
+        conn.commit()
+        return duplicate['upload_id'], None
+    
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO scope_uploads (filename, uploaded_by, records_count, status, content_hash, file_size)
+        VALUES (?, ?, ?, 'processed', ?, ?)
+    ''', (os.path.basename(path), uploaded_by, parsed['rows'], content_hash, os.path.getsize(path)))
+    upload_id = cursor.lastrowid
+    
+    inserted = 0
+    for batch in parsed['batches']:
+        inserted += insert_task_records(conn, encode_task_frame(conn, batch), upload_id)
+    conn.commit()
+    return upload_id, inserted
+
+def ingest_files(paths, database, workers=None, batch_size=INGEST_BATCH_SIZE, uploaded_by='data_loader'):
+    """Parse tracker files in a process pool and write them from this process, in the order given.
+    
+    Files already ingested are recognised by digest and never parsed. Each
+    new file is committed as one scope upload, so a failed file leaves
+    nothing behind; an unreadable dropdown sheet is reported but the file's
+    rows still load. Returns (per-file results, errors), both in input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    conn = sqlite3.connect(database)
+    migrate(conn)
+    
+    results = [None] * len(paths)
+    sheet_errors = [[] for _ in paths]
+    digests = {}
+    try:
+        for index, path in enumerate(paths):
+            try:
+                digests[index] = hash_file(path)
+            except OSError as e:
+                results[index] = {'file': path, 'status': 'failed', 'error': str(e)}
+                continue
+            duplicate = find_duplicate(conn, digests[index])
+            if duplicate:
+                results[index] = {'file': path, 'status': 'duplicate', 'upload_id': duplicate['upload_id']}
+        
+        queued = [index for index, result in enumerate(results) if result is None]
+        parsed_files = _parsed_in_order([paths[index] for index in queued], workers, batch_size)
+        for index, (path, parsed, error) in zip(queued, parsed_files):
+            if error is None:
+                sheet_errors[index] = [{'file': path, 'sheet': sheet, 'error': message}
+                                       for sheet, message in parsed['lookup_errors']]
+                try:
+                    upload_id, inserted = write_file(conn, path, parsed, digests[index], uploaded_by)
+                except Exception as e:
+                    conn.rollback()
+                    error = e
+            if error is not None:
+                results[index] = {'file': path, 'status': 'failed', 'error': str(error)}
+            elif inserted is None:
+                results[index] = {'file': path, 'status': 'duplicate', 'upload_id': upload_id}
+            else:
+                results[index] = {'file': path, 'status': 'processed', 'upload_id': upload_id,
+                                  'records_processed': inserted}
+    finally:
+        conn.close()
+    
+    errors = []
+    for result, file_errors in zip(results, sheet_errors):
+        errors.extend(file_errors)
+        if result['status'] == 'failed':
+            errors.append({'file': result['file'], 'sheet': None, 'error': result['error']})
+    return results, errors
+
+def expand_paths(paths):
+    """Files as given, with directories expanded to their tracker files in name order"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(INGEST_EXTENSIONS) and not name.startswith('~$'))
+        else:
+            files.append(path)
+    return files
+
 def populate_database():
     """Populate the SQLite database with Excel data"""
     
@@ -117,44 +389,9 @@ def populate_database():
         
         print(f"Populated {len(inspectors)} inspectors, {len(sites)} sites, {len(methods)} methods, {len(status_types)} status types")
         
-        # Clean and populate main data
+        # Clean, encode and bulk insert the main data
         print("Processing main inspection data...")
-        df_main = clean_data(data['main_data'])
-        
-        # Insert main data
-        records_inserted = 0
-        for _, row in df_main.iterrows():
-            try:
-                cursor.execute('''
-                    INSERT INTO inspection_tasks 
-                    (site, site_project, hierarchy_item_name, description, mechanism, 
-                     method, extent, frequency, interval_type, inspection_priority,
-                     last_inspection_date, install_date, due_date, current_inspection_date,
-                     inspector, status, comments)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    str(row.get('Site', '')),
-                    str(row.get('Site & Project', '')),
-                    str(row.get('Hierarchy Item Name', '')),
-                    str(row.get('Description', '')),
-                    str(row.get('Mechanism', '')),
-                    str(row.get('Method', '')),
-                    str(row.get('Extent', '')),
-                    float(row.get('Frequency', 0)) if pd.notna(row.get('Frequency')) else None,
-                    str(row.get('Interval', '')),
-                    int(row.get('Insp Priority', 0)) if pd.notna(row.get('Insp Priority')) else None,
-                    row.get('Last Inspection Date').strftime('%Y-%m-%d') if pd.notna(row.get('Last Inspection Date')) else None,
-                    row.get('Install Date').strftime('%Y-%m-%d') if pd.notna(row.get('Install Date')) else None,
-                    row.get('Due Date').strftime('%Y-%m-%d') if pd.notna(row.get('Due Date')) else None,
-                    row.get('Current Insp Date').strftime('%Y-%m-%d') if pd.notna(row.get('Current Insp Date')) else None,
-                    str(row.get('Inspector', 'Unassigned')),
-                    str(row.get('Status', 'UnInitiated')),
-                    str(row.get('Comments', ''))
-                ))
-                records_inserted += 1
-            except Exception as e:
-                print(f"Error inserting row {records_inserted}: {e}")
-                continue
+        records_inserted = insert_tasks(conn, data['main_data'])
         
         # Add sample users
         sample_users = [
@@ -171,14 +408,29 @@ def populate_database():
         conn.commit()
         print(f"Successfully inserted {records_inserted} inspection tasks")
         
+        # The reload rewrote every task: refresh the planner statistics and release the freed pages
+        run_maintenance(conn, ['analyze', 'vacuum'])
+        
         # Print summary statistics
         cursor.execute('SELECT COUNT(*) FROM inspection_tasks')
         total_tasks = cursor.fetchone()[0]
         
-        cursor.execute('SELECT status, COUNT(*) FROM inspection_tasks GROUP BY status')
+        cursor.execute('''
+            SELECT COALESCE(st.status_name, ''), COUNT(*)
+            FROM inspection_tasks t
+            LEFT JOIN status_types st ON st.id = t.status_id
+            GROUP BY t.status_id
+        ''')
         status_counts = cursor.fetchall()
         
-        cursor.execute('SELECT site, COUNT(*) FROM inspection_tasks GROUP BY site ORDER BY COUNT(*) DESC LIMIT 5')
+        cursor.execute('''
+            SELECT COALESCE(s.site_code, ''), COUNT(*)
+            FROM inspection_tasks t
+            LEFT JOIN sites s ON s.id = t.site_id
+            GROUP BY t.site_id
+            ORDER BY COUNT(*) DESC
+            LIMIT 5
+        ''')
         top_sites = cursor.fetchall()
         
         print(f"\nDatabase Summary:")
@@ -195,11 +447,42 @@ def populate_database():
     finally:
         conn.close()
 
-if __name__ == '__main__':
-    print("Starting data loading process...")
-    success = populate_database()
-    if success:
-        print("Data loading completed successfully!")
-    else:
-        print("Data loading failed!")
+def main():
+    parser = argparse.ArgumentParser(description='Load tracker workbooks into the inspection database')
+    parser.add_argument('files', nargs='*',
+                        help='Workbooks or folders to append in parallel; without any, reload AllUnitsEXTTracker.xlsx')
+    parser.add_argument('--database', default='inspection_tracker.db')
+    parser.add_argument('--workers', type=int, help='Parser processes (default: one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help='Rows per insert batch')
+    args = parser.parse_args()
+    
+    if not args.files:
+        print("Starting data loading process...")
+        success = populate_database()
+        if success:
+            print("Data loading completed successfully!")
+        else:
+            print("Data loading failed!")
+        return 0 if success else 1
+    
+    files = expand_paths(args.files)
+    print(f"Ingesting {len(files)} files with {args.workers or os.cpu_count()} parser processes...")
+    started = time.perf_counter()
+    results, errors = ingest_files(files, args.database, args.workers, args.batch_size)
+    elapsed = time.perf_counter() - started
+    
+    for result in results:
+        if result['status'] == 'processed':
+            print(f"{result['file']}: {result['records_processed']} tasks (upload {result['upload_id']})")
+        elif result['status'] == 'duplicate':
+            print(f"{result['file']}: already ingested as upload {result['upload_id']}, skipped")
+    for error in errors:
+        sheet = f" [{error['sheet']}]" if error['sheet'] else ''
+        print(f"ERROR {error['file']}{sheet}: {error['error']}")
+    
+    total = sum(result.get('records_processed', 0) for result in results)
+    print(f"Inserted {total} tasks from {len(files)} files in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)")
+    return 1 if errors else 0
 
+if __name__ == '__main__':
+    sys.exit(main())
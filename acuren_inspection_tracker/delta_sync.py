@@ -0,0 +1,297 @@
+"""
+Change tracking and delta sync of inspection tasks for offline clients.
+
+Every write to inspection_tasks, whichever route or script makes it, stamps
+the row with the next value of a database-wide change sequence via
+triggers; deleted rows leave a tombstone carrying their own sequence value.
+Writes are serialized by SQLite, so a reader that has seen sequence N has
+seen every change up to N, and a client only needs to remember the last
+sequence it received.
+
+Tombstones older than SYNC_TOMBSTONE_DAYS are pruned by the maintenance
+scheduler, which raises the sync horizon to the newest one removed. A
+client whose `since` is below the horizon may have missed deletions, so it
+is sent a full resync instead: every task from sequence 0, flagged with
+full_resync, which it pages through with full=1.
+"""
+
+from lookup_encoding import TASK_FIELDS
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+MAX_PUSH_CHANGES = 500
+ID_BATCH_SIZE = 500
+DEFAULT_TOMBSTONE_DAYS = 90
+
+# Next value of the change sequence, above every live row and tombstone
+NEXT_SEQ_SQL = '''
+    MAX(
+        COALESCE((SELECT MAX(change_seq) FROM inspection_tasks), 0),
+        COALESCE((SELECT MAX(change_seq) FROM task_tombstones), 0)
+    ) + 1
+'''
+
+CHANGE_TRACKING_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS task_tombstones (
+        task_id INTEGER PRIMARY KEY,
+        site_id INTEGER,
+        change_seq INTEGER NOT NULL,
+        deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_task_tombstones_change_seq ON task_tombstones (change_seq)',
+    'CREATE INDEX IF NOT EXISTS idx_inspection_tasks_change_seq ON inspection_tasks (change_seq)',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS inspection_tasks_change_seq_insert
+    AFTER INSERT ON inspection_tasks
+    WHEN NEW.change_seq IS NULL
+    BEGIN
+        UPDATE inspection_tasks SET change_seq = {NEXT_SEQ_SQL} WHERE id = NEW.id;
+        DELETE FROM task_tombstones WHERE task_id = NEW.id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS inspection_tasks_change_seq_update
+    AFTER UPDATE ON inspection_tasks
+    WHEN NEW.change_seq IS OLD.change_seq
+    BEGIN
+        UPDATE inspection_tasks SET change_seq = {NEXT_SEQ_SQL} WHERE id = NEW.id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS inspection_tasks_change_seq_delete
+    AFTER DELETE ON inspection_tasks
+    BEGIN
+        INSERT OR REPLACE INTO task_tombstones (task_id, site_id, change_seq)
+        VALUES (OLD.id, OLD.site_id, {NEXT_SEQ_SQL});
+    END
+    '''
+]
+
+SYNC_HORIZON_SQL = [
+    # One row: the highest sequence whose tombstones may have been pruned
+    '''
+    CREATE TABLE IF NOT EXISTS sync_horizon (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        pruned_through INTEGER NOT NULL
+    )
+    ''',
+    'INSERT OR IGNORE INTO sync_horizon (id, pruned_through) VALUES (1, 0)'
+]
+
+# Existing rows take their id as a starting sequence; run as a batched backfill
+# over id ranges by the migration runner
+CHANGE_SEQ_BACKFILL_SQL = '''
+    UPDATE inspection_tasks SET change_seq = id
+    WHERE id > ? AND id <= ? AND change_seq IS NULL
+'''
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def add_change_seq_column(conn):
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(inspection_tasks)').fetchall()]
+    if 'change_seq' not in columns:
+        conn.execute('ALTER TABLE inspection_tasks ADD COLUMN change_seq INTEGER')
+
+
+def install_change_triggers(conn):
+    """Create the tombstone table, change_seq indexes and the triggers that stamp every write"""
+    cursor = conn.cursor()
+    for statement in CHANGE_TRACKING_SQL:
+        cursor.execute(statement)
+
+
+def create_sync_horizon(conn):
+    cursor = conn.cursor()
+    for statement in SYNC_HORIZON_SQL:
+        cursor.execute(statement)
+
+
+def current_seq(conn):
+    return conn.execute(f'SELECT {NEXT_SEQ_SQL} - 1').fetchone()[0]
+
+
+def sync_horizon(conn):
+    """Sequence up to which tombstones may be gone; a client behind it must resync in full"""
+    row = conn.execute('SELECT pruned_through FROM sync_horizon WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def needs_full_resync(conn, since):
+    return 0 < since < sync_horizon(conn)
+
+
+def oldest_tombstone_days(conn):
+    """Age in days of the oldest tombstone prune_tombstones could remove, or None"""
+    row = conn.execute('''
+        SELECT julianday('now') - julianday(deleted_at) FROM task_tombstones
+        WHERE change_seq < (SELECT MAX(change_seq) FROM task_tombstones)
+        ORDER BY change_seq LIMIT 1
+    ''').fetchone()
+    return row[0] if row else None
+
+
+def prune_tombstones(conn, retention_days=DEFAULT_TOMBSTONE_DAYS):
+    """Delete tombstones older than retention_days and raise the sync horizon past them.
+
+    The newest tombstone is always kept: the sequence continues from the
+    highest live or deleted value, so removing it could hand its value out
+    again. Returns the number removed; the caller commits.
+    """
+    pruned_through = conn.execute('''
+        SELECT MAX(change_seq) FROM task_tombstones
+        WHERE deleted_at < datetime('now', ?)
+          AND change_seq < (SELECT MAX(change_seq) FROM task_tombstones)
+    ''', (f'-{float(retention_days)} days',)).fetchone()[0]
+    if pruned_through is None:
+        return 0
+    removed = conn.execute('DELETE FROM task_tombstones WHERE change_seq <= ?', (pruned_through,)).rowcount
+    conn.execute('UPDATE sync_horizon SET pruned_through = MAX(pruned_through, ?) WHERE id = 1', (pruned_through,))
+    return removed
+
+
+def sync_site_ids(conn, sites=None, inspector=None):
+    """Site ids a client syncs: the named sites, else the inspector's sites, else all (None)"""
+    if sites:
+        placeholders = ', '.join('?' for _ in sites)
+        rows = conn.execute(f'SELECT id FROM sites WHERE site_code IN ({placeholders})', list(sites))
+        return [site_id for (site_id,) in rows]
+    if inspector:
+        rows = conn.execute('''
+            SELECT DISTINCT site_id FROM inspection_tasks
+            WHERE inspector_id = (SELECT id FROM inspectors WHERE name = ?) AND site_id IS NOT NULL
+        ''', (inspector,))
+        return [site_id for (site_id,) in rows]
+    return None
+
+
+def changes_since(conn, since, site_ids=None, limit=DEFAULT_BATCH_SIZE):
+    """One batch of tasks changed and deleted after sequence `since`, in sequence order.
+
+    Returns (tasks, deleted, next_since, has_more); a client passes next_since
+    back as `since` until has_more is false.
+    """
+    limit = max(1, min(int(limit), MAX_BATCH_SIZE))
+    site_filter = ''
+    if site_ids is not None:
+        site_filter = ' AND t.site_id IN ({})'.format(
+            ', '.join(str(int(site_id)) for site_id in site_ids) or '-1')
+
+    fields = ', '.join(f'd.{field}' for field in TASK_FIELDS)
+    task_rows = conn.execute(f'''
+        SELECT {fields}, t.change_seq
+        FROM inspection_tasks t
+        JOIN inspection_task_details d ON d.id = t.id
+        WHERE t.change_seq > ?{site_filter}
+        ORDER BY t.change_seq
+        LIMIT ?
+    ''', (since, limit + 1)).fetchall()
+    deleted_rows = conn.execute(f'''
+        SELECT t.task_id, t.change_seq
+        FROM task_tombstones t
+        WHERE t.change_seq > ?{site_filter}
+        ORDER BY t.change_seq
+        LIMIT ?
+    ''', (since, limit + 1)).fetchall()
+
+    # Merge both streams by sequence and cut the batch at `limit` changes
+    merged = sorted(
+        [(row[-1], 'task', row) for row in task_rows] + [(row[1], 'deleted', row) for row in deleted_rows],
+        key=lambda change: change[0]
+    )
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+
+    tasks = []
+    deleted = []
+    for seq, kind, row in merged:
+        if kind == 'task':
+            task = dict(zip(TASK_FIELDS, row))
+            task['change_seq'] = seq
+            tasks.append(task)
+        else:
+            deleted.append({'id': row[0], 'change_seq': seq})
+
+    next_since = merged[-1][0] if merged else since
+    return tasks, deleted, next_since, has_more
+
+
+def task_seqs(conn, task_ids):
+    """Current change_seq of the given tasks"""
+    seqs = {}
+    for batch in _chunks(list(task_ids), ID_BATCH_SIZE):
+        placeholders = ', '.join('?' for _ in batch)
+        seqs.update(conn.execute(
+            f'SELECT id, change_seq FROM inspection_tasks WHERE id IN ({placeholders})', batch
+        ).fetchall())
+    return seqs
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_changes(changes):
+    """Raise ValueError unless changes is a list of {"id": int, "base_seq": int, "fields": {...}}"""
+    if not isinstance(changes, list):
+        raise ValueError('changes must be a list')
+    if len(changes) > MAX_PUSH_CHANGES:
+        raise ValueError(f'At most {MAX_PUSH_CHANGES} changes per push')
+    for position, change in enumerate(changes):
+        if not isinstance(change, dict) or not _is_int(change.get('id')):
+            raise ValueError(f'changes[{position}] must be an object with an integer id')
+        if not _is_int(change.get('base_seq')):
+            raise ValueError(f'changes[{position}] needs the integer base_seq of the task it edits')
+        if not isinstance(change.get('fields', {}), dict):
+            raise ValueError(f'changes[{position}].fields must be an object')
+
+
+def check_conflicts(conn, changes):
+    """Split pushed changes into those based on the current row and conflicts.
+
+    Each change carries the task id and the change_seq the client last saw
+    (base_seq), as checked by validate_changes. A change conflicts when the
+    task was deleted or has been changed since; conflicts include the
+    server's current row.
+    """
+    seqs = task_seqs(conn, [int(change['id']) for change in changes])
+
+    accepted = []
+    conflicts = []
+    modified_ids = []
+    seen = set()
+    for change in changes:
+        task_id = int(change['id'])
+        if task_id in seen:
+            conflicts.append({'id': task_id, 'reason': 'duplicate', 'base_seq': change.get('base_seq')})
+            continue
+        seen.add(task_id)
+        if task_id not in seqs:
+            conflicts.append({'id': task_id, 'reason': 'deleted', 'base_seq': change.get('base_seq')})
+        elif change.get('base_seq') != seqs[task_id]:
+            conflicts.append({'id': task_id, 'reason': 'modified', 'base_seq': change.get('base_seq'),
+                              'server_seq': seqs[task_id]})
+            modified_ids.append(task_id)
+        else:
+            accepted.append(change)
+
+    if modified_ids:
+        servers = {}
+        fields = ', '.join(TASK_FIELDS)
+        for batch in _chunks(modified_ids, ID_BATCH_SIZE):
+            placeholders = ', '.join('?' for _ in batch)
+            for row in conn.execute(
+                f'SELECT {fields} FROM inspection_task_details WHERE id IN ({placeholders})', batch
+            ).fetchall():
+                servers[row[0]] = dict(zip(TASK_FIELDS, row))
+        for conflict in conflicts:
+            if conflict['reason'] == 'modified':
+                conflict['server'] = servers.get(conflict['id'])
+                conflict['server']['change_seq'] = conflict['server_seq']
+
+    return accepted, conflicts
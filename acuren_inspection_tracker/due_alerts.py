@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Due-soon, due-today and overdue notifications, raised by a background sweeper.
+
+Each alert type keeps a watermark: the last due date it has swept through.
+A sweep only reads the tasks whose due date has crossed into a window since
+the previous sweep, as a due_date index range between the watermark and
+today's boundary, plus the tasks changed since the last change sequence it
+saw (new, reopened or rescheduled tasks), by the change_seq index. Alerts
+are recorded once per task, type and due date in due_alerts, so overlapping
+sweeps and several worker processes never notify twice; the new ones are
+turned into notifications in one statement.
+
+The first sweep of a database has no watermarks yet: it alerts every task
+already in a window, reading each window's whole due_date index range, and
+then sets the watermarks.
+
+    python due_alerts.py inspection_tracker.db    # sweep once, e.g. from cron
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+from flask import jsonify
+
+from delta_sync import current_seq
+from instrumentation import TracedConnection
+from lookup_encoding import id_list_sql
+
+DEFAULT_SWEEP_SECONDS = 300
+DEFAULT_DUE_SOON_DAYS = 7
+
+CLOSED_STATUSES = ('Field Complete', 'Reported')
+
+# Most urgent first; a task is alerted for the window it is in when swept
+ALERT_TYPES = ('overdue', 'due_today', 'due_soon')
+CHANGE_WATERMARK = 'change_seq'
+
+DUE_ALERT_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS due_alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER NOT NULL,
+        alert_type TEXT NOT NULL,
+        due_date DATE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (task_id) REFERENCES inspection_tasks (id)
+    )
+    ''',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_due_alerts_task ON due_alerts (task_id, alert_type, due_date)',
+    # Last due date swept per alert type, and the last change sequence seen
+    '''
+    CREATE TABLE IF NOT EXISTS due_alert_watermarks (
+        name TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    '''
+]
+
+_settings = {
+    'database': None,
+    'sweep_seconds': DEFAULT_SWEEP_SECONDS,
+    'due_soon_days': DEFAULT_DUE_SOON_DAYS
+}
+
+
+def create_due_alert_tables(conn):
+    cursor = conn.cursor()
+    for statement in DUE_ALERT_TABLES_SQL:
+        cursor.execute(statement)
+
+
+def sweep_due_alerts(conn, today=None, due_soon_days=None):
+    """Record and notify the tasks that entered an alert window since the last sweep.
+
+    today (YYYY-MM-DD) defaults to SQLite's date('now'), the date the
+    dashboards count overdue tasks by. Runs under the write lock and commits.
+    Returns the new alerts per type; the first sweep alerts every task
+    currently in a window.
+    """
+    due_soon_days = _settings['due_soon_days'] if due_soon_days is None else due_soon_days
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        today, yesterday, soon = cursor.execute(
+            "SELECT date(IFNULL(?, 'now')), date(IFNULL(?, 'now'), '-1 day'), date(IFNULL(?, 'now'), ?)",
+            (today, today, today, f'+{int(due_soon_days)} days')).fetchone()
+        seq = current_seq(conn)
+        boundaries = {'overdue': yesterday, 'due_today': today, 'due_soon': soon}
+        watermarks = dict(cursor.execute('SELECT name, value FROM due_alert_watermarks').fetchall())
+
+        first_sweep = not watermarks
+        closed = id_list_sql(conn, 'status', CLOSED_STATUSES)
+        first_id = cursor.execute('SELECT IFNULL(MAX(id), 0) FROM due_alerts').fetchone()[0]
+
+        # Due dates that crossed into each window; each range starts at the window's
+        # own lower edge so a task only gets the alert of the window it is now in.
+        # The first sweep reads each window from its lower edge ('' is below every date)
+        lower_edges = {'overdue': '', 'due_today': yesterday, 'due_soon': today}
+        for alert_type in ALERT_TYPES:
+            high = boundaries[alert_type]
+            low = lower_edges[alert_type]
+            if not first_sweep:
+                low = max(watermarks.get(alert_type, high), low)
+            if low >= high:
+                continue
+            cursor.execute(f'''
+                INSERT INTO due_alerts (task_id, alert_type, due_date)
+                SELECT id, ?, due_date FROM inspection_tasks
+                WHERE due_date > ? AND due_date <= ? AND IFNULL(status_id, -1) NOT IN ({closed})
+                ON CONFLICT (task_id, alert_type, due_date) DO NOTHING
+            ''', (alert_type, low, high))
+
+        if not first_sweep:
+            # Tasks added, reopened or rescheduled into a window since the last sweep
+            cursor.execute(f'''
+                INSERT INTO due_alerts (task_id, alert_type, due_date)
+                SELECT id, CASE WHEN due_date < ? THEN 'overdue' WHEN due_date = ? THEN 'due_today' ELSE 'due_soon' END,
+                       due_date
+                FROM inspection_tasks
+                WHERE change_seq > ? AND change_seq <= ?
+                  AND due_date <= ? AND IFNULL(status_id, -1) NOT IN ({closed})
+                ON CONFLICT (task_id, alert_type, due_date) DO NOTHING
+            ''', (today, today, int(watermarks.get(CHANGE_WATERMARK, seq)), seq, soon))
+
+        cursor.execute('''
+            INSERT INTO notifications (task_id, message, notification_type, priority)
+            SELECT a.task_id,
+                   CASE a.alert_type
+                       WHEN 'overdue' THEN 'Task overdue since ' || a.due_date
+                       WHEN 'due_today' THEN 'Task due today'
+                       ELSE 'Task due on ' || a.due_date
+                   END,
+                   a.alert_type,
+                   CASE a.alert_type WHEN 'due_soon' THEN 'normal' ELSE 'high' END
+            FROM due_alerts a
+            WHERE a.id > ?
+            ORDER BY a.id
+        ''', (first_id,))
+        new_alerts = {alert_type: 0 for alert_type in ALERT_TYPES}
+        new_alerts.update(cursor.execute('''
+            SELECT alert_type, COUNT(*) FROM due_alerts WHERE id > ? GROUP BY alert_type
+        ''', (first_id,)).fetchall())
+
+        # Watermarks only move forward
+        for name, value in list(boundaries.items()) + [(CHANGE_WATERMARK, seq)]:
+            current = watermarks.get(name)
+            if name == CHANGE_WATERMARK:
+                value = max(int(current or 0), seq)
+            elif current is not None:
+                value = max(current, value)
+            cursor.execute('''
+                INSERT OR REPLACE INTO due_alert_watermarks (name, value, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', (name, str(value)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return new_alerts
+
+
+def _connect():
+    return sqlite3.connect(_settings['database'], factory=TracedConnection, timeout=30)
+
+
+class AlertSweeper:
+    """Sweeps every sweep_seconds from one background thread per process, started on the first request"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget the thread and lock; a forked worker starts its own"""
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or not _settings['sweep_seconds']:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='due-alert-sweeper', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(_settings['sweep_seconds'])
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Due alert sweep failed: {e}")
+
+    def sweep(self):
+        """Sweep now; other processes wait on the write lock and then find nothing new"""
+        conn = _connect()
+        try:
+            return sweep_due_alerts(conn)
+        finally:
+            conn.close()
+
+
+sweeper = AlertSweeper()
+os.register_at_fork(after_in_child=sweeper.reset)
+
+
+def _start_sweeper():
+    sweeper.start()
+
+
+def alert_status():
+    """Watermarks of the sweeper and the alerts recorded per type"""
+    conn = _connect()
+    watermarks = {name: {'value': value, 'updated_at': updated_at} for name, value, updated_at in
+                  conn.execute('SELECT name, value, updated_at FROM due_alert_watermarks').fetchall()}
+    counts = dict(conn.execute('SELECT alert_type, COUNT(*) FROM due_alerts GROUP BY alert_type').fetchall())
+    conn.close()
+    return jsonify({
+        'watermarks': watermarks,
+        'alerts': {alert_type: counts.get(alert_type, 0) for alert_type in ALERT_TYPES},
+        'sweep_seconds': _settings['sweep_seconds'],
+        'due_soon_days': _settings['due_soon_days']
+    })
+
+
+def run_sweep():
+    """Sweep now rather than waiting for the background thread"""
+    started = time.perf_counter()
+    new_alerts = sweeper.sweep()
+    elapsed = time.perf_counter() - started
+    return jsonify({'message': f'Raised {sum(new_alerts.values())} due alerts', 'alerts': new_alerts,
+                    'seconds': round(elapsed, 3)})
+
+
+def init_app(app):
+    """Point the sweeper at the app's database, start it on the first request and register its endpoints"""
+    _settings['database'] = app.config['DATABASE']
+    _settings['sweep_seconds'] = float(app.config.get('DUE_ALERT_SWEEP_SECONDS', DEFAULT_SWEEP_SECONDS))
+    _settings['due_soon_days'] = int(app.config.get('DUE_SOON_DAYS', DEFAULT_DUE_SOON_DAYS))
+    app.before_request(_start_sweeper)
+    app.add_url_rule('/api/alerts/due', 'due_alert_status', alert_status)
+    app.add_url_rule('/api/alerts/due/sweep', 'due_alert_sweep', run_sweep, methods=['POST'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Raise due-soon, due-today and overdue notifications')
+    parser.add_argument('database', nargs='?', default='inspection_tracker.db')
+    parser.add_argument('--due-soon-days', type=int, default=DEFAULT_DUE_SOON_DAYS)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database, timeout=30)
+    started = time.perf_counter()
+    alerts = sweep_due_alerts(conn, due_soon_days=args.due_soon_days)
+    print(f"Raised {alerts} in {time.perf_counter() - started:.2f}s")
+    conn.close()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Due date recomputation engine.
+
+Derives the next due date of inspection tasks from last_inspection_date,
+frequency and interval_type using one set-based UPDATE per batch. Day and
+week intervals add days; month and year intervals add calendar months, so
+a task inspected on the 15th stays due on the 15th.
+"""
+
+import sqlite3
+import time
+
+DATABASE = 'inspection_tracker.db'
+
+# Fallback intervals when complete_schema's time_intervals table is absent, as
+# (days, months): day and week intervals add days, month and year intervals
+# calendar months, so a monthly task keeps its day of the month
+DEFAULT_INTERVALS = {
+    'day': (1, 0),
+    'week': (7, 0),
+    'month': (0, 1),
+    'year': (0, 12)
+}
+CALENDAR_INTERVALS = ('month', 'year')
+
+# Days per month for the fractional part of a month interval (frequency 1.5)
+DAYS_PER_MONTH = 30
+
+# Statuses that mean the field inspection has been carried out
+COMPLETION_STATUSES = ('Field Complete',)
+
+RANGE_BATCH_SIZE = 50000
+ID_BATCH_SIZE = 500
+
+# Interval names are matched case-insensitively and singular/plural alike
+INTERVAL_KEY_SQL = "rtrim(lower(trim({column})), 's')"
+
+
+def _interval_key(name):
+    return str(name).strip().lower().rstrip('s')
+
+
+def load_intervals(conn):
+    """Map normalized interval names to (days, months) per unit of frequency.
+
+    time_intervals rows in days or weeks add days and rows in months or
+    years add calendar months. Months and Years themselves are always
+    calendar intervals, whatever day count the table gives them.
+    """
+    intervals = dict(DEFAULT_INTERVALS)
+    try:
+        rows = conn.execute(
+            'SELECT interval_name, interval_value, interval_unit FROM time_intervals'
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return intervals
+
+    for interval_name, interval_value, interval_unit in rows:
+        key = _interval_key(interval_name) if interval_name else None
+        if key is None or key in CALENDAR_INTERVALS or interval_value is None:
+            continue
+        unit_days, unit_months = DEFAULT_INTERVALS.get(_interval_key(interval_unit or 'days'), (1, 0))
+        intervals[key] = (interval_value * unit_days, interval_value * unit_months)
+    return intervals
+
+
+def _prepare_interval_table(conn):
+    # Read the intervals before the DELETE below opens a transaction: a read of the
+    # main database inside it could not be upgraded to the recompute's write once
+    # another connection has committed, and would fail with "database is locked"
+    intervals = load_intervals(conn)
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS intervals (
+            interval_key TEXT PRIMARY KEY,
+            days REAL,
+            months REAL
+        )
+    ''')
+    conn.execute('DELETE FROM temp.intervals')
+    conn.executemany(
+        'INSERT INTO temp.intervals (interval_key, days, months) VALUES (?, ?, ?)',
+        ((key, days, months) for key, (days, months) in intervals.items())
+    )
+
+
+def _recompute_sql(batch_filter):
+    # A month interval keeps the day of the month, clamped to the target
+    # month's last day (Jan 31 + 1 month is Feb 28/29) where date()'s
+    # '+N months' alone would overflow into the month after; days 1-28
+    # always exist, so only later days pay for the second date()
+    return f'''
+        UPDATE inspection_tasks
+        SET due_date = next_due.due_date
+        FROM (
+            SELECT
+                id,
+                CASE
+                    WHEN months = 0 THEN
+                        date(last_inspection_date, printf('+%d days', CAST(round(frequency * days) AS INTEGER)))
+                    WHEN substr(last_inspection_date, 9, 2) <= '28' THEN
+                        date(last_inspection_date, printf('+%d months', whole_months), printf('+%d days', extra_days))
+                    ELSE
+                        date(MIN(date(last_inspection_date, printf('+%d months', whole_months)),
+                                 date(last_inspection_date, 'start of month',
+                                      printf('+%d months', whole_months + 1), '-1 days')),
+                             printf('+%d days', extra_days))
+                END AS due_date
+            FROM (
+                SELECT
+                    t.id,
+                    t.last_inspection_date,
+                    t.frequency,
+                    d.days,
+                    d.months,
+                    CAST(t.frequency * d.months AS INTEGER) AS whole_months,
+                    CAST(round((t.frequency * d.months - CAST(t.frequency * d.months AS INTEGER))
+                               * {DAYS_PER_MONTH}) AS INTEGER) AS extra_days
+                FROM inspection_tasks t
+                JOIN temp.intervals d
+                    ON d.interval_key = {INTERVAL_KEY_SQL.format(column='t.interval_type')}
+                WHERE {batch_filter}
+                  AND t.last_inspection_date IS NOT NULL
+                  AND t.frequency > 0
+            )
+        ) AS next_due
+        WHERE inspection_tasks.id = next_due.id
+          AND next_due.due_date IS NOT NULL
+          AND inspection_tasks.due_date IS NOT next_due.due_date
+    '''
+
+
+def recompute_due_dates(conn, task_ids=None, batch_size=None, commit_batches=False):
+    """Recompute due dates for the given tasks, or for the whole table.
+
+    Returns the number of tasks whose due date changed. When commit_batches
+    is set each batch is committed on its own so the write lock is released
+    between batches; otherwise committing is left to the caller.
+    """
+    _prepare_interval_table(conn)
+    cursor = conn.cursor()
+    updated = 0
+
+    if task_ids is not None:
+        task_ids = sorted({int(task_id) for task_id in task_ids})
+        batch_size = batch_size or ID_BATCH_SIZE
+        for start in range(0, len(task_ids), batch_size):
+            batch = task_ids[start:start + batch_size]
+            placeholders = ', '.join('?' for _ in batch)
+            cursor.execute(_recompute_sql(f't.id IN ({placeholders})'), batch)
+            updated += cursor.rowcount
+            if commit_batches:
+                conn.commit()
+        return updated
+
+    batch_size = batch_size or RANGE_BATCH_SIZE
+    min_id, max_id = cursor.execute('SELECT MIN(id), MAX(id) FROM inspection_tasks').fetchone()
+    if min_id is None:
+        return 0
+
+    sql = _recompute_sql('t.id BETWEEN ? AND ?')
+    for start in range(min_id, max_id + 1, batch_size):
+        cursor.execute(sql, (start, start + batch_size - 1))
+        updated += cursor.rowcount
+        if commit_batches:
+            conn.commit()
+    return updated
+
+
+def record_completion(conn, task_ids):
+    """Roll last_inspection_date forward for completed tasks and reschedule them"""
+    task_ids = list(task_ids)
+    for start in range(0, len(task_ids), ID_BATCH_SIZE):
+        batch = task_ids[start:start + ID_BATCH_SIZE]
+        placeholders = ', '.join('?' for _ in batch)
+        conn.execute(f'''
+            UPDATE inspection_tasks
+            SET last_inspection_date = COALESCE(date(current_inspection_date), date('now'))
+            WHERE id IN ({placeholders})
+        ''', batch)
+    return recompute_due_dates(conn, task_ids)
+
+
+if __name__ == '__main__':
+    print("Recomputing due dates for all inspection tasks...")
+    conn = sqlite3.connect(DATABASE)
+    started = time.perf_counter()
+    count = recompute_due_dates(conn, commit_batches=True)
+    conn.commit()
+    conn.close()
+    print(f"Updated {count} due dates in {time.perf_counter() - started:.2f}s")
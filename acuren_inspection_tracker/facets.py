@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Per-value task counts for the task list filters (site, inspector, status,
+method and priority).
+
+task_facet_counts holds the number of tasks for every combination of the
+five filter columns, kept current by triggers on inspection_tasks; it has
+one row per combination in use (about 61k for 500k tasks) rather than one
+per task. The facets of a filter are read from it in one statement, each
+dimension counted with every filter but its own, as faceted search does:
+the site counts under status=Claimed are the Claimed tasks of each site.
+Results are cached per filter and change sequence, so they are reused
+until a task changes. Archived tasks are not counted.
+
+    python facets.py inspection_tracker.db --site 1201 --status Claimed
+    python facets.py inspection_tracker.db --rebuild    # recount from inspection_tasks
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from delta_sync import current_seq
+from lookup_encoding import LOOKUPS, NULL_DISPLAY
+
+CACHE_SIZE = 256
+
+# Facet -> inspection_tasks column; NULLs are stored as 0 ids and an empty priority
+FACET_COLUMNS = OrderedDict([
+    ('site', 'site_id'),
+    ('inspector', 'inspector_id'),
+    ('status', 'status_id'),
+    ('method', 'method_id'),
+    ('priority', 'inspection_priority')
+])
+NULL_KEYS = {'inspection_priority': "''"}
+
+FACET_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS task_facet_counts (
+        site_id INTEGER NOT NULL,
+        inspector_id INTEGER NOT NULL,
+        status_id INTEGER NOT NULL,
+        method_id INTEGER NOT NULL,
+        inspection_priority NOT NULL,
+        tasks INTEGER NOT NULL,
+        PRIMARY KEY (site_id, inspector_id, status_id, method_id, inspection_priority)
+    ) WITHOUT ROWID
+    '''
+]
+
+
+def _key_sql(task):
+    return ', '.join(f'IFNULL({task}.{column}, {NULL_KEYS.get(column, 0)})' for column in FACET_COLUMNS.values())
+
+
+def _counts_add(task, delta):
+    """Statement adding delta to the facet row of a task (NEW or OLD)"""
+    columns = ', '.join(FACET_COLUMNS.values())
+    return f'''
+        INSERT INTO task_facet_counts ({columns}, tasks) VALUES ({_key_sql(task)}, {delta})
+        ON CONFLICT ({columns}) DO UPDATE SET tasks = tasks + {delta};
+    '''
+
+
+FACET_TRIGGERS_SQL = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS inspection_tasks_facets_insert
+    AFTER INSERT ON inspection_tasks
+    BEGIN
+        {_counts_add('NEW', 1)}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS inspection_tasks_facets_update
+    AFTER UPDATE OF {', '.join(FACET_COLUMNS.values())} ON inspection_tasks
+    WHEN {' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in FACET_COLUMNS.values())}
+    BEGIN
+        {_counts_add('OLD', -1)}
+        {_counts_add('NEW', 1)}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS inspection_tasks_facets_delete
+    AFTER DELETE ON inspection_tasks
+    BEGIN
+        {_counts_add('OLD', -1)}
+    END
+    '''
+]
+
+
+def rebuild_facet_counts(conn):
+    """Recount task_facet_counts from inspection_tasks in one transaction. The caller commits."""
+    columns = ', '.join(FACET_COLUMNS.values())
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM task_facet_counts')
+    cursor.execute(f'''
+        INSERT INTO task_facet_counts ({columns}, tasks)
+        SELECT {_key_sql('t')}, COUNT(*) FROM inspection_tasks t
+        GROUP BY {', '.join(str(position) for position in range(1, len(FACET_COLUMNS) + 1))}
+    ''')
+
+
+def create_facet_tables(conn):
+    """Create the counts table and its triggers and fill it.
+
+    The write lock is held throughout (about 1s for 500k tasks), so no task
+    change can fall between the count and the triggers.
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for statement in FACET_TABLES_SQL + FACET_TRIGGERS_SQL:
+            cursor.execute(statement)
+        rebuild_facet_counts(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def resolve_filters(conn, filters):
+    """Filter names -> stored keys ({column: key}); unknown names match nothing"""
+    keys = {}
+    for facet, value in filters.items():
+        if value is None or value == '':
+            continue
+        column = FACET_COLUMNS[facet]
+        if facet == 'priority':
+            try:
+                keys[column] = int(value)
+            except ValueError:
+                keys[column] = value
+        elif facet == 'inspector' and value == NULL_DISPLAY['inspector']:
+            keys[column] = 0
+        else:
+            table, name_column, _ = LOOKUPS[facet]
+            row = conn.execute(f'SELECT id FROM {table} WHERE {name_column} = ?', (value,)).fetchone()
+            keys[column] = row[0] if row else -1
+    return keys
+
+
+def _facet_names(conn, facet, keys):
+    if facet == 'priority':
+        return {key: (None if key == '' else key) for key in keys}
+    table, name_column, _ = LOOKUPS[facet]
+    names = {0: NULL_DISPLAY[facet]}
+    ids = [key for key in keys if key]
+    if ids:
+        names.update(conn.execute(f'''
+            SELECT id, {name_column} FROM {table} WHERE id IN ({', '.join('?' for _ in ids)})
+        ''', ids).fetchall())
+    return names
+
+
+def task_facets(conn, filters):
+    """Counts per value of every facet under filters ({facet: name}), and the tasks matching all of them.
+
+    Returns ({facet: [{'value', 'count'}, ...] by count descending}, total).
+    """
+    keys = resolve_filters(conn, filters)
+    parts = []
+    params = []
+    for facet, column in FACET_COLUMNS.items():
+        others = [other for other in FACET_COLUMNS.values() if other != column and other in keys]
+        where = ' AND '.join(['tasks > 0'] + [f'{other} = ?' for other in others])
+        parts.append(f"SELECT '{facet}', {column}, SUM(tasks) FROM task_facet_counts WHERE {where} GROUP BY {column}")
+        params.extend(keys[other] for other in others)
+
+    counts = {facet: {} for facet in FACET_COLUMNS}
+    for facet, key, tasks in conn.execute(' UNION ALL '.join(parts), params):
+        counts[facet][key] = tasks
+
+    # Every facet's counts under its own filter give the same total; the first will do
+    first, column = next(iter(FACET_COLUMNS.items()))
+    total = counts[first].get(keys[column], 0) if column in keys else sum(counts[first].values())
+
+    facets = {}
+    for facet, facet_counts in counts.items():
+        names = _facet_names(conn, facet, facet_counts)
+        facets[facet] = [{'value': names.get(key, key), 'count': tasks}
+                         for key, tasks in sorted(facet_counts.items(), key=lambda item: (-item[1], str(item[0])))]
+    return facets, total
+
+
+class FacetCache:
+    """Facets per filter signature, valid while the change sequence has not moved (least recently used evicted)"""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        """Start empty with a fresh lock; a forked worker keeps its own cache"""
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, conn, filters):
+        """(facets, total, seq, cached) for filters, computed only when not cached at the current sequence"""
+        signature = tuple(sorted((facet, str(value)) for facet, value in filters.items() if value))
+        seq = current_seq(conn)
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is not None and entry[0] == seq:
+                self._entries.move_to_end(signature)
+                return entry[1], entry[2], seq, True
+
+        facets, total = task_facets(conn, filters)
+        with self._lock:
+            self._entries[signature] = (seq, facets, total)
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return facets, total, seq, False
+
+
+cache = FacetCache()
+os.register_at_fork(after_in_child=cache.reset)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Task counts per filter value')
+    parser.add_argument('database', nargs='?', default='inspection_tracker.db')
+    for facet in FACET_COLUMNS:
+        parser.add_argument(f'--{facet}')
+    parser.add_argument('--rebuild', action='store_true', help='Recount from inspection_tasks first')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    if args.rebuild:
+        started = time.perf_counter()
+        rebuild_facet_counts(conn)
+        conn.commit()
+        print(f"Recounted facets in {time.perf_counter() - started:.2f}s")
+    started = time.perf_counter()
+    facets, total = task_facets(conn, {facet: getattr(args, facet) for facet in FACET_COLUMNS})
+    print(f"{total} tasks ({(time.perf_counter() - started) * 1000:.1f}ms)")
+    for facet, values in facets.items():
+        print(f"  {facet}: " + ', '.join(f"{value['value']!r}={value['count']}" for value in values[:10]))
+    conn.close()
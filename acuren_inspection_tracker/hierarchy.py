@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Asset hierarchy of inspection tasks, with subtree status rollups.
+
+Hierarchy item names such as 'Unit 30 / Area 11 / VI-0104429' are parsed
+into hierarchy_nodes, one row per level keyed by its materialized path, and
+hierarchy_closure lists every node's ancestors (itself and the root included).
+task_hierarchy maps each task to its item node.
+
+hierarchy_rollup holds, for every node, the tasks of its whole subtree by
+status and due month, so a subtree's counts are a seek on the node's rows
+rather than a scan of its tasks. Tasks are added to it as they are mapped,
+after they are inserted (index_new_tasks; the bulk ingest maps each batch),
+and triggers keep it current on every status or due date change and every
+delete, whichever route or script makes it. Renaming a task's hierarchy
+item takes it out of the rollup and queues it in hierarchy_remap, and the
+next index_new_tasks maps it under its new node. Overdue counts take whole past
+months from the rollup and only the current month from the due date index.
+
+    python hierarchy.py inspection_tracker.db    # map tasks inserted or renamed by other scripts
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import time
+
+from lookup_encoding import id_list_sql
+
+ID_BATCH_SIZE = 500
+INDEX_BATCH_SIZE = 5000
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 2000
+
+# Levels are separated by '/', '|' or '\' between spaces, or by '>'; a bare
+# slash is part of a name ('P-101A/B')
+SEPARATOR_PATTERN = re.compile(r'\s+[/|\\]\s+|\s*>\s*')
+PATH_SEPARATOR = ' / '
+UNSPECIFIED_NODE = '(unspecified)'
+
+# Every node's ancestors include this id, so the rollup also holds whole-tree counts
+ROOT_ID = 0
+
+CLOSED_STATUSES = ('Field Complete', 'Reported')
+
+HIERARCHY_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS hierarchy_nodes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        parent_id INTEGER,
+        name TEXT NOT NULL,
+        path TEXT NOT NULL UNIQUE,
+        depth INTEGER NOT NULL,
+        FOREIGN KEY (parent_id) REFERENCES hierarchy_nodes (id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_hierarchy_nodes_parent ON hierarchy_nodes (parent_id, name)',
+    '''
+    CREATE TABLE IF NOT EXISTS hierarchy_closure (
+        node_id INTEGER NOT NULL,
+        ancestor_id INTEGER NOT NULL,
+        PRIMARY KEY (node_id, ancestor_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS task_hierarchy (
+        task_id INTEGER PRIMARY KEY,
+        node_id INTEGER NOT NULL
+    )
+    ''',
+    # status_id 0 is a task without a status, due_month '' one without a due date
+    '''
+    CREATE TABLE IF NOT EXISTS hierarchy_rollup (
+        node_id INTEGER NOT NULL,
+        status_id INTEGER NOT NULL,
+        due_month TEXT NOT NULL,
+        tasks INTEGER NOT NULL,
+        PRIMARY KEY (node_id, status_id, due_month)
+    ) WITHOUT ROWID
+    '''
+]
+
+
+def _rollup_add(task, delta):
+    """Statement adding delta to the rollup rows of every ancestor of a task (NEW or OLD)"""
+    return f'''
+        INSERT INTO hierarchy_rollup (node_id, status_id, due_month, tasks)
+        SELECT c.ancestor_id, IFNULL({task}.status_id, 0), IFNULL(substr({task}.due_date, 1, 7), ''), {delta}
+        FROM task_hierarchy h
+        JOIN hierarchy_closure c ON c.node_id = h.node_id
+        WHERE h.task_id = {task}.id
+        ON CONFLICT (node_id, status_id, due_month) DO UPDATE SET tasks = tasks + {delta};
+    '''
+
+
+HIERARCHY_TRIGGERS_SQL = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS inspection_tasks_hierarchy_update
+    AFTER UPDATE OF status_id, due_date ON inspection_tasks
+    WHEN OLD.status_id IS NOT NEW.status_id
+      OR substr(OLD.due_date, 1, 7) IS NOT substr(NEW.due_date, 1, 7)
+    BEGIN
+        {_rollup_add('OLD', -1)}
+        {_rollup_add('NEW', 1)}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS inspection_tasks_hierarchy_delete
+    AFTER DELETE ON inspection_tasks
+    BEGIN
+        {_rollup_add('OLD', -1)}
+        DELETE FROM task_hierarchy WHERE task_id = OLD.id;
+    END
+    '''
+]
+
+
+# A BEFORE trigger runs ahead of inspection_tasks_hierarchy_update, so the rollup
+# rows it takes the task out of are still those of its old status and due month
+HIERARCHY_REMAP_SQL = [
+    'CREATE TABLE IF NOT EXISTS hierarchy_remap (task_id INTEGER PRIMARY KEY)',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS inspection_tasks_hierarchy_rename
+    BEFORE UPDATE OF hierarchy_item_name ON inspection_tasks
+    WHEN OLD.hierarchy_item_name IS NOT NEW.hierarchy_item_name
+    BEGIN
+        {_rollup_add('OLD', -1)}
+        DELETE FROM task_hierarchy WHERE task_id = OLD.id;
+        INSERT OR IGNORE INTO hierarchy_remap (task_id) VALUES (OLD.id);
+    END
+    '''
+]
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def create_hierarchy_tables(conn):
+    """Create the node, closure, task mapping and rollup tables and the triggers that maintain the rollup"""
+    cursor = conn.cursor()
+    for statement in HIERARCHY_TABLES_SQL + HIERARCHY_TRIGGERS_SQL:
+        cursor.execute(statement)
+
+
+def create_hierarchy_remap(conn):
+    """Create the queue of renamed tasks and the trigger that fills it"""
+    cursor = conn.cursor()
+    for statement in HIERARCHY_REMAP_SQL:
+        cursor.execute(statement)
+
+
+def hierarchy_levels(name):
+    """Level names of a hierarchy item name, top first"""
+    levels = [level.strip() for level in SEPARATOR_PATTERN.split(str(name or ''))]
+    return [level for level in levels if level and level not in ('nan', 'None')] or [UNSPECIFIED_NODE]
+
+
+def hierarchy_path(name):
+    return PATH_SEPARATOR.join(hierarchy_levels(name))
+
+
+def intern_paths(conn, names):
+    """Node ids of hierarchy item names, creating the missing nodes and their closure rows.
+
+    Returns {name: item node id}. The caller commits.
+    """
+    levels = {name: hierarchy_levels(name) for name in set(names)}
+    paths = {}
+    for name_levels in levels.values():
+        for depth in range(len(name_levels)):
+            paths[PATH_SEPARATOR.join(name_levels[:depth + 1])] = (depth, name_levels[depth])
+
+    node_ids = {}
+    for batch in _chunks(list(paths), ID_BATCH_SIZE):
+        placeholders = ', '.join('?' for _ in batch)
+        node_ids.update(conn.execute(
+            f'SELECT path, id FROM hierarchy_nodes WHERE path IN ({placeholders})', batch).fetchall())
+
+    new_paths = sorted((path for path in paths if path not in node_ids), key=lambda path: paths[path][0])
+
+    # New nodes take ids above every existing one, so they and their closure rows
+    # are written in two bulk inserts; parents come first and pass on their ancestors
+    parent_paths = {path[:-len(paths[path][1]) - len(PATH_SEPARATOR)] for path in new_paths if paths[path][0]}
+    ancestors = {}
+    existing_parents = [node_ids[path] for path in parent_paths if path in node_ids]
+    for batch in _chunks(existing_parents, ID_BATCH_SIZE):
+        placeholders = ', '.join('?' for _ in batch)
+        for node_id, ancestor_id in conn.execute(
+                f'SELECT node_id, ancestor_id FROM hierarchy_closure WHERE node_id IN ({placeholders})', batch):
+            ancestors.setdefault(node_id, []).append(ancestor_id)
+
+    next_id = conn.execute('SELECT IFNULL(MAX(id), 0) + 1 FROM hierarchy_nodes').fetchone()[0]
+    nodes = []
+    closure = []
+    for node_id, path in enumerate(new_paths, next_id):
+        depth, name = paths[path]
+        parent_id = node_ids[path[:-len(name) - len(PATH_SEPARATOR)]] if depth else None
+        node_ids[path] = node_id
+        ancestors[node_id] = (ancestors[parent_id] if depth else [ROOT_ID]) + [node_id]
+        nodes.append((node_id, parent_id, name, path, depth))
+        closure.extend((node_id, ancestor_id) for ancestor_id in ancestors[node_id])
+    conn.executemany('INSERT INTO hierarchy_nodes (id, parent_id, name, path, depth) VALUES (?, ?, ?, ?, ?)', nodes)
+    conn.executemany('INSERT INTO hierarchy_closure (node_id, ancestor_id) VALUES (?, ?)', closure)
+
+    return {name: node_ids[PATH_SEPARATOR.join(name_levels)] for name, name_levels in levels.items()}
+
+
+def map_tasks(conn, after_id, up_to_id):
+    """Map the unmapped tasks with ids in (after_id, up_to_id] to their item nodes; returns the count.
+
+    Runs as the migration backfill and after inserts. The caller commits.
+    """
+    rows = conn.execute('''
+        SELECT t.id, t.hierarchy_item_name FROM inspection_tasks t
+        WHERE t.id > ? AND t.id <= ?
+          AND NOT EXISTS (SELECT 1 FROM task_hierarchy h WHERE h.task_id = t.id)
+    ''', (after_id, up_to_id)).fetchall()
+    return _map_rows(conn, rows)
+
+
+def _map_rows(conn, rows):
+    """Map (task id, hierarchy item name) rows and add them to the rollup"""
+    if not rows:
+        return 0
+    node_ids = intern_paths(conn, [name for _, name in rows])
+    conn.executemany('INSERT INTO task_hierarchy (task_id, node_id) VALUES (?, ?)',
+                     ((task_id, node_ids[name]) for task_id, name in rows))
+
+    # Counted per (ancestor, status, month) in one statement rather than per task
+    conn.execute('''
+        INSERT INTO hierarchy_rollup (node_id, status_id, due_month, tasks)
+        SELECT c.ancestor_id, IFNULL(t.status_id, 0), IFNULL(substr(t.due_date, 1, 7), ''), COUNT(*)
+        FROM task_hierarchy h
+        JOIN inspection_tasks t ON t.id = h.task_id
+        JOIN hierarchy_closure c ON c.node_id = h.node_id
+        WHERE h.task_id IN (SELECT value FROM json_each(?))
+        GROUP BY 1, 2, 3
+        ON CONFLICT (node_id, status_id, due_month) DO UPDATE SET tasks = tasks + excluded.tasks
+    ''', (json.dumps([task_id for task_id, _ in rows]),))
+    return len(rows)
+
+
+def remap_renamed_tasks(conn):
+    """Map the tasks whose hierarchy item was renamed since the last run. The caller commits."""
+    rows = conn.execute('''
+        SELECT t.id, t.hierarchy_item_name FROM hierarchy_remap r
+        JOIN inspection_tasks t ON t.id = r.task_id
+        WHERE NOT EXISTS (SELECT 1 FROM task_hierarchy h WHERE h.task_id = t.id)
+    ''').fetchall()
+    conn.execute('DELETE FROM hierarchy_remap')
+    return _map_rows(conn, rows)
+
+
+def index_new_tasks(conn, batch_size=INDEX_BATCH_SIZE):
+    """Map tasks inserted since the last mapped one, then the renamed ones. The caller commits."""
+    last_id = conn.execute('SELECT IFNULL(MAX(task_id), 0) FROM task_hierarchy').fetchone()[0]
+    up_to = conn.execute('SELECT IFNULL(MAX(id), 0) FROM inspection_tasks').fetchone()[0]
+    mapped = 0
+    for after_id in range(last_id, up_to, batch_size):
+        mapped += map_tasks(conn, after_id, min(after_id + batch_size, up_to))
+    # After the id ranges: mapping a renamed task above the last mapped id
+    # first would move the high-water mark past the unmapped ones below it
+    return mapped + remap_renamed_tasks(conn)
+
+
+def find_node(conn, node_id=None, path=None):
+    """A node by id or by hierarchy path (any separator spelling), or None"""
+    if node_id is not None:
+        row = conn.execute('SELECT id, name, path, depth, parent_id FROM hierarchy_nodes WHERE id = ?',
+                           (node_id,)).fetchone()
+    else:
+        row = conn.execute('SELECT id, name, path, depth, parent_id FROM hierarchy_nodes WHERE path = ?',
+                           (hierarchy_path(path),)).fetchone()
+    return dict(zip(['id', 'name', 'path', 'depth', 'parent_id'], row)) if row else None
+
+
+def child_nodes(conn, parent_id=None, limit=DEFAULT_PAGE_SIZE, offset=0):
+    """One page of a node's children (top-level nodes for None) in name order, and their total"""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    parent_filter = 'parent_id IS NULL' if parent_id is None else 'parent_id = ?'
+    params = [] if parent_id is None else [parent_id]
+    rows = conn.execute(f'''
+        SELECT n.id, n.name, n.path, n.depth,
+               EXISTS (SELECT 1 FROM hierarchy_nodes c WHERE c.parent_id = n.id) AS has_children
+        FROM hierarchy_nodes n
+        WHERE n.{parent_filter}
+        ORDER BY n.name
+        LIMIT ? OFFSET ?
+    ''', params + [limit, int(offset)]).fetchall()
+    total = conn.execute(f'SELECT COUNT(*) FROM hierarchy_nodes WHERE {parent_filter}', params).fetchone()[0]
+    children = [dict(zip(['id', 'name', 'path', 'depth', 'has_children'], row)) for row in rows]
+    for child in children:
+        child['has_children'] = bool(child['has_children'])
+    return children, total
+
+
+def subtree_counts(conn, node_ids):
+    """Task counts of each node's subtree: {node_id: {'total', 'overdue', 'by_status'}}"""
+    closed = id_list_sql(conn, 'status', CLOSED_STATUSES)
+    month_start, today = conn.execute("SELECT date('now', 'start of month'), date('now')").fetchone()
+    statuses = dict(conn.execute('SELECT id, status_name FROM status_types').fetchall())
+    counts = {node_id: {'total': 0, 'overdue': 0, 'by_status': {}} for node_id in node_ids}
+
+    for batch in _chunks(list(node_ids), ID_BATCH_SIZE):
+        placeholders = ', '.join('?' for _ in batch)
+        rows = conn.execute(f'''
+            SELECT node_id, status_id, SUM(tasks),
+                   SUM(CASE WHEN due_month <> '' AND due_month < ? AND status_id NOT IN ({closed})
+                            THEN tasks ELSE 0 END)
+            FROM hierarchy_rollup
+            WHERE node_id IN ({placeholders})
+            GROUP BY node_id, status_id
+        ''', [month_start[:7]] + batch).fetchall()
+        for node_id, status_id, tasks, overdue in rows:
+            if not tasks:
+                continue
+            node = counts[node_id]
+            status = statuses.get(status_id, '')
+            node['by_status'][status] = node['by_status'].get(status, 0) + tasks
+            node['total'] += tasks
+            node['overdue'] += overdue
+
+        # Tasks of the current month become overdue day by day; count those from the due date index
+        for node_id, overdue in conn.execute(f'''
+            SELECT c.ancestor_id, COUNT(*)
+            FROM inspection_tasks t
+            JOIN task_hierarchy h ON h.task_id = t.id
+            JOIN hierarchy_closure c ON c.node_id = h.node_id
+            WHERE t.due_date >= ? AND t.due_date < ? AND IFNULL(t.status_id, -1) NOT IN ({closed})
+              AND +c.ancestor_id IN ({placeholders})
+            GROUP BY c.ancestor_id
+        ''', [month_start, today] + batch).fetchall():
+            counts[node_id]['overdue'] += overdue
+    return counts
+
+
+def hierarchy_level(conn, node=None, limit=DEFAULT_PAGE_SIZE, offset=0):
+    """A node's subtree counts and one page of its children with theirs (the whole tree for None)"""
+    node_id = node['id'] if node else ROOT_ID
+    children, total_children = child_nodes(conn, node['id'] if node else None, limit, offset)
+    counts = subtree_counts(conn, [node_id] + [child['id'] for child in children])
+    for child in children:
+        child.update(counts[child['id']])
+    return {**counts[node_id], 'children': children, 'total_children': total_children}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Map unmapped inspection tasks into the asset hierarchy')
+    parser.add_argument('database', nargs='?', default='inspection_tracker.db')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    started = time.perf_counter()
+    count = index_new_tasks(conn)
+    conn.commit()
+    print(f"Mapped {count} tasks in {time.perf_counter() - started:.1f}s")
+    conn.close()
@@ -0,0 +1,499 @@
+"""
+Per-request profiling and SQL instrumentation.
+
+TracedConnection is a sqlite3.Connection whose cursors time every statement
+and count the rows they return. Statement stats are accumulated per request
+in a thread-local and folded into the in-process metrics registry once, when
+the response goes out, and the registry is rendered in Prometheus text format.
+
+Each worker process has its own registry. With METRICS_DIR set (serve.py
+sets it for its workers) every process writes a snapshot of its registry
+there every FLUSH_SECONDS, and /api/metrics serves the sum over all
+snapshots, whichever worker answers: counters and histograms are added up,
+gauges keep one series per process with a pid label. When a scrape finds
+the snapshot of an exited worker (gunicorn recycles them) it folds its
+counters and histograms into one retired snapshot, so counters never go
+backwards, and drops the worker's file and gauges. Other workers' numbers
+can be up to FLUSH_SECONDS old. Without METRICS_DIR the endpoint reports the
+answering process only.
+"""
+
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from flask import Response, request
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+NO_ROUTE = '(none)'
+FLUSH_SECONDS = 2.0
+RETIRED = 'retired'
+
+logger = logging.getLogger('acuren.metrics')
+
+_settings = {'metrics_dir': None}
+
+# Callables notified of every finished statement:
+# observer(sql, params, duration, rows, connection, route)
+statement_observers = []
+
+_state = threading.local()
+
+
+def _current_route():
+    return getattr(_state, 'route', None) or NO_ROUTE
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that times statements from execute until their rows are fetched"""
+
+    _pending = None
+
+    def _start(self, sql, params, started):
+        self._finish()
+        elapsed = time.perf_counter() - started
+        if self.description is None:
+            self._record(sql, params, elapsed, 0)
+        else:
+            self._pending = [sql, params, elapsed, 0]
+
+    def _finish(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            self._record(*pending)
+
+    def _record(self, sql, params, duration, rows):
+        stats = getattr(_state, 'stats', None)
+        if stats is not None:
+            stats.append((duration, rows))
+        if statement_observers:
+            route = _current_route()
+            for observer in statement_observers:
+                observer(sql, params, duration, rows, self.connection, route)
+
+    def _fetched(self, started, count, exhausted):
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - started
+            pending[3] += count
+            if exhausted:
+                self._finish()
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._start(sql, parameters, started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._start(sql, None, started)
+        return self
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        super().executescript(sql_script)
+        self._start(sql_script, None, started)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0, True)
+            raise
+        self._fetched(started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose cursors and shortcut methods are traced"""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by label tuples"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Start empty; a forked worker reports its own requests, not its parent's"""
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _family(self, name, kind, help_text, buckets=None):
+        family = self._metrics.get(name)
+        if family is None:
+            family = {'kind': kind, 'help': help_text, 'buckets': buckets, 'series': {}}
+            self._metrics[name] = family
+        return family
+
+    def inc(self, name, labels, value=1, help_text=''):
+        with self._lock:
+            self._add(name, 'counter', help_text, labels, value)
+
+    def set(self, name, labels, value, help_text=''):
+        with self._lock:
+            self._family(name, 'gauge', help_text)['series'][labels] = value
+
+    def observe(self, name, labels, values, buckets, help_text=''):
+        """Add one or more observations to a histogram series"""
+        with self._lock:
+            self._add_histogram(name, buckets, help_text, labels, values)
+
+    def record_request(self, route, method, status, duration, response_bytes, stats):
+        """Fold one request and its statement stats into the registry under a single lock"""
+        route_labels = (('route', route),)
+        request_labels = (('route', route), ('method', method))
+        with self._lock:
+            self._add(
+                'acuren_http_requests_total', 'counter',
+                'HTTP requests by route, method and status.',
+                request_labels + (('status', str(status)),), 1
+            )
+            self._add_histogram(
+                'acuren_http_request_duration_seconds', LATENCY_BUCKETS,
+                'HTTP request latency in seconds.', request_labels, (duration,)
+            )
+            if response_bytes is not None:
+                self._add_histogram(
+                    'acuren_http_response_size_bytes', SIZE_BUCKETS,
+                    'HTTP response body size in bytes.', route_labels, (response_bytes,)
+                )
+            self._add_histogram(
+                'acuren_db_statements_per_request', COUNT_BUCKETS,
+                'SQL statements issued per request.', route_labels, (len(stats),)
+            )
+            if stats:
+                self._add(
+                    'acuren_db_statements_total', 'counter',
+                    'SQL statements executed.', route_labels, len(stats)
+                )
+                self._add_histogram(
+                    'acuren_db_statement_duration_seconds', STATEMENT_BUCKETS,
+                    'SQL statement duration in seconds, including row fetching.',
+                    route_labels, [duration for duration, _ in stats]
+                )
+                self._add(
+                    'acuren_db_rows_returned_total', 'counter',
+                    'Rows returned by SQL statements.', route_labels,
+                    sum(rows for _, rows in stats)
+                )
+
+    def _add(self, name, kind, help_text, labels, value):
+        series = self._family(name, kind, help_text)['series']
+        series[labels] = series.get(labels, 0) + value
+
+    def _add_histogram(self, name, buckets, help_text, labels, values):
+        family = self._family(name, 'histogram', help_text, buckets)
+        histogram = family['series'].get(labels)
+        if histogram is None:
+            histogram = family['series'][labels] = _Histogram(buckets)
+        for value in values:
+            histogram.observe(value)
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            return _render_families(self._metrics)
+
+    def snapshot(self):
+        """The registry as JSON-serializable data, for merge_snapshots"""
+        with self._lock:
+            return _snapshot_families(self._metrics)
+
+
+def _snapshot_families(metrics):
+    return {
+        name: {
+            'kind': family['kind'],
+            'help': family['help'],
+            'buckets': family['buckets'],
+            'series': [
+                [labels, {'counts': list(value.counts), 'total': value.total, 'count': value.count}
+                 if family['kind'] == 'histogram' else value]
+                for labels, value in family['series'].items()
+            ]
+        }
+        for name, family in metrics.items()
+    }
+
+
+def merge_snapshots(snapshots, gauges=True):
+    """Sum {pid: snapshot} into registry families; gauges get a pid label instead, or are left out"""
+    merged = {}
+    for pid, snapshot in snapshots.items():
+        for name, family in snapshot.items():
+            kind = family['kind']
+            if kind == 'gauge' and not gauges:
+                continue
+            buckets = tuple(family['buckets']) if family['buckets'] else None
+            target = merged.setdefault(name, {'kind': kind, 'help': family['help'], 'buckets': buckets,
+                                              'series': {}})['series']
+            for labels, value in family['series']:
+                labels = tuple(tuple(pair) for pair in labels)
+                if kind == 'gauge':
+                    target[labels + (('pid', str(pid)),)] = value
+                elif kind == 'histogram':
+                    histogram = target.get(labels)
+                    if histogram is None:
+                        histogram = target[labels] = _Histogram(buckets)
+                    histogram.counts = [a + b for a, b in zip(histogram.counts, value['counts'])]
+                    histogram.total += value['total']
+                    histogram.count += value['count']
+                else:
+                    target[labels] = target.get(labels, 0) + value
+    return merged
+
+
+def _render_families(metrics):
+    lines = []
+    for name in sorted(metrics):
+        family = metrics[name]
+        lines.append(f'# HELP {name} {family["help"]}')
+        lines.append(f'# TYPE {name} {family["kind"]}')
+        for labels, value in sorted(family['series'].items()):
+            if family['kind'] != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(value.buckets, value.counts):
+                cumulative += count
+                bucket_labels = labels + (('le', _format_value(bound)),)
+                lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+            inf_labels = labels + (('le', '+Inf'),)
+            lines.append(f'{name}_bucket{_format_labels(inf_labels)} {value.count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value.total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+registry = MetricsRegistry()
+os.register_at_fork(after_in_child=registry.reset)
+
+
+def _snapshot_path(pid):
+    return os.path.join(_settings['metrics_dir'], f'metrics-{pid}.json')
+
+
+def _write_json(path, data):
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'w') as handle:
+        json.dump(data, handle)
+    os.replace(temp, path)
+
+
+def write_snapshot():
+    """Replace this process's snapshot in METRICS_DIR"""
+    _write_json(_snapshot_path(os.getpid()), registry.snapshot())
+
+
+def _exited(pid):
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except (PermissionError, ValueError):
+        return False
+    return False
+
+
+def retire_exited():
+    """Fold the snapshots of exited processes into the retired one and remove their files.
+
+    Their counters and histograms live on in metrics-retired.json; their
+    gauges are dropped. Runs under an exclusive lock on the folder so two
+    scrapes never fold the same snapshot twice.
+    """
+    if fcntl is None:
+        return
+    with open(os.path.join(_settings['metrics_dir'], 'metrics.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        snapshots = read_snapshots()
+        exited = {pid: snapshot for pid, snapshot in snapshots.items() if pid != RETIRED and _exited(pid)}
+        if not exited:
+            return
+        exited[RETIRED] = snapshots.get(RETIRED, {})
+        _write_json(_snapshot_path(RETIRED), _snapshot_families(merge_snapshots(exited, gauges=False)))
+        for pid in exited:
+            if pid != RETIRED:
+                os.remove(_snapshot_path(pid))
+
+
+def read_snapshots():
+    """{pid: snapshot} of every process that has written one, skipping unreadable files"""
+    snapshots = {}
+    for path in glob.glob(_snapshot_path('*')):
+        pid = os.path.basename(path)[len('metrics-'):-len('.json')]
+        try:
+            with open(path) as handle:
+                snapshots[pid] = json.load(handle)
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+class SnapshotWriter:
+    """Writes the registry snapshot every FLUSH_SECONDS from one background thread per process, started on the first request"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget the thread and lock; a forked worker starts its own"""
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or not _settings['metrics_dir']:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='metrics-snapshot', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                write_snapshot()
+            except Exception:
+                logger.exception('Writing the metrics snapshot failed')
+
+
+snapshots = SnapshotWriter()
+os.register_at_fork(after_in_child=snapshots.reset)
+
+
+def _before_request():
+    snapshots.start()
+    _state.route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    _state.stats = []
+    _state.started = time.perf_counter()
+
+
+def _after_request(response):
+    started = getattr(_state, 'started', None)
+    if started is None:
+        return response
+
+    duration = time.perf_counter() - started
+    response_bytes = None if response.is_streamed else response.calculate_content_length()
+    registry.record_request(
+        _state.route, request.method, response.status_code,
+        duration, response_bytes, _state.stats
+    )
+    _state.started = None
+    _state.stats = None
+    _state.route = None
+    return response
+
+
+def metrics_response():
+    """All workers' metrics when METRICS_DIR is set, else this process's"""
+    if not _settings['metrics_dir']:
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+    write_snapshot()
+    retire_exited()
+    text = _render_families(merge_snapshots(read_snapshots()))
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Register the profiling hooks and the /api/metrics endpoint"""
+    _settings['metrics_dir'] = app.config.get('METRICS_DIR')
+    if _settings['metrics_dir']:
+        os.makedirs(_settings['metrics_dir'], exist_ok=True)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/api/metrics', 'metrics', metrics_response)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Dictionary encoding of inspection task site, method, inspector and status.
+
+inspection_tasks references the sites, methods, inspectors and status_types
+lookup tables by integer id. Names are interned into the lookups in bulk on
+ingest, the inspection_task_details view joins them back for API responses,
+and migrate_inspection_tasks converts a database that still stores the
+names as text, in batches.
+"""
+
+import sqlite3
+import time
+
+DATABASE = 'inspection_tracker.db'
+
+# field -> (lookup table, name column, inspection_tasks id column)
+LOOKUPS = {
+    'site': ('sites', 'site_code', 'site_id'),
+    'method': ('methods', 'method_name', 'method_id'),
+    'inspector': ('inspectors', 'name', 'inspector_id'),
+    'status': ('status_types', 'status_name', 'status_id')
+}
+
+# Names stored as NULL ids, and what the details view returns for NULL
+NULL_NAMES = {
+    'site': {'', 'nan', 'None'},
+    'method': {'', 'nan', 'None'},
+    'inspector': {'', 'nan', 'None', 'Unassigned'},
+    'status': {'', 'nan', 'None'}
+}
+NULL_DISPLAY = {
+    'site': '',
+    'method': '',
+    'inspector': 'Unassigned',
+    'status': ''
+}
+
+MIGRATION_BATCH_SIZE = 5000
+NAME_BATCH_SIZE = 500
+
+INSPECTION_TASKS_SQL = '''
+    CREATE TABLE IF NOT EXISTS inspection_tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        site_id INTEGER,
+        site_project TEXT,
+        hierarchy_item_name TEXT,
+        description TEXT,
+        mechanism TEXT,
+        method_id INTEGER,
+        extent TEXT,
+        frequency REAL,
+        interval_type TEXT,
+        inspection_priority INTEGER,
+        last_inspection_date DATE,
+        install_date DATE,
+        due_date DATE,
+        current_inspection_date DATE,
+        inspector_id INTEGER,
+        status_id INTEGER,
+        comments TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (site_id) REFERENCES sites (id),
+        FOREIGN KEY (method_id) REFERENCES methods (id),
+        FOREIGN KEY (inspector_id) REFERENCES inspectors (id),
+        FOREIGN KEY (status_id) REFERENCES status_types (id)
+    )
+'''
+
+INSPECTION_TASK_INDEXES = [
+    # Covers the per-site and per-site/method rollups of the dashboards and reports
+    'CREATE INDEX IF NOT EXISTS idx_inspection_tasks_site_method_status_due '
+    'ON inspection_tasks (site_id, method_id, status_id, due_date)',
+    # Covers per-inspector workload and inspector/site affinity
+    'CREATE INDEX IF NOT EXISTS idx_inspection_tasks_inspector_site_status_due '
+    'ON inspection_tasks (inspector_id, site_id, status_id, due_date)',
+    'CREATE INDEX IF NOT EXISTS idx_inspection_tasks_status_due ON inspection_tasks (status_id, due_date)',
+    'CREATE INDEX IF NOT EXISTS idx_inspection_tasks_due_date ON inspection_tasks (due_date)',
+    'CREATE INDEX IF NOT EXISTS idx_inspection_tasks_updated_at ON inspection_tasks (updated_at)'
+]
+
+# Columns of the details view, in the order the API has always returned them
+TASK_FIELDS = [
+    'id', 'site', 'site_project', 'hierarchy_item_name', 'description', 'mechanism',
+    'method', 'extent', 'frequency', 'interval_type', 'inspection_priority',
+    'last_inspection_date', 'install_date', 'due_date', 'current_inspection_date',
+    'inspector', 'status', 'comments', 'created_at', 'updated_at'
+]
+
+TASK_DETAILS_VIEW_SQL = '''
+    CREATE VIEW IF NOT EXISTS inspection_task_details AS
+    SELECT
+        t.id,
+        COALESCE(s.site_code, '') AS site,
+        t.site_project,
+        t.hierarchy_item_name,
+        t.description,
+        t.mechanism,
+        COALESCE(m.method_name, '') AS method,
+        t.extent,
+        t.frequency,
+        t.interval_type,
+        t.inspection_priority,
+        t.last_inspection_date,
+        t.install_date,
+        t.due_date,
+        t.current_inspection_date,
+        COALESCE(i.name, 'Unassigned') AS inspector,
+        COALESCE(st.status_name, '') AS status,
+        t.comments,
+        t.created_at,
+        t.updated_at,
+        t.site_id,
+        t.method_id,
+        t.inspector_id,
+        t.status_id
+    FROM inspection_tasks t
+    LEFT JOIN sites s ON s.id = t.site_id
+    LEFT JOIN methods m ON m.id = t.method_id
+    LEFT JOIN inspectors i ON i.id = t.inspector_id
+    LEFT JOIN status_types st ON st.id = t.status_id
+'''
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _clean_name(field, name):
+    if name is None:
+        return None
+    name = str(name).strip()
+    return None if name in NULL_NAMES[field] else name
+
+
+def intern_names(conn, field, names):
+    """Resolve names to lookup ids in bulk, adding unknown names to the lookup.
+
+    Returns a dict covering every given name; names that encode as NULL map
+    to None.
+    """
+    table, column, _ = LOOKUPS[field]
+    mapping = {}
+    wanted = set()
+    for name in set(names):
+        cleaned = _clean_name(field, name)
+        if cleaned is None:
+            mapping[name] = None
+        else:
+            wanted.add(cleaned)
+
+    wanted = sorted(wanted)
+    cursor = conn.cursor()
+    if table == 'sites':
+        cursor.executemany(
+            'INSERT OR IGNORE INTO sites (site_code, site_name) VALUES (?, ?)',
+            ((name, f'Site {name}') for name in wanted)
+        )
+    else:
+        cursor.executemany(
+            f'INSERT OR IGNORE INTO {table} ({column}) VALUES (?)',
+            ((name,) for name in wanted)
+        )
+
+    ids = {}
+    for batch in _chunks(wanted, NAME_BATCH_SIZE):
+        placeholders = ', '.join('?' for _ in batch)
+        ids.update(cursor.execute(
+            f'SELECT {column}, id FROM {table} WHERE {column} IN ({placeholders})', batch
+        ).fetchall())
+
+    for name in names:
+        if name not in mapping:
+            mapping[name] = ids.get(_clean_name(field, name))
+    return mapping
+
+
+def lookup_id(conn, field, name):
+    """Resolve a single name to its lookup id, interning it when new.
+
+    For ingest and the tracker's own names ('Claimed'); names from request
+    bodies go through find_id.
+    """
+    return intern_names(conn, field, [name])[name]
+
+
+class UnknownName(ValueError):
+    """A name missing from its lookup table"""
+
+
+def find_id(conn, field, name):
+    """Resolve a single name to its existing lookup id without adding it.
+
+    Names that encode as NULL give None; any other name missing from the
+    lookup raises UnknownName.
+    """
+    cleaned = _clean_name(field, name)
+    if cleaned is None:
+        return None
+    table, column, _ = LOOKUPS[field]
+    row = conn.execute(f'SELECT id FROM {table} WHERE {column} = ?', (cleaned,)).fetchone()
+    if row is None:
+        raise UnknownName(f'Unknown {field}: {cleaned}')
+    return row[0]
+
+
+def id_list_sql(conn, field, names):
+    """Comma-separated ids of existing lookup names, for inlining into IN (...)
+
+    Unknown names are left out; -1 keeps the list valid when none exist.
+    """
+    table, column, _ = LOOKUPS[field]
+    names = list(names)
+    placeholders = ', '.join('?' for _ in names)
+    rows = conn.execute(
+        f'SELECT id FROM {table} WHERE {column} IN ({placeholders}) ORDER BY id', names
+    ).fetchall()
+    return ', '.join(str(int(row[0])) for row in rows) or '-1'
+
+
+def create_inspection_tasks(conn):
+    cursor = conn.cursor()
+    cursor.execute(INSPECTION_TASKS_SQL)
+    for statement in INSPECTION_TASK_INDEXES:
+        cursor.execute(statement)
+    cursor.execute(TASK_DETAILS_VIEW_SQL)
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+
+
+def needs_migration(conn):
+    columns = _columns(conn, 'inspection_tasks')
+    return bool(columns) and 'site_id' not in columns
+
+
+def migrate_inspection_tasks(conn, batch_size=MIGRATION_BATCH_SIZE, verbose=False):
+    """Rewrite a text-keyed inspection_tasks table into the id-keyed layout.
+
+    Rows are copied into inspection_tasks_encoded in id order, one committed
+    batch at a time, so the copy can be interrupted and resumed and never
+    holds the write lock for long. The final swap re-copies rows touched
+    since the copy started, then replaces the table in one short transaction.
+    """
+    if not needs_migration(conn):
+        return 0
+
+    cursor = conn.cursor()
+    started_at = cursor.execute("SELECT datetime('now')").fetchone()[0]
+
+    # Intern every distinct name up front so batches only do id joins
+    for field in LOOKUPS:
+        names = [name for (name,) in cursor.execute(
+            f'SELECT DISTINCT {field} FROM inspection_tasks').fetchall()]
+        intern_names(conn, field, names)
+    conn.commit()
+
+    cursor.execute(INSPECTION_TASKS_SQL.replace('inspection_tasks', 'inspection_tasks_encoded', 1))
+    conn.commit()
+
+    def copy_sql(where):
+        return f'''
+            INSERT OR REPLACE INTO inspection_tasks_encoded
+            SELECT
+                t.id, s.id, t.site_project, t.hierarchy_item_name, t.description, t.mechanism,
+                m.id, t.extent, t.frequency, t.interval_type, t.inspection_priority,
+                t.last_inspection_date, t.install_date, t.due_date, t.current_inspection_date,
+                i.id, st.id, t.comments, t.created_at, t.updated_at
+            FROM inspection_tasks t
+            LEFT JOIN sites s ON s.site_code = trim(t.site)
+            LEFT JOIN methods m ON m.method_name = trim(t.method)
+            LEFT JOIN inspectors i ON i.name = trim(t.inspector) AND trim(t.inspector) != 'Unassigned'
+            LEFT JOIN status_types st ON st.status_name = trim(t.status)
+            WHERE {where}
+        '''
+
+    copied = 0
+    batch_sql = copy_sql('t.id > ? ORDER BY t.id LIMIT ?')
+    while True:
+        last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM inspection_tasks_encoded').fetchone()[0]
+        cursor.execute(batch_sql, (last_id, batch_size))
+        conn.commit()
+        if cursor.rowcount <= 0:
+            break
+        copied += cursor.rowcount
+        if verbose:
+            print(f"Copied {copied} tasks...")
+
+    # Swap: catch up on late writes, then replace the table
+    cursor.execute('BEGIN IMMEDIATE')
+    last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM inspection_tasks_encoded').fetchone()[0]
+    cursor.execute(copy_sql('t.id > ? OR t.updated_at >= ?'), (last_id, started_at))
+    cursor.execute('DELETE FROM inspection_tasks_encoded WHERE id NOT IN (SELECT id FROM inspection_tasks)')
+    cursor.execute('DROP VIEW IF EXISTS inspection_task_details')
+    cursor.execute('DROP TABLE inspection_tasks')
+    cursor.execute('ALTER TABLE inspection_tasks_encoded RENAME TO inspection_tasks')
+    create_inspection_tasks(conn)
+    conn.commit()
+    return copied
+
+
+if __name__ == '__main__':
+    conn = sqlite3.connect(DATABASE)
+    if not needs_migration(conn):
+        print("inspection_tasks already references lookups by id")
+    else:
+        print("Encoding inspection_tasks site, method, inspector and status as lookup ids...")
+        started = time.perf_counter()
+        count = migrate_inspection_tasks(conn, verbose=True)
+        print(f"Migrated {count} tasks in {time.perf_counter() - started:.1f}s")
+        print("Reclaiming space from the old table...")
+        conn.execute('VACUUM')
+    conn.close()
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Scheduled database maintenance: planner statistics, incremental vacuum and
+integrity checks, with size telemetry.
+
+A background thread per process checks every MAINTENANCE_CHECK_SECONDS
+what is due:
+
+- analyze: ANALYZE and PRAGMA optimize once
+  MAINTENANCE_ANALYZE_WRITES task changes have been made since the last
+  run (counted with the change sequence), or the database has no
+  statistics yet;
+- tombstones: delete sync tombstones older than SYNC_TOMBSTONE_DAYS and
+  raise the sync horizon past them (clients behind it resync in full);
+- vacuum: PRAGMA incremental_vacuum in small steps, each its own
+  transaction, for at most MAINTENANCE_VACUUM_SECONDS, once the freelist
+  holds MAINTENANCE_VACUUM_MIN_PAGES pages;
+- integrity: PRAGMA quick_check every MAINTENANCE_INTEGRITY_SECONDS, or
+  on the next check after a run that raised.
+
+Each run is recorded in maintenance_runs. Analyze, tombstone and integrity
+runs are claimed under the write lock and vacuum steps re-read the
+freelist under it, so several worker processes never repeat each other's
+work. Incremental vacuum needs auto_vacuum=INCREMENTAL, which new databases
+get from init_db; an existing database is converted once with
+--enable-incremental-vacuum (a full VACUUM).
+
+Failures and integrity problems are logged to the acuren.maintenance logger
+and counted in acuren_maintenance_runs_total on /api/metrics. POST
+/api/maintenance/run queues the run on a background thread and returns 202;
+its results land in maintenance_runs, shown by GET /api/maintenance.
+
+    python maintenance.py inspection_tracker.db              # run what is due
+    python maintenance.py inspection_tracker.db --run analyze --run integrity
+    python maintenance.py inspection_tracker.db --stats
+    python maintenance.py inspection_tracker.db --enable-incremental-vacuum
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import jsonify, request
+
+from delta_sync import DEFAULT_TOMBSTONE_DAYS, current_seq, oldest_tombstone_days, prune_tombstones
+from instrumentation import TracedConnection, registry
+
+DEFAULT_CHECK_SECONDS = 600
+DEFAULT_ANALYZE_WRITES = 50000
+DEFAULT_VACUUM_SECONDS = 2.0
+DEFAULT_VACUUM_MIN_PAGES = 1024
+DEFAULT_INTEGRITY_SECONDS = 86400
+
+VACUUM_STEP_PAGES = 256
+INTEGRITY_ERRORS_KEPT = 20
+
+TASKS = ('analyze', 'tombstones', 'vacuum', 'integrity')
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+logger = logging.getLogger('acuren.maintenance')
+
+MAINTENANCE_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS maintenance_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task TEXT NOT NULL,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        seconds REAL,
+        change_seq INTEGER,
+        result TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_maintenance_runs_task ON maintenance_runs (task, id)',
+    # With planner statistics, the site and status filters of the task list would otherwise
+    # be read from the upload index and sorted; this one returns them in due date order
+    'CREATE INDEX IF NOT EXISTS idx_inspection_tasks_site_status_due ON inspection_tasks (site_id, status_id, due_date)'
+]
+
+_settings = {
+    'database': None,
+    'check_seconds': DEFAULT_CHECK_SECONDS,
+    'analyze_writes': DEFAULT_ANALYZE_WRITES,
+    'tombstone_days': DEFAULT_TOMBSTONE_DAYS,
+    'vacuum_seconds': DEFAULT_VACUUM_SECONDS,
+    'vacuum_min_pages': DEFAULT_VACUUM_MIN_PAGES,
+    'integrity_seconds': DEFAULT_INTEGRITY_SECONDS
+}
+
+
+def create_maintenance_tables(conn):
+    cursor = conn.cursor()
+    for statement in MAINTENANCE_TABLES_SQL:
+        cursor.execute(statement)
+
+
+def _pragma(conn, name):
+    return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+
+def _last_run(conn, task):
+    """(change_seq, age in seconds, result JSON) of the task's last run, or None"""
+    return conn.execute('''
+        SELECT change_seq, (julianday('now') - julianday(started_at)) * 86400, result
+        FROM maintenance_runs WHERE task = ? ORDER BY id DESC LIMIT 1
+    ''', (task,)).fetchone()
+
+
+def _has_statistics(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None
+
+
+def is_due(conn, task):
+    last = _last_run(conn, task)
+    if task == 'analyze':
+        return (last is None or not _has_statistics(conn)
+                or current_seq(conn) - (last[0] or 0) >= _settings['analyze_writes'])
+    if task == 'tombstones':
+        oldest = oldest_tombstone_days(conn)
+        return oldest is not None and oldest >= _settings['tombstone_days']
+    if task == 'vacuum':
+        return _pragma(conn, 'auto_vacuum') == 2 and _pragma(conn, 'freelist_count') >= _settings['vacuum_min_pages']
+    # A check that raised is retried; one still running (or whose process died) counts as done
+    return last is None or last[1] >= _settings['integrity_seconds'] or 'error' in json.loads(last[2] or '{}')
+
+
+def _record(conn, task, started, seq, result):
+    conn.execute('INSERT INTO maintenance_runs (task, seconds, change_seq, result) VALUES (?, ?, ?, ?)',
+                 (task, round(time.perf_counter() - started, 3), seq, json.dumps(result)))
+
+
+def run_analyze(conn, force=False):
+    """Refresh the planner statistics under the write lock; None when not due"""
+    started = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if not force and not is_due(conn, 'analyze'):
+            conn.rollback()
+            return None
+        seq = current_seq(conn)
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+        result = {'change_seq': seq}
+        _record(conn, 'analyze', started, seq, result)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+def run_prune_tombstones(conn, force=False):
+    """Delete sync tombstones past the retention under the write lock; None when not due"""
+    started = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if not force and not is_due(conn, 'tombstones'):
+            conn.rollback()
+            return None
+        removed = prune_tombstones(conn, _settings['tombstone_days'])
+        seq = current_seq(conn)
+        result = {'removed': removed, 'retention_days': _settings['tombstone_days']}
+        _record(conn, 'tombstones', started, seq, result)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+def run_incremental_vacuum(conn, budget_seconds=None, force=False):
+    """Return free pages to the filesystem in steps until the freelist is empty or the budget is spent"""
+    budget_seconds = _settings['vacuum_seconds'] if budget_seconds is None else budget_seconds
+    if _pragma(conn, 'auto_vacuum') != 2:
+        return {'skipped': 'auto_vacuum is not incremental; convert with --enable-incremental-vacuum'} if force else None
+    if not force and not is_due(conn, 'vacuum'):
+        return None
+
+    started = time.perf_counter()
+    before = _pragma(conn, 'freelist_count')
+    free = before
+    while free and time.perf_counter() - started < budget_seconds:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})').fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        free = _pragma(conn, 'freelist_count')
+
+    result = {'pages_freed': before - free, 'pages_left': free, 'page_size': _pragma(conn, 'page_size')}
+    _record(conn, 'vacuum', started, None, result)
+    conn.commit()
+    return result
+
+
+def run_integrity_check(conn, full=False, force=False):
+    """PRAGMA quick_check (integrity_check when full); None when not due.
+
+    The run is recorded before the check so other processes do not start
+    one too, and its result filled in afterwards, including when the check
+    raises; the error is then re-raised.
+    """
+    started = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if not force and not is_due(conn, 'integrity'):
+            conn.rollback()
+            return None
+        _record(conn, 'integrity', started, None, {'running': True})
+        run_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    check = 'integrity_check' if full else 'quick_check'
+    error = None
+    try:
+        messages = [message for (message,) in conn.execute(f'PRAGMA {check}({INTEGRITY_ERRORS_KEPT})')]
+        result = {'check': check, 'ok': messages == ['ok'], 'messages': messages}
+    except Exception as e:
+        error = e
+        result = {'check': check, 'ok': False, 'error': str(e)}
+    if error is None and not result['ok']:
+        logger.error('Integrity check found problems: %s', messages)
+    conn.execute('UPDATE maintenance_runs SET seconds = ?, result = ? WHERE id = ?',
+                 (round(time.perf_counter() - started, 3), json.dumps(result), run_id))
+    conn.commit()
+    if error is not None:
+        raise error
+    return result
+
+
+def _count(task, outcome):
+    registry.inc('acuren_maintenance_runs_total', (('task', task), ('outcome', outcome)),
+                 help_text='Maintenance runs by task and outcome: ok, problems (integrity) or failed.')
+
+
+def run_maintenance(conn, tasks=None):
+    """Run the named tasks, or those that are due when tasks is None; returns {task: result} of those run.
+
+    A task that raises is logged and reported as {'error': ...} without
+    stopping the others.
+    """
+    forced = tasks is not None
+    results = {}
+    for task in (tasks or TASKS):
+        try:
+            if task == 'analyze':
+                result = run_analyze(conn, force=forced)
+            elif task == 'tombstones':
+                result = run_prune_tombstones(conn, force=forced)
+            elif task == 'vacuum':
+                result = run_incremental_vacuum(conn, force=forced)
+            else:
+                result = run_integrity_check(conn, force=forced)
+        except Exception as e:
+            logger.exception('Database maintenance task %s failed', task)
+            _count(task, 'failed')
+            results[task] = {'error': str(e)}
+            continue
+        if result is not None:
+            _count(task, 'problems' if result.get('ok') is False else 'ok')
+            results[task] = result
+    return results
+
+
+def table_sizes(conn):
+    """Bytes per table with its indexes, from the dbstat table when SQLite has it.
+
+    Without dbstat only the estimated row counts of the planner statistics are known.
+    """
+    owners = dict(conn.execute("SELECT name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')"))
+    rows = {}
+    if _has_statistics(conn):
+        # The first number of every stat is the table's (estimated) row count
+        for table, stat in conn.execute('SELECT tbl, stat FROM sqlite_stat1'):
+            rows.setdefault(table, int(stat.split()[0]))
+
+    sizes = {}
+    try:
+        pages = conn.execute("SELECT name, pgsize FROM dbstat WHERE aggregate = TRUE").fetchall()
+    except sqlite3.OperationalError:
+        pages = None
+    if pages is None:
+        return [{'name': table, 'estimated_rows': count, 'bytes': None, 'index_bytes': None}
+                for table, count in sorted(rows.items())]
+
+    for name, size in pages:
+        table = owners.get(name, name)
+        entry = sizes.setdefault(table, {'name': table, 'estimated_rows': rows.get(table), 'bytes': 0, 'index_bytes': 0})
+        entry['index_bytes' if table != name else 'bytes'] += size
+    return sorted(sizes.values(), key=lambda entry: -(entry['bytes'] + entry['index_bytes']))
+
+
+def database_stats(conn, tables=True):
+    """Page counts, file sizes, the last run of each task and, when tables, per-table sizes"""
+    database_file = conn.execute('PRAGMA database_list').fetchone()[2]
+    page_size = _pragma(conn, 'page_size')
+    stats = {
+        'page_size': page_size,
+        'page_count': _pragma(conn, 'page_count'),
+        'freelist_count': _pragma(conn, 'freelist_count'),
+        'auto_vacuum': AUTO_VACUUM_MODES.get(_pragma(conn, 'auto_vacuum')),
+        'journal_mode': _pragma(conn, 'journal_mode'),
+        'file_bytes': os.path.getsize(database_file) if database_file else None,
+        'wal_bytes': (os.path.getsize(database_file + '-wal')
+                      if database_file and os.path.exists(database_file + '-wal') else 0),
+        'change_seq': current_seq(conn),
+        'last_runs': {}
+    }
+    stats['free_bytes'] = stats['freelist_count'] * page_size
+    for task in TASKS:
+        row = conn.execute('''
+            SELECT started_at, seconds, change_seq, result FROM maintenance_runs
+            WHERE task = ? ORDER BY id DESC LIMIT 1
+        ''', (task,)).fetchone()
+        if row:
+            stats['last_runs'][task] = {'started_at': row[0], 'seconds': row[1], 'change_seq': row[2],
+                                        'result': json.loads(row[3]) if row[3] else None}
+    if tables:
+        stats['tables'] = table_sizes(conn)
+    return stats
+
+
+def enable_incremental_vacuum(conn):
+    """Switch an existing database to auto_vacuum=INCREMENTAL; rewrites the whole file (VACUUM)"""
+    conn.commit()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+
+def _connect():
+    return sqlite3.connect(_settings['database'], factory=TracedConnection, timeout=30)
+
+
+class MaintenanceScheduler:
+    """Runs due maintenance every check_seconds from one background thread per process, started on the first request.
+
+    Runs requested through the API go through a single-thread queue, one at a time.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget the threads and lock; a forked worker starts its own"""
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+
+    def start(self):
+        if self._thread is not None or not _settings['check_seconds']:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-maintenance', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(_settings['check_seconds'])
+            self._run_logged()
+
+    def _run_logged(self, tasks=None):
+        try:
+            results = self.run(tasks)
+            if results:
+                logger.info('Database maintenance: %s', results)
+        except Exception:
+            logger.exception('Database maintenance failed')
+
+    def submit(self, tasks=None):
+        """Queue a run of the named (or due) tasks on the background thread"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-maintenance-run')
+        self._executor.submit(self._run_logged, tasks)
+
+    def drain(self):
+        """Wait for the queued runs to finish"""
+        if self._executor is not None:
+            self._executor.submit(lambda: None).result()
+
+    def run(self, tasks=None):
+        conn = _connect()
+        try:
+            return run_maintenance(conn, tasks)
+        finally:
+            conn.close()
+
+
+scheduler = MaintenanceScheduler()
+os.register_at_fork(after_in_child=scheduler.reset)
+
+
+def _start_scheduler():
+    scheduler.start()
+
+
+def maintenance_status():
+    """Database size telemetry, the last maintenance runs and what is due (?tables=0 skips the per-table sizes)"""
+    conn = _connect()
+    try:
+        stats = database_stats(conn, tables=request.args.get('tables', '1') not in ('0', 'false'))
+        stats['due'] = {task: is_due(conn, task) for task in TASKS}
+    finally:
+        conn.close()
+    return jsonify(stats)
+
+
+def run_maintenance_now():
+    """Queue the tasks named in ?task= (repeatable), or the due ones, for a background run"""
+    tasks = request.args.getlist('task') or None
+    unknown = [task for task in tasks or [] if task not in TASKS]
+    if unknown:
+        return jsonify({'error': f'Unknown maintenance tasks: {", ".join(unknown)}'}), 400
+    scheduler.submit(tasks)
+    return jsonify({'message': 'Maintenance queued; results appear under last_runs of /api/maintenance',
+                    'tasks': tasks or 'due'}), 202
+
+
+def init_app(app):
+    """Point the scheduler at the app's database, start it on the first request and register its endpoints"""
+    _settings['database'] = app.config['DATABASE']
+    _settings['check_seconds'] = float(app.config.get('MAINTENANCE_CHECK_SECONDS', DEFAULT_CHECK_SECONDS))
+    _settings['analyze_writes'] = int(app.config.get('MAINTENANCE_ANALYZE_WRITES', DEFAULT_ANALYZE_WRITES))
+    _settings['tombstone_days'] = float(app.config.get('SYNC_TOMBSTONE_DAYS', DEFAULT_TOMBSTONE_DAYS))
+    _settings['vacuum_seconds'] = float(app.config.get('MAINTENANCE_VACUUM_SECONDS', DEFAULT_VACUUM_SECONDS))
+    _settings['vacuum_min_pages'] = int(app.config.get('MAINTENANCE_VACUUM_MIN_PAGES', DEFAULT_VACUUM_MIN_PAGES))
+    _settings['integrity_seconds'] = float(app.config.get('MAINTENANCE_INTEGRITY_SECONDS', DEFAULT_INTEGRITY_SECONDS))
+    app.before_request(_start_scheduler)
+    app.add_url_rule('/api/maintenance', 'maintenance_status', maintenance_status)
+    app.add_url_rule('/api/maintenance/run', 'maintenance_run', run_maintenance_now, methods=['POST'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Database maintenance: statistics, incremental vacuum, integrity')
+    parser.add_argument('database', nargs='?', default='inspection_tracker.db')
+    parser.add_argument('--run', action='append', choices=TASKS, help='Run this task now (repeatable)')
+    parser.add_argument('--full-integrity-check', action='store_true', help='integrity_check instead of quick_check')
+    parser.add_argument('--stats', action='store_true', help='Print size telemetry and exit')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='Convert the database to auto_vacuum=INCREMENTAL (full VACUUM)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database, timeout=30)
+    started = time.perf_counter()
+    if args.stats:
+        print(json.dumps(database_stats(conn), indent=2))
+    elif args.enable_incremental_vacuum:
+        enable_incremental_vacuum(conn)
+        print(f"auto_vacuum is now {AUTO_VACUUM_MODES.get(_pragma(conn, 'auto_vacuum'))} "
+              f"({time.perf_counter() - started:.1f}s)")
+    elif args.full_integrity_check:
+        print(run_integrity_check(conn, full=True, force=True))
+    else:
+        print(f"{run_maintenance(conn, args.run)} in {time.perf_counter() - started:.2f}s")
+    conn.close()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+schema_version records every migration applied to a database, and migrate()
+applies the missing ones in version order. A migration is a list of steps:
+schema changes, which must be safe to run again after an interruption
+(CREATE ... IF NOT EXISTS, column checks), and Backfills, which rewrite
+existing rows in id ranges. Each backfill batch commits together with its
+progress in schema_backfills, so a 1M-row rewrite never holds the write
+lock for more than one batch and an interrupted run resumes where it
+stopped instead of starting over.
+
+Databases created before schema_version existed have every migration
+applied again; all steps find their work already done.
+
+    python migrations.py inspection_tracker.db            # migrate
+    python migrations.py inspection_tracker.db --status   # list applied and pending
+"""
+
+import argparse
+import sqlite3
+import time
+
+from analytics_snapshot import create_snapshot_lease_table
+from attachments import create_attachment_tables
+from authorization import create_authorization_tables
+from complete_schema import create_data_model_tables, seed_roles
+from delta_sync import CHANGE_SEQ_BACKFILL_SQL, add_change_seq_column, create_sync_horizon, install_change_triggers
+from due_alerts import create_due_alert_tables
+from facets import create_facet_tables
+from hierarchy import create_hierarchy_remap, create_hierarchy_tables, map_tasks
+from lookup_encoding import create_inspection_tasks, migrate_inspection_tasks
+from maintenance import create_maintenance_tables
+from scope_files import create_scope_upload_tracking
+from task_links import create_link_indexes
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Pause between backfill batches: SQLite's busy handler polls, so without a
+# gap a writer waiting on the lock can miss every window between batches
+DEFAULT_PAUSE_SECONDS = 0.02
+
+MIGRATION_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        seconds REAL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS schema_backfills (
+        version INTEGER,
+        name TEXT,
+        last_id INTEGER,
+        rows_changed INTEGER,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (version, name)
+    )
+    '''
+]
+
+BASE_TABLES_SQL = [
+    # Lookup tables for dropdown values
+    '''
+    CREATE TABLE IF NOT EXISTS inspectors (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE,
+        role TEXT DEFAULT 'Field Inspector',
+        active BOOLEAN DEFAULT 1
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sites (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        site_code TEXT UNIQUE,
+        site_name TEXT,
+        active BOOLEAN DEFAULT 1
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS methods (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        method_name TEXT UNIQUE,
+        description TEXT,
+        active BOOLEAN DEFAULT 1
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS status_types (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        status_name TEXT UNIQUE,
+        description TEXT,
+        active BOOLEAN DEFAULT 1
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        email TEXT,
+        role TEXT,
+        active BOOLEAN DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        task_id INTEGER,
+        message TEXT,
+        notification_type TEXT,
+        read_status BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (task_id) REFERENCES inspection_tasks (id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS scope_uploads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT,
+        upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        uploaded_by TEXT,
+        status TEXT DEFAULT 'pending_review',
+        records_count INTEGER,
+        review_notes TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS task_assignments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER,
+        assigned_by TEXT,
+        assigned_to TEXT,
+        assignment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        notes TEXT,
+        FOREIGN KEY (task_id) REFERENCES inspection_tasks (id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS progress_reports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        report_date DATE,
+        site TEXT,
+        total_tasks INTEGER,
+        completed_tasks INTEGER,
+        in_progress_tasks INTEGER,
+        overdue_tasks INTEGER,
+        completion_rate REAL,
+        generated_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    '''
+]
+
+
+class Backfill:
+    """A data rewrite over a table, run in id ranges that each commit with their progress.
+
+    sql is a statement taking the range bounds (after_id, up_to_id) as its
+    two parameters, e.g. `UPDATE t SET ... WHERE id > ? AND id <= ?`, or a
+    function(conn, after_id, up_to_id) returning the rows it changed. Rows
+    inserted while it runs are picked up by the later ranges.
+    """
+
+    def __init__(self, name, table, sql, batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE_SECONDS):
+        self.name = name
+        self.table = table
+        self.sql = sql
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def run(self, conn, version, verbose=False):
+        """Run the remaining ranges; returns the rows changed by this run"""
+        cursor = conn.cursor()
+        progress = cursor.execute('SELECT last_id, rows_changed FROM schema_backfills WHERE version = ? AND name = ?',
+                                  (version, self.name)).fetchone()
+        last_id, total = progress or (0, 0)
+        changed = 0
+        while True:
+            up_to = cursor.execute(f'''
+                SELECT MAX(id) FROM (SELECT id FROM {self.table} WHERE id > ? ORDER BY id LIMIT ?)
+            ''', (last_id, self.batch_size)).fetchone()[0]
+            if up_to is None:
+                break
+            if callable(self.sql):
+                changed += self.sql(conn, last_id, up_to)
+            else:
+                cursor.execute(self.sql, (last_id, up_to))
+                changed += max(cursor.rowcount, 0)
+            cursor.execute('''
+                INSERT OR REPLACE INTO schema_backfills (version, name, last_id, rows_changed, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (version, self.name, up_to, total + changed))
+            conn.commit()
+            last_id = up_to
+            if verbose:
+                print(f"  {self.name}: through id {last_id}, {total + changed} rows changed")
+            time.sleep(self.pause)
+        return changed
+
+
+def create_base_tables(conn):
+    cursor = conn.cursor()
+    for statement in BASE_TABLES_SQL:
+        cursor.execute(statement)
+
+
+# (version, name, steps), in the order they apply; never renumber or edit an applied one
+MIGRATIONS = [
+    (1, 'base tables', [create_base_tables]),
+    # Converts a text-keyed table in committed batches of its own (lookup_encoding)
+    (2, 'id-keyed inspection tasks', [migrate_inspection_tasks, create_inspection_tasks]),
+    (3, 'change tracking', [
+        add_change_seq_column,
+        Backfill('change_seq', 'inspection_tasks', CHANGE_SEQ_BACKFILL_SQL),
+        install_change_triggers
+    ]),
+    (4, 'scope upload tracking', [create_scope_upload_tracking]),
+    (5, 'attachments', [create_attachment_tables]),
+    (6, 'data model tables', [create_data_model_tables]),
+    (7, 'task link indexes', [create_link_indexes]),
+    (8, 'asset hierarchy', [create_hierarchy_tables, Backfill('task_hierarchy', 'inspection_tasks', map_tasks)]),
+    (9, 'due alerts', [create_due_alert_tables]),
+    (10, 'authorization version', [create_authorization_tables]),
+    (11, 'task facet counts', [create_facet_tables]),
+    (12, 'database maintenance', [create_maintenance_tables]),
+    (13, 'default roles', [seed_roles]),
+    (14, 'sync horizon', [create_sync_horizon]),
+    (15, 'analytics snapshot lease', [create_snapshot_lease_table]),
+    (16, 'hierarchy renames', [create_hierarchy_remap])
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def create_migration_tables(conn):
+    cursor = conn.cursor()
+    for statement in MIGRATION_TABLES_SQL:
+        cursor.execute(statement)
+    conn.commit()
+
+
+def applied_versions(conn):
+    create_migration_tables(conn)
+    return {version for (version,) in conn.execute('SELECT version FROM schema_version')}
+
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def migrate(conn, target=None, verbose=False):
+    """Apply the pending migrations up to target (default: all), in order.
+
+    Each migration is recorded in schema_version once all its steps have
+    run; returns the versions applied.
+    """
+    applied = []
+    for version, name, steps in pending_migrations(conn):
+        if target is not None and version > target:
+            break
+        if verbose:
+            print(f"Applying migration {version}: {name}")
+        started = time.perf_counter()
+        for step in steps:
+            if isinstance(step, Backfill):
+                step.run(conn, version, verbose)
+            else:
+                step(conn)
+            conn.commit()
+        conn.execute('INSERT INTO schema_version (version, name, seconds) VALUES (?, ?, ?)',
+                     (version, name, round(time.perf_counter() - started, 3)))
+        conn.commit()
+        applied.append(version)
+    return applied
+
+
+def schema_status(conn):
+    """Applied migrations with their timings, and the pending ones"""
+    create_migration_tables(conn)
+    applied = [dict(zip(['version', 'name', 'applied_at', 'seconds'], row)) for row in conn.execute(
+        'SELECT version, name, applied_at, seconds FROM schema_version ORDER BY version')]
+    pending = [{'version': version, 'name': name} for version, name, _ in pending_migrations(conn)]
+    return applied, pending
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply pending schema migrations')
+    parser.add_argument('database', nargs='?', default='inspection_tracker.db')
+    parser.add_argument('--target', type=int, help='Stop after this version')
+    parser.add_argument('--status', action='store_true', help='List applied and pending migrations and exit')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    if args.status:
+        applied, pending = schema_status(conn)
+        for migration in applied:
+            print(f"{migration['version']:4d}  {migration['name']:30s} applied {migration['applied_at']} "
+                  f"({migration['seconds']}s)")
+        for migration in pending:
+            print(f"{migration['version']:4d}  {migration['name']:30s} pending")
+    else:
+        started = time.perf_counter()
+        versions = migrate(conn, args.target, verbose=True)
+        print(f"Applied {len(versions)} migrations in {time.perf_counter() - started:.1f}s")
+    conn.close()
@@ -0,0 +1,160 @@
+"""
+Fast JSON serialization and compressed responses.
+
+jsonify goes through OrjsonProvider, which uses orjson (numpy and pandas
+scalars included). JSON responses above COMPRESS_MIN_BYTES are gzip- or
+brotli-encoded according to the client's Accept-Encoding. Both packages are
+in requirements.txt; without them responses fall back to compact
+standard-library JSON and gzip only.
+"""
+
+import gzip
+import json
+import math
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+from flask import request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+_settings = {'min_bytes': DEFAULT_MIN_BYTES}
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    """Convert values neither encoder handles natively"""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        value = float(value)
+        return value if math.isfinite(value) else None
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _finite(value):
+    """value with NaN and infinite floats replaced by None, as orjson writes them"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that prefers orjson and never emits NaN or Infinity"""
+
+    compact = True
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS).decode()
+        # json writes float NaN and Infinity (numpy float64 included) as bare tokens
+        kwargs.setdefault('default', _default)
+        kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(_finite(obj), allow_nan=False, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is not None:
+            body = orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+        else:
+            body = self.dumps(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def _choose_encoding(accept_encoding):
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0"""
+    offered = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+
+    wildcard = offered.get('*', 0.0)
+    candidates = ['gzip'] if brotli is None else ['br', 'gzip']
+    best = None
+    for encoding in candidates:
+        quality = offered.get(encoding, wildcard)
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def _compress_response(response):
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype != 'application/json'):
+        return response
+
+    encoding = _choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < _settings['min_bytes']:
+        return response
+
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def parse_fields(value, allowed, required=('id',)):
+    """Parse a comma-separated fields= parameter against the allowed columns.
+
+    Returns the selected columns in the allowed order (required ones always
+    included), all of them when no fields were asked for, and raises
+    ValueError naming any unknown field.
+    """
+    if not value:
+        return list(allowed)
+    wanted = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = sorted(wanted.difference(allowed))
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    wanted.update(required)
+    return [field for field in allowed if field in wanted]
+
+
+def init_app(app):
+    """Install the fast JSON provider and compress large JSON responses"""
+    _settings['min_bytes'] = int(app.config.get('COMPRESS_MIN_BYTES', DEFAULT_MIN_BYTES))
+    app.json_provider_class = OrjsonProvider
+    app.json = OrjsonProvider(app)
+    app.after_request(_compress_response)
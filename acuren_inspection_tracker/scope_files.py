@@ -0,0 +1,131 @@
+"""
+Streamed, hashed and deduplicated scope workbook uploads.
+
+An uploaded workbook is copied to the upload folder in fixed-size chunks
+while its SHA-256 is computed, and refused as soon as it passes the size
+limit. scope_uploads keeps the digest of every ingested file under an
+index, so uploading the same workbook again returns the earlier upload
+instead of parsing and inserting its rows a second time.
+
+Tasks record the upload that created them in inspection_tasks.upload_id,
+so a rejected scope can be removed in batches and reports can be limited
+to one upload.
+"""
+
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+from blob_store import FileTooLarge, stream_to_file
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+REMOVE_BATCH_SIZE = 2000
+# Sleep between removal batches, long enough for a writer polling in
+# SQLite's busy handler to take the lock before the next batch does
+REMOVE_PAUSE_SECONDS = 0.02
+
+SCOPE_UPLOAD_COLUMNS = {
+    'content_hash': 'TEXT',
+    'file_size': 'INTEGER',
+    'validation_report': 'TEXT'
+}
+
+SCOPE_UPLOAD_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_scope_uploads_content_hash ON scope_uploads (content_hash)',
+    # Finds an upload's tasks for removal and covers the per-site report of one upload
+    'CREATE INDEX IF NOT EXISTS idx_inspection_tasks_upload_site_status_due '
+    'ON inspection_tasks (upload_id, site_id, status_id, due_date)'
+]
+
+# Uploads whose rows are still in the tracker; a rejected or invalid workbook may be sent again
+DUPLICATE_STATUSES = ('pending_review', 'processed', 'approved')
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+
+
+def create_scope_upload_tracking(conn):
+    """Add the content hash columns to scope_uploads, upload_id to inspection_tasks, and index them"""
+    cursor = conn.cursor()
+    columns = _columns(conn, 'scope_uploads')
+    for column, column_type in SCOPE_UPLOAD_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE scope_uploads ADD COLUMN {column} {column_type}')
+    if 'upload_id' not in _columns(conn, 'inspection_tasks'):
+        cursor.execute('ALTER TABLE inspection_tasks ADD COLUMN upload_id INTEGER REFERENCES scope_uploads (id)')
+    for statement in SCOPE_UPLOAD_INDEXES:
+        cursor.execute(statement)
+
+
+def save_scope_file(file, folder, max_bytes=DEFAULT_MAX_BYTES):
+    """Stream an uploaded file into folder, hashing it on the way.
+
+    Returns (path, filename, sha256, size); the stored name keeps the
+    timestamp prefix uploads have always had, with a random suffix when
+    that name is taken. Raises FileTooLarge, with
+    nothing left on disk, when the file passes max_bytes.
+    """
+    filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secure_filename(file.filename)}"
+    os.makedirs(folder, exist_ok=True)
+    temp_path = os.path.join(folder, f'.{uuid.uuid4().hex}.part')
+    hasher = hashlib.sha256()
+    try:
+        size = stream_to_file(file.stream, temp_path, max_bytes=max_bytes, hasher=hasher)
+    except FileTooLarge:
+        os.remove(temp_path)
+        raise
+
+    path = os.path.join(folder, filename)
+    try:
+        # Claim the name: the same file name uploaded twice within a second must not share a path
+        open(path, 'x').close()
+    except FileExistsError:
+        stem, extension = os.path.splitext(filename)
+        filename = f'{stem}_{uuid.uuid4().hex[:8]}{extension}'
+        path = os.path.join(folder, filename)
+    os.replace(temp_path, path)
+    return path, filename, hasher.hexdigest(), size
+
+
+def find_duplicate(conn, content_hash):
+    """The earliest live upload of a file with this digest, or None"""
+    placeholders = ', '.join('?' for _ in DUPLICATE_STATUSES)
+    row = conn.execute(f'''
+        SELECT id, filename, records_count, status
+        FROM scope_uploads
+        WHERE content_hash = ? AND status IN ({placeholders})
+        ORDER BY id
+        LIMIT 1
+    ''', (content_hash, *DUPLICATE_STATUSES)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(['upload_id', 'filename', 'records_count', 'status'], row))
+
+
+def remove_upload_tasks(conn, upload_id, batch_size=REMOVE_BATCH_SIZE, pause=REMOVE_PAUSE_SECONDS):
+    """Delete the tasks an upload created, committing one batch at a time.
+
+    Each batch holds the write lock only briefly and is followed by a pause
+    of `pause` seconds, so other writers get in between batches; an
+    interrupted removal is finished by calling again. Returns the number of
+    tasks removed.
+    """
+    cursor = conn.cursor()
+    removed = 0
+    while True:
+        cursor.execute('''
+            DELETE FROM inspection_tasks
+            WHERE id IN (SELECT id FROM inspection_tasks WHERE upload_id = ? LIMIT ?)
+        ''', (upload_id, batch_size))
+        conn.commit()
+        if cursor.rowcount <= 0:
+            break
+        removed += cursor.rowcount
+        if pause:
+            time.sleep(pause)
+    return removed
@@ -0,0 +1,108 @@
+"""
+Pre-insert validation of uploaded scope sheets.
+
+Whole columns are checked at once against in-memory sets of the lookup
+table names and with vectorized numeric and date coercion, so a 100k-row
+sheet validates in a fraction of a second. A sheet with any failing row is
+refused as a whole, nothing is inserted, and the violations are summarised
+in a report stored with the upload.
+"""
+
+import pandas as pd
+
+from data_loader import DATE_COLUMNS, ENCODED_COLUMNS, SCOPE_COLUMNS
+from lookup_encoding import LOOKUPS, NULL_NAMES
+
+# How many distinct bad values and sheet rows each violation lists
+MAX_REPORTED_VALUES = 20
+MAX_REPORTED_ROWS = 50
+
+# Sheet rows are numbered from 1 with the header in row 1
+FIRST_DATA_ROW = 2
+
+LOOKUP_HEADERS = [(header, column) for header, column in SCOPE_COLUMNS if column in ENCODED_COLUMNS]
+INTEGER_HEADERS = [header for header, column in SCOPE_COLUMNS if column == 'inspection_priority']
+NUMERIC_HEADERS = [header for header, column in SCOPE_COLUMNS if column == 'frequency']
+DATE_HEADERS = [header for header, column in SCOPE_COLUMNS if column in DATE_COLUMNS]
+
+
+def lookup_names(conn, field):
+    """Every name in a lookup table, as a set"""
+    table, column, _ = LOOKUPS[field]
+    return {name for (name,) in conn.execute(f'SELECT {column} FROM {table}') if name is not None}
+
+
+def _unparsed(raw, parsed):
+    """Cells that hold something but did not coerce; only those candidates are stripped"""
+    candidates = parsed.isna() & raw.notna()
+    if candidates.any():
+        candidates[candidates] = raw[candidates].astype(str).str.strip().ne('')
+    return candidates
+
+
+def _violation(series, bad, problem):
+    values = series[bad].astype(str).str.strip().value_counts().head(MAX_REPORTED_VALUES)
+    return {
+        'problem': problem,
+        'count': int(bad.sum()),
+        'values': {str(value): int(count) for value, count in values.items()},
+        'rows': [int(position) + FIRST_DATA_ROW for position in bad.to_numpy().nonzero()[0][:MAX_REPORTED_ROWS]]
+    }
+
+
+def validate_scope(conn, df):
+    """Check a raw scope sheet before it is cleaned and inserted.
+
+    Site, method, inspector and status must be blank or an existing lookup
+    name (a lookup table that is still empty is not checked), Insp Priority
+    a whole number, Frequency a number, and dates parseable. Returns a
+    boolean Series marking the valid rows, and the validation report.
+    """
+    invalid = pd.Series(False, index=df.index)
+    violations = {}
+
+    for header, field in LOOKUP_HEADERS:
+        if header not in df.columns:
+            continue
+        known = lookup_names(conn, field)
+        if not known:
+            continue
+        # Strip and look up each distinct value once, then mark its rows with isin
+        allowed = known | NULL_NAMES[field]
+        # Blank cells stay NaN through astype(str) on pandas 3
+        values = df[header].fillna('').astype(str)
+        unknown = [value for value in values.unique() if value.strip() not in allowed]
+        bad = values.isin(unknown)
+        if bad.any():
+            violations[header] = _violation(values, bad, f'unknown {field}')
+            invalid |= bad
+
+    for header in INTEGER_HEADERS + NUMERIC_HEADERS:
+        if header not in df.columns:
+            continue
+        numbers = pd.to_numeric(df[header], errors='coerce')
+        bad = _unparsed(df[header], numbers)
+        problem = 'not a number'
+        if header in INTEGER_HEADERS:
+            bad |= numbers.notna() & (numbers % 1 != 0)
+            problem = 'not a whole number'
+        if bad.any():
+            violations[header] = _violation(df[header], bad, problem)
+            invalid |= bad
+
+    for header in DATE_HEADERS:
+        if header not in df.columns:
+            continue
+        dates = pd.to_datetime(df[header], errors='coerce')
+        bad = _unparsed(df[header], dates)
+        if bad.any():
+            violations[header] = _violation(df[header], bad, 'not a date')
+            invalid |= bad
+
+    report = {
+        'rows_checked': len(df),
+        'rows_valid': int((~invalid).sum()),
+        'rows_rejected': int(invalid.sum()),
+        'violations': violations
+    }
+    return ~invalid, report
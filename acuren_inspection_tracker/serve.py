@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Production server: the tracker app under gunicorn with several worker processes.
+
+The app is created and the database initialised (migrations included) once
+in the master process, then workers fork from it (preload). Nothing that
+must not cross a fork is alive at that point: connections are opened per
+request, and the thumbnail pool and metrics registry reset themselves in
+each child. Each worker writes its metrics to --metrics-dir, a last time
+as it exits (workers are recycled after --max-requests), and /api/metrics
+serves their sum from whichever worker answers; the folder's snapshots are
+cleared at startup.
+
+    python serve.py --workers 4 --threads 4 --bind 0.0.0.0:5000
+    python serve.py --database /data/inspection_tracker.db --upload-folder /data/uploads
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+
+from app import create_app, init_db
+from instrumentation import write_snapshot
+
+
+def default_workers():
+    return 2 * (os.cpu_count() or 1) + 1
+
+
+def flush_metrics(server, worker):
+    """worker_exit hook: leave the exiting worker's final counts for /api/metrics"""
+    write_snapshot()
+
+
+def build_options(args):
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'preload_app': True,
+        'timeout': args.timeout,
+        'graceful_timeout': args.timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'accesslog': args.access_log,
+        'worker_exit': flush_metrics
+    }
+    if args.threads > 1:
+        options['worker_class'] = 'gthread'
+        options['threads'] = args.threads
+    return options
+
+
+def run(app, options):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit('gunicorn is not installed (pip install gunicorn); use python app.py for the development server')
+
+    class TrackerServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    TrackerServer().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the inspection tracker under a multi-worker WSGI server')
+    parser.add_argument('--bind', default=os.environ.get('BIND', '0.0.0.0:5000'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', default_workers())),
+                        help='Worker processes (default: 2 x CPUs + 1)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 1)),
+                        help='Threads per worker; above 1 uses the gthread worker')
+    parser.add_argument('--timeout', type=int, default=120, help='Seconds before a silent worker is restarted')
+    parser.add_argument('--max-requests', type=int, default=5000,
+                        help='Recycle a worker after this many requests (0 disables)')
+    parser.add_argument('--access-log', help="Access log file ('-' for stderr)")
+    parser.add_argument('--database', help='SQLite database (default: $DATABASE or inspection_tracker.db)')
+    parser.add_argument('--upload-folder', help='Scope upload folder')
+    parser.add_argument('--attachment-folder', help='Attachment blob store folder')
+    parser.add_argument('--thumbnail-workers', type=int, help='Thumbnail threads per worker process')
+    parser.add_argument('--metrics-dir', default=os.environ.get('METRICS_DIR'),
+                        help='Folder for per-worker metrics snapshots (default: a new temporary folder)')
+    args = parser.parse_args()
+
+    config = {
+        'DATABASE': args.database,
+        'UPLOAD_FOLDER': args.upload_folder,
+        'ATTACHMENT_FOLDER': args.attachment_folder,
+        'THUMBNAIL_WORKERS': args.thumbnail_workers,
+        'METRICS_DIR': args.metrics_dir or tempfile.mkdtemp(prefix='acuren_metrics_')
+    }
+    app = create_app({key: value for key, value in config.items() if value is not None})
+
+    # Schema setup and migrations run once here, not once per worker
+    init_db(app.config['DATABASE'])
+    # Counters restart with the server; drop the previous run's worker snapshots
+    for path in glob.glob(os.path.join(app.config['METRICS_DIR'], 'metrics-*.json')):
+        os.remove(path)
+
+    run(app, build_options(args))
+
+
+if __name__ == '__main__':
+    main()
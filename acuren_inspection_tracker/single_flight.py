@@ -0,0 +1,134 @@
+"""
+Coalescing of identical concurrent requests for the expensive routes.
+
+When several requests for the same key arrive while one is being computed,
+only the first (the leader) runs it; the others wait for its result and
+return a copy of it. Nothing is kept once the leader finishes, so a request
+arriving afterwards computes afresh: this shares work between concurrent
+requests without serving stale results. A waiter gives up after the key's
+timeout with a 503, rather than piling another copy of the aggregate onto
+a database that is already slow; an error in the leader is raised in every
+waiter.
+
+Per-key outcomes are counted in acuren_single_flight_requests_total
+(leader, coalesced, timeout) and waiting time in
+acuren_single_flight_wait_seconds at /api/metrics.
+"""
+
+import functools
+import os
+import threading
+import time
+
+from flask import Response, current_app, jsonify, request
+
+from instrumentation import LATENCY_BUCKETS, registry
+
+DEFAULT_TIMEOUT_SECONDS = 30
+
+_settings = {'timeout': DEFAULT_TIMEOUT_SECONDS}
+
+
+class CoalesceTimeout(Exception):
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """In-flight calls of one process by key"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget in-flight calls; a forked worker has none of its parent's threads"""
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, name, timeout=None):
+        """fn()'s result, computed once for all concurrent callers with the same key.
+
+        name labels the metrics. Returns (result, coalesced); raises
+        CoalesceTimeout if the leader has not finished within timeout
+        seconds (default SINGLE_FLIGHT_TIMEOUT_SECONDS).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            _count(name, 'leader')
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result, False
+
+        started = time.perf_counter()
+        finished = call.done.wait(_settings['timeout'] if timeout is None else timeout)
+        registry.observe('acuren_single_flight_wait_seconds', (('name', name),), (time.perf_counter() - started,),
+                         LATENCY_BUCKETS, 'Time coalesced requests waited for the in-flight computation.')
+        if not finished:
+            _count(name, 'timeout')
+            raise CoalesceTimeout(f'{name} is still being computed by another request')
+        _count(name, 'coalesced')
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+
+def _count(name, outcome):
+    registry.inc('acuren_single_flight_requests_total', (('name', name), ('outcome', outcome)),
+                 help_text='Requests of coalesced routes by outcome: leader, coalesced or timeout.')
+
+
+flights = SingleFlight()
+os.register_at_fork(after_in_child=flights.reset)
+
+
+def busy_response(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+
+def coalesce(timeout=None):
+    """Decorate a GET view so concurrent requests with the same endpoint, arguments and query string share one run.
+
+    The view's response body, status and headers are copied for each waiter;
+    streamed responses are not supported.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+
+            def run():
+                response = current_app.make_response(view(*args, **kwargs))
+                return response.get_data(), response.status_code, list(response.headers.items())
+
+            try:
+                (body, status, headers), _ = flights.do(key, run, request.endpoint, timeout)
+            except CoalesceTimeout as e:
+                return busy_response(e)
+            return Response(body, status=status, headers=headers)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    _settings['timeout'] = float(app.config.get('SINGLE_FLIGHT_TIMEOUT_SECONDS', DEFAULT_TIMEOUT_SECONDS))
@@ -0,0 +1,183 @@
+"""
+Slow-query log with automatic EXPLAIN QUERY PLAN capture.
+
+Hooks into the statement observers of instrumentation's traced connections.
+Statements slower than SLOW_QUERY_MS are recorded with their normalized SQL,
+bound-parameter shape, duration, issuing route and query plan, both to a
+rotating JSON-lines log file and to an in-memory ring buffer served by
+/api/debug/slow-queries.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import jsonify, request
+
+import instrumentation
+
+DEFAULT_THRESHOLD_MS = 250
+DEFAULT_LOG_PATH = os.path.join('logs', 'slow_queries.log')
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+BUFFER_SIZE = 500
+PLAN_CACHE_SIZE = 256
+
+logger = logging.getLogger('acuren.slow_queries')
+
+_settings = {'threshold_seconds': DEFAULT_THRESHOLD_MS / 1000.0}
+_entries = deque(maxlen=BUFFER_SIZE)
+_entries_lock = threading.Lock()
+_plan_cache = OrderedDict()
+_plan_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """Fresh locks and buffer in a forked worker, whatever its parent's threads held"""
+    global _entries_lock, _plan_lock
+    _entries_lock = threading.Lock()
+    _plan_lock = threading.Lock()
+    _entries.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and replace literals so equivalent statements group together"""
+    sql = _COMMENT_RE.sub(' ', sql)
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(?, ...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def parameter_shape(params):
+    """Describe bound parameters by type only, never by value"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {name: type(value).__name__ for name, value in params.items()}
+
+    shape = []
+    for value in params:
+        type_name = type(value).__name__
+        if shape and shape[-1][0] == type_name:
+            shape[-1][1] += 1
+        else:
+            shape.append([type_name, 1])
+    return [name if count == 1 else f'{name} x{count}' for name, count in shape]
+
+
+def _explain(connection, sql, params, normalized):
+    with _plan_lock:
+        plan = _plan_cache.get(normalized)
+        if plan is not None:
+            _plan_cache.move_to_end(normalized)
+            return plan
+
+    if params is None:
+        params = [None] * sql.count('?')
+    try:
+        # Bypass the traced execute so the plan lookup is not itself measured
+        rows = sqlite3.Connection.execute(connection, f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        plan = [detail for _, _, _, detail in rows]
+    except (sqlite3.Error, ValueError) as e:
+        plan = [f'unavailable: {e}']
+
+    with _plan_lock:
+        _plan_cache[normalized] = plan
+        if len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return plan
+
+
+def _observe(sql, params, duration, rows, connection, route):
+    if duration < _settings['threshold_seconds']:
+        return
+
+    normalized = normalize_sql(sql)
+    plan = _explain(connection, sql, params, normalized)
+
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'route': route,
+        'duration_ms': round(duration * 1000, 3),
+        'rows': rows,
+        'sql': normalized,
+        'params': parameter_shape(params),
+        'plan': plan
+    }
+    with _entries_lock:
+        _entries.append(entry)
+    logger.warning(json.dumps(entry))
+
+
+def slow_queries():
+    """List recent slow statements, optionally filtered, with a per-statement summary"""
+    route = request.args.get('route')
+    contains = request.args.get('sql')
+    min_ms = float(request.args.get('min_ms', 0))
+    limit = int(request.args.get('limit', 100))
+
+    with _entries_lock:
+        entries = list(_entries)
+
+    matches = [
+        entry for entry in reversed(entries)
+        if (not route or entry['route'] == route)
+        and (not contains or contains.lower() in entry['sql'].lower())
+        and entry['duration_ms'] >= min_ms
+    ]
+
+    summary = {}
+    for entry in matches:
+        key = (entry['route'], entry['sql'])
+        stats = summary.setdefault(key, {
+            'route': entry['route'], 'sql': entry['sql'], 'plan': entry['plan'],
+            'count': 0, 'total_ms': 0.0, 'max_ms': 0.0
+        })
+        stats['count'] += 1
+        stats['total_ms'] += entry['duration_ms']
+        stats['max_ms'] = max(stats['max_ms'], entry['duration_ms'])
+    for stats in summary.values():
+        stats['avg_ms'] = round(stats.pop('total_ms') / stats['count'], 3)
+
+    return jsonify({
+        'threshold_ms': _settings['threshold_seconds'] * 1000,
+        'total': len(matches),
+        'queries': matches[:limit],
+        'summary': sorted(summary.values(), key=lambda stats: stats['max_ms'], reverse=True)
+    })
+
+
+def init_app(app):
+    """Configure the threshold and log file, and register the observer and endpoint"""
+    _settings['threshold_seconds'] = float(app.config.get('SLOW_QUERY_MS', DEFAULT_THRESHOLD_MS)) / 1000.0
+
+    log_path = app.config.get('SLOW_QUERY_LOG', DEFAULT_LOG_PATH)
+    if log_path and not logger.handlers:
+        log_dir = os.path.dirname(log_path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        handler = RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+        logger.propagate = False
+
+    if _observe not in instrumentation.statement_observers:
+        instrumentation.statement_observers.append(_observe)
+    app.add_url_rule('/api/debug/slow-queries', 'slow_queries', slow_queries)
@@ -8,10 +8,20 @@ class AcurenApp {
         this.tasks = [];
         this.filteredTasks = [];
         this.dashboardData = {};
+        // Sent as X-Employee-Id; the authenticating proxy sets it in production
+        this.employeeId = localStorage.getItem('acurenEmployeeId') || '';
         
         this.init();
     }
 
+    apiFetch(path, options = {}) {
+        const headers = { ...(options.headers || {}) };
+        if (this.employeeId) {
+            headers['X-Employee-Id'] = this.employeeId;
+        }
+        return fetch(`${this.apiBaseUrl}${path}`, { ...options, headers });
+    }
+
     async init() {
         this.showLoadingScreen();
         await this.loadInitialData();
@@ -82,7 +92,7 @@ class AcurenApp {
 
     async loadDashboardData() {
         try {
-            const response = await fetch(`${this.apiBaseUrl}/dashboard/summary`);
+            const response = await this.apiFetch('/dashboard/summary');
             if (response.ok) {
                 this.dashboardData = await response.json();
                 this.updateDashboard();
@@ -97,7 +107,8 @@ class AcurenApp {
 
     async loadTasks() {
         try {
-            const response = await fetch(`${this.apiBaseUrl}/tasks?page=${this.currentPage}&per_page=${this.tasksPerPage}`);
+            const fields = 'id,hierarchy_item_name,site,description,method,inspection_priority,inspector,status,due_date,comments';
+            const response = await this.apiFetch(`/tasks?page=${this.currentPage}&per_page=${this.tasksPerPage}&fields=${fields}`);
             if (response.ok) {
                 const data = await response.json();
                 this.tasks = data.tasks;
@@ -116,10 +127,10 @@ class AcurenApp {
         try {
             // Load inspectors, sites, methods, etc.
             const [inspectors, sites, methods, statusTypes] = await Promise.all([
-                fetch(`${this.apiBaseUrl}/lookups/inspectors`).then(r => r.json()),
-                fetch(`${this.apiBaseUrl}/lookups/sites`).then(r => r.json()),
-                fetch(`${this.apiBaseUrl}/lookups/methods`).then(r => r.json()),
-                fetch(`${this.apiBaseUrl}/lookups/status-types`).then(r => r.json())
+                this.apiFetch('/lookups/inspectors').then(r => r.json()),
+                this.apiFetch('/lookups/sites').then(r => r.json()),
+                this.apiFetch('/lookups/methods').then(r => r.json()),
+                this.apiFetch('/lookups/status-types').then(r => r.json())
             ]);
             
             this.populateFilterDropdowns({ inspectors, sites, methods, statusTypes });
@@ -337,7 +348,7 @@ class AcurenApp {
             const formData = new FormData();
             formData.append('file', file);
 
-            const response = await fetch(`${this.apiBaseUrl}/upload-scope`, {
+            const response = await this.apiFetch('/upload-scope', {
                 method: 'POST',
                 body: formData
             });
@@ -483,7 +494,7 @@ class AcurenApp {
         try {
             const inspector = 'Current User'; // In real app, get from auth
             
-            const response = await fetch(`${this.apiBaseUrl}/tasks/${taskId}/claim`, {
+            const response = await this.apiFetch(`/tasks/${taskId}/claim`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
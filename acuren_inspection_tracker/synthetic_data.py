@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for load testing the inspection tracker.
+
+Produces realistic inspection tasks, lookups, assignments and notifications
+at configurable scale, with skewed (Zipf-like) site and inspector
+distributions, into a SQLite database or an xlsx/csv file in the tracker
+workbook layout.
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+
+from data_loader import ENCODED_COLUMNS, LOOKUP_SHEETS, SCOPE_COLUMNS, SCOPE_SHEET, TASK_INSERT_COLUMNS
+from hierarchy import index_new_tasks
+from lookup_encoding import intern_names
+
+METHODS = ['VI-EXT', 'VI-INT', 'Partial-VI INT', 'CUI-VI', 'RT', 'UTT', 'Profile RT']
+METHOD_WEIGHTS = [40, 10, 5, 15, 10, 15, 5]
+
+STATUSES = ['UnInitiated', 'Claimed', 'Field Complete', 'Reported', 'Out of Service', 'RT-Profile Crew']
+STATUS_WEIGHTS = [45, 20, 15, 15, 3, 2]
+
+MECHANISMS = ['External Corrosion', 'CUI', 'Erosion', 'Fatigue', 'Coating Failure']
+EXTENTS = ['100%', '50%', '25%', 'Spot', 'CML']
+INTERVALS = ['Years', 'Months']
+FREQUENCIES = [1, 3, 5, 7, 10, 15]
+PRIORITIES = [1, 2, 3, 4, 5]
+
+FIRST_NAMES = ['Kent', 'Brad', 'Hunter', 'Alex', 'Jordan', 'Casey', 'Morgan', 'Riley',
+               'Taylor', 'Jamie', 'Drew', 'Avery', 'Quinn', 'Parker', 'Reese', 'Sam']
+LAST_NAMES = ['Manuel', 'Sisk', 'Doucet', 'Guidry', 'Landry', 'Broussard', 'Hebert',
+              'Thibodeaux', 'Fontenot', 'Richard', 'Boudreaux', 'Romero', 'LeBlanc']
+
+INTERVAL_DAYS = {'Years': 365, 'Months': 30}
+
+MAX_XLSX_ROWS = 1048575
+BATCH_SIZE = 10000
+
+
+def zipf_weights(count, exponent):
+    """Weights where the k-th item is 1/k^exponent as likely as the first"""
+    return [1.0 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def make_sites(count):
+    return [str(1201 + index * 100) for index in range(count)]
+
+
+def make_inspectors(count, rng):
+    names = [f'{first} {last}' for first, last in itertools.product(FIRST_NAMES, LAST_NAMES)]
+    rng.shuffle(names)
+    if count > len(names):
+        names += [f'Inspector {index:04d}' for index in range(count - len(names))]
+    return names[:count]
+
+
+class TaskGenerator:
+    """Deterministic stream of tracker rows for a given seed and scale"""
+
+    def __init__(self, rows, sites=40, inspectors=200, skew=1.1, seed=42, today=None):
+        self.rows = rows
+        self.rng = random.Random(seed)
+        self.today = today or date.today()
+        self.sites = make_sites(sites)
+        self.inspectors = make_inspectors(inspectors, self.rng)
+        self.site_weights = list(itertools.accumulate(zipf_weights(len(self.sites), skew)))
+        self.method_weights = list(itertools.accumulate(METHOD_WEIGHTS))
+        self.status_weights = list(itertools.accumulate(STATUS_WEIGHTS))
+        # Each site has its own crew, so inspectors are skewed within a site too
+        crew_size = min(len(self.inspectors), max(3, len(self.inspectors) // 8))
+        crew_weights = list(itertools.accumulate(zipf_weights(crew_size, skew)))
+        self.site_crews = {
+            site: (self.rng.sample(self.inspectors, crew_size), crew_weights)
+            for site in self.sites
+        }
+
+    def __iter__(self):
+        rng = self.rng
+        choices = rng.choices
+        for index in range(self.rows):
+            site = choices(self.sites, cum_weights=self.site_weights)[0]
+            method = choices(METHODS, cum_weights=self.method_weights)[0]
+            status = choices(STATUSES, cum_weights=self.status_weights)[0]
+            interval = rng.choice(INTERVALS)
+            frequency = rng.choice(FREQUENCIES)
+
+            install_date = self.today - timedelta(days=rng.randint(365 * 2, 365 * 40))
+            last_inspection = self.today - timedelta(days=rng.randint(0, 365 * 8))
+            due_date = last_inspection + timedelta(days=frequency * INTERVAL_DAYS[interval])
+            current_inspection = None
+
+            if status == 'UnInitiated':
+                inspector = 'Unassigned'
+            else:
+                crew, crew_weights = self.site_crews[site]
+                inspector = choices(crew, cum_weights=crew_weights)[0]
+            if status in ('Field Complete', 'Reported'):
+                current_inspection = due_date + timedelta(days=rng.randint(-60, 30))
+
+            unit = rng.randint(1, 30)
+            area = rng.randint(1, 12)
+            yield {
+                'site': site,
+                'site_project': f'{site} - {self.today.year} External Scope',
+                'hierarchy_item_name': f'Unit {unit:02d} / Area {area:02d} / {method[:2]}-{index:07d}',
+                'description': f'{rng.choice(MECHANISMS)} inspection of line {index:07d}',
+                'mechanism': rng.choice(MECHANISMS),
+                'method': method,
+                'extent': rng.choice(EXTENTS),
+                'frequency': float(frequency),
+                'interval_type': interval,
+                'inspection_priority': rng.choice(PRIORITIES),
+                'last_inspection_date': last_inspection.isoformat(),
+                'install_date': install_date.isoformat(),
+                'due_date': due_date.isoformat(),
+                'current_inspection_date': current_inspection.isoformat() if current_inspection else None,
+                'inspector': inspector,
+                'status': status,
+                'comments': '' if rng.random() < 0.7 else f'Access requires scaffold ({rng.randint(1, 9)} lifts)'
+            }
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def write_sqlite(generator, path, notifications_per_task=0.2):
+    """Create a fresh database with the app schema and fill it"""
+    from app import init_db
+
+    if os.path.exists(path):
+        os.remove(path)
+    init_db(path)
+
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    rng = random.Random(generator.rng.random())
+
+    cursor.executemany('INSERT OR IGNORE INTO inspectors (name) VALUES (?)',
+                       ((name,) for name in generator.inspectors))
+    cursor.executemany('INSERT OR IGNORE INTO sites (site_code, site_name) VALUES (?, ?)',
+                       ((site, f'Site {site}') for site in generator.sites))
+    cursor.executemany('INSERT OR IGNORE INTO methods (method_name) VALUES (?)',
+                       ((method,) for method in METHODS))
+    cursor.executemany('INSERT OR IGNORE INTO status_types (status_name) VALUES (?)',
+                       ((status,) for status in STATUSES))
+
+    encoded = {
+        field: intern_names(conn, field, names)
+        for field, names in (('site', generator.sites), ('method', METHODS),
+                             ('inspector', generator.inspectors + ['Unassigned']),
+                             ('status', STATUSES))
+    }
+    columns = [column for _, column in SCOPE_COLUMNS]
+    insert_sql = 'INSERT INTO inspection_tasks ({}) VALUES ({})'.format(
+        ', '.join(TASK_INSERT_COLUMNS), ', '.join('?' for _ in TASK_INSERT_COLUMNS)
+    )
+
+    task_id = 0
+    for batch in _batches(generator, BATCH_SIZE):
+        cursor.executemany(insert_sql, (
+            [encoded[column][row[column]] if column in ENCODED_COLUMNS else row[column] for column in columns]
+            for row in batch
+        ))
+        assignments = []
+        notifications = []
+        for row in batch:
+            task_id += 1
+            if row['inspector'] != 'Unassigned':
+                assignments.append((task_id, 'System', row['inspector'], 'Synthetic assignment'))
+            if rng.random() < notifications_per_task:
+                notifications.append((task_id, f'Task status changed to {row["status"]}',
+                                      'status_change', rng.random() < 0.6))
+        cursor.executemany('''
+            INSERT INTO task_assignments (task_id, assigned_by, assigned_to, notes)
+            VALUES (?, ?, ?, ?)
+        ''', assignments)
+        cursor.executemany('''
+            INSERT INTO notifications (task_id, message, notification_type, read_status)
+            VALUES (?, ?, ?, ?)
+        ''', notifications)
+        index_new_tasks(conn)
+        conn.commit()
+
+    conn.close()
+    return task_id
+
+
+def write_csv(generator, path):
+    """Write the main tracker sheet as CSV with the workbook headers"""
+    with open(path, 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow([header for header, _ in SCOPE_COLUMNS])
+        count = 0
+        for row in generator:
+            writer.writerow(['' if row[column] is None else row[column] for _, column in SCOPE_COLUMNS])
+            count += 1
+    return count
+
+
+def write_xlsx(generator, path):
+    """Write the tracker workbook layout with a streaming (write-only) workbook"""
+    from openpyxl import Workbook
+
+    if generator.rows > MAX_XLSX_ROWS:
+        raise ValueError(f'xlsx output is limited to {MAX_XLSX_ROWS} rows; use sqlite or csv')
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(SCOPE_SHEET)
+    sheet.append([header for header, _ in SCOPE_COLUMNS])
+    count = 0
+    for row in generator:
+        sheet.append([row[column] for _, column in SCOPE_COLUMNS])
+        count += 1
+
+    lookup_values = {
+        'Inspectors': generator.inspectors,
+        'Site': generator.sites,
+        'Method': METHODS,
+        'Status': STATUSES,
+        'Inspection Priority': PRIORITIES,
+        'Interval': INTERVALS,
+        'Frequency': FREQUENCIES
+    }
+    for sheet_name, header in LOOKUP_SHEETS:
+        lookup_sheet = workbook.create_sheet(sheet_name)
+        lookup_sheet.append([header])
+        for value in lookup_values[sheet_name]:
+            lookup_sheet.append([value])
+
+    workbook.save(path)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic inspection tracker data')
+    parser.add_argument('output', help='Output path (.db/.sqlite, .xlsx or .csv)')
+    parser.add_argument('--rows', type=int, default=10000, help='Number of inspection tasks')
+    parser.add_argument('--sites', type=int, default=40)
+    parser.add_argument('--inspectors', type=int, default=200)
+    parser.add_argument('--skew', type=float, default=1.1,
+                        help='Zipf exponent for site and inspector popularity')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    generator = TaskGenerator(args.rows, sites=args.sites, inspectors=args.inspectors,
+                              skew=args.skew, seed=args.seed)
+
+    extension = os.path.splitext(args.output)[1].lower()
+    print(f"Generating {args.rows} synthetic inspection tasks into {args.output}...")
+    if extension == '.xlsx':
+        count = write_xlsx(generator, args.output)
+    elif extension == '.csv':
+        count = write_csv(generator, args.output)
+    else:
+        count = write_sqlite(generator, args.output)
+    print(f"Wrote {count} tasks")
+
+
+if __name__ == '__main__':
+    main()
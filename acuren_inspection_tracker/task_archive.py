@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Hot/cold archival of closed inspection tasks.
+
+Tasks that have been Reported or Field Complete for longer than
+ARCHIVE_AFTER_DAYS are moved, in batches, from inspection_tasks into the
+same table in a separate archive database that is ATTACHed as `archive`.
+Every live query keeps reading the hot table, so its size tracks open work
+rather than all history; get_tasks and reports take include_archived to
+read both through temporary views on the connection.
+
+Archived tasks keep their ids and change_seq. Removing them from the hot
+table leaves tombstones, so offline clients drop them on their next sync.
+
+    python task_archive.py inspection_tracker.db --days 180    # e.g. nightly from cron
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+from flask import jsonify, request
+
+from instrumentation import TracedConnection
+from lookup_encoding import INSPECTION_TASK_INDEXES, TASK_DETAILS_VIEW_SQL, id_list_sql
+
+ARCHIVE_STATUSES = ('Reported', 'Field Complete')
+DEFAULT_AFTER_DAYS = 180
+DEFAULT_BATCH_SIZE = 2000
+
+SCHEMA = 'archive'
+
+# Temporary views: archived tasks not (or no longer) in the hot table, the
+# union of both, and archived tasks joined to their lookup names
+ARCHIVED_TASKS = 'archived_inspection_tasks'
+ALL_TASKS = 'all_inspection_tasks'
+ARCHIVED_TASK_DETAILS = 'archived_task_details'
+
+_settings = {
+    'database': None,
+    'path': None,
+    'after_days': DEFAULT_AFTER_DAYS,
+    'batch_size': DEFAULT_BATCH_SIZE
+}
+
+
+def default_archive_path(database):
+    root, extension = os.path.splitext(database)
+    return f'{root}_archive{extension or ".db"}'
+
+
+def _table_info(conn, schema):
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA {schema}.table_info(inspection_tasks)').fetchall()]
+
+
+def attach_archive(conn, path=None):
+    """ATTACH the archive database as `archive` and create the views over hot and archived tasks.
+
+    The archive table is created on first use with the hot table's columns
+    (plus archived_at), and gains any column added to the hot table since.
+    Returns the hot table's column names.
+    """
+    if SCHEMA not in [row[1] for row in conn.execute('PRAGMA database_list').fetchall()]:
+        conn.execute(f'ATTACH DATABASE ? AS {SCHEMA}', (path or _settings['path'],))
+    columns = _table_info(conn, 'main')
+    archived = dict(_table_info(conn, SCHEMA))
+    if not archived:
+        conn.execute(f'PRAGMA {SCHEMA}.journal_mode=WAL')
+        definitions = ', '.join(f'{name} {column_type}' + (' PRIMARY KEY' if name == 'id' else '')
+                                for name, column_type in columns)
+        conn.execute(f'CREATE TABLE {SCHEMA}.inspection_tasks ({definitions}, archived_at TIMESTAMP)')
+        for statement in INSPECTION_TASK_INDEXES:
+            conn.execute(statement.replace('IF NOT EXISTS ', f'IF NOT EXISTS {SCHEMA}.', 1))
+        conn.commit()
+    elif any(name not in archived for name, _ in columns):
+        for name, column_type in columns:
+            if name not in archived:
+                conn.execute(f'ALTER TABLE {SCHEMA}.inspection_tasks ADD COLUMN {name} {column_type}')
+        conn.commit()
+
+    # A task is read from the archive only when the hot table does not hold it, so a
+    # batch caught between copy and delete, or an older snapshot, never counts twice
+    names = [name for name, _ in columns]
+    selected = ', '.join(names)
+    conn.execute(f'''
+        CREATE TEMP VIEW IF NOT EXISTS {ARCHIVED_TASKS} AS
+        SELECT {selected} FROM {SCHEMA}.inspection_tasks a
+        WHERE NOT EXISTS (SELECT 1 FROM main.inspection_tasks h WHERE h.id = a.id)
+    ''')
+    conn.execute(f'''
+        CREATE TEMP VIEW IF NOT EXISTS {ALL_TASKS} AS
+        SELECT {selected} FROM main.inspection_tasks
+        UNION ALL
+        SELECT {selected} FROM {ARCHIVED_TASKS}
+    ''')
+    conn.execute(TASK_DETAILS_VIEW_SQL
+                 .replace('CREATE VIEW IF NOT EXISTS inspection_task_details',
+                          f'CREATE TEMP VIEW IF NOT EXISTS {ARCHIVED_TASK_DETAILS}', 1)
+                 .replace('FROM inspection_tasks t', f'FROM {ARCHIVED_TASKS} t', 1))
+    return names
+
+
+def tasks_page_sql(fields, where):
+    """One page of hot and archived task details in due date order.
+
+    Each side is cut to the first `window` rows in its own due date index
+    before the two are merged. Takes where's parameters, then window, twice,
+    then the page's limit and offset.
+    """
+    selected = ', '.join(fields)
+    return f'''
+        SELECT {selected} FROM (
+            SELECT * FROM (
+                SELECT {selected}, due_date AS sort_due_date FROM inspection_task_details{where}
+                ORDER BY due_date LIMIT ?)
+            UNION ALL
+            SELECT * FROM (
+                SELECT {selected}, due_date AS sort_due_date FROM {ARCHIVED_TASK_DETAILS}{where}
+                ORDER BY due_date LIMIT ?)
+        )
+        ORDER BY sort_due_date LIMIT ? OFFSET ?
+    '''
+
+
+def archive_closed_tasks(conn, path=None, after_days=None, batch_size=None, verbose=False):
+    """Move tasks closed more than after_days ago into the archive, one batch at a time.
+
+    Each batch is copied and committed to the archive first, then deleted
+    from the hot table only where its change_seq still matches the copy,
+    so a task reopened in between stays live (its stale copy is dropped).
+    An interrupted run leaves at most one batch in both tables, and the
+    next run finishes it. Returns the number of tasks archived.
+    """
+    after_days = _settings['after_days'] if after_days is None else after_days
+    batch_size = batch_size or _settings['batch_size']
+    columns = ', '.join(attach_archive(conn, path))
+    closed = id_list_sql(conn, 'status', ARCHIVE_STATUSES)
+    cutoff = conn.execute("SELECT datetime('now', ?)", (f'-{float(after_days)} days',)).fetchone()[0]
+
+    archived = 0
+    last_id = 0
+    while True:
+        ids = [task_id for (task_id,) in conn.execute(f'''
+            SELECT id FROM main.inspection_tasks
+            WHERE status_id IN ({closed}) AND updated_at < ? AND id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (cutoff, last_id, batch_size)).fetchall()]
+        if not ids:
+            break
+        last_id = ids[-1]
+        id_list = ', '.join(str(int(task_id)) for task_id in ids)
+
+        conn.execute(f'''
+            INSERT OR REPLACE INTO {SCHEMA}.inspection_tasks ({columns}, archived_at)
+            SELECT {columns}, CURRENT_TIMESTAMP FROM main.inspection_tasks WHERE id IN ({id_list})
+        ''')
+        conn.commit()
+
+        cursor = conn.execute(f'''
+            DELETE FROM main.inspection_tasks
+            WHERE id IN ({id_list})
+              AND change_seq IS (SELECT a.change_seq FROM {SCHEMA}.inspection_tasks a
+                                 WHERE a.id = main.inspection_tasks.id)
+        ''')
+        moved = cursor.rowcount
+        conn.commit()
+
+        if moved < len(ids):
+            conn.execute(f'''
+                DELETE FROM {SCHEMA}.inspection_tasks
+                WHERE id IN ({id_list}) AND id IN (SELECT id FROM main.inspection_tasks)
+            ''')
+            conn.commit()
+
+        archived += moved
+        if verbose:
+            print(f"Archived {archived} tasks...")
+    return archived
+
+
+def archive_counts(conn, path=None):
+    """Tasks in the hot table and in the archive"""
+    attach_archive(conn, path)
+    hot = conn.execute('SELECT COUNT(*) FROM main.inspection_tasks').fetchone()[0]
+    archived = conn.execute(f'SELECT COUNT(*) FROM {SCHEMA}.inspection_tasks').fetchone()[0]
+    return {'hot_tasks': hot, 'archived_tasks': archived}
+
+
+def include_archived_requested(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def _connect():
+    return sqlite3.connect(_settings['database'], factory=TracedConnection)
+
+
+def archive_status():
+    """Hot and archived task counts and the archival settings"""
+    conn = _connect()
+    counts = archive_counts(conn)
+    conn.close()
+    return jsonify({**counts, 'after_days': _settings['after_days'], 'archive': _settings['path']})
+
+
+def run_archive():
+    """Archive closed tasks now; the body may override after_days"""
+    data = request.get_json(silent=True) or {}
+    try:
+        after_days = float(data.get('after_days', _settings['after_days']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'after_days must be a number'}), 400
+
+    conn = _connect()
+    started = time.perf_counter()
+    archived = archive_closed_tasks(conn, after_days=after_days)
+    elapsed = time.perf_counter() - started
+    counts = archive_counts(conn)
+    conn.close()
+    return jsonify({'message': f'Archived {archived} tasks', 'archived': archived,
+                    'seconds': round(elapsed, 2), **counts})
+
+
+def init_app(app):
+    """Point archival at the app's archive database and register its endpoints"""
+    _settings['database'] = app.config['DATABASE']
+    _settings['path'] = app.config.get('TASK_ARCHIVE') or default_archive_path(app.config['DATABASE'])
+    _settings['after_days'] = float(app.config.get('ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS))
+    _settings['batch_size'] = int(app.config.get('ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+    app.add_url_rule('/api/tasks/archive', 'task_archive_status', archive_status)
+    app.add_url_rule('/api/tasks/archive', 'task_archive_run', run_archive, methods=['POST'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move long-closed inspection tasks into the archive database')
+    parser.add_argument('database', nargs='?', default='inspection_tracker.db')
+    parser.add_argument('--archive', help='Archive database (default: <database>_archive.db)')
+    parser.add_argument('--days', type=float, default=DEFAULT_AFTER_DAYS,
+                        help='Archive tasks closed more than this many days ago')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    started = time.perf_counter()
+    count = archive_closed_tasks(conn, args.archive or default_archive_path(args.database),
+                                 args.days, args.batch_size, verbose=True)
+    print(f"Archived {count} tasks in {time.perf_counter() - started:.1f}s")
+    conn.close()
@@ -0,0 +1,201 @@
+"""
+Many-to-many links between inspection tasks and employees, roles, scopes
+and notifications, kept in complete_schema's join tables.
+
+Every join table has two composite indexes holding all the columns the
+listings read: one led by the linked entity's id and one led by task_id.
+Listing a scope's tasks or a task's employees is a range seek on one of
+them, never a scan of the join table. The task_id-led index is UNIQUE, so
+linking the same pair again changes nothing (a role link's access level
+is updated).
+"""
+
+from lookup_encoding import TASK_FIELDS
+
+MAX_LINK_TASKS = 50000
+ID_BATCH_SIZE = 500
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+
+# relation -> (join table, entity id column, link attribute column, unique link key)
+RELATIONS = {
+    'employee': ('inspection_task_employee_join', 'employee_id', 'relationship_type',
+                 ('task_id', 'employee_id', 'relationship_type')),
+    'role': ('inspection_task_role_join', 'role_id', 'access_level', ('task_id', 'role_id')),
+    'scope': ('inspection_task_inspection_scope_join', 'scope_id', None, ('task_id', 'scope_id')),
+    'notification': ('inspection_task_notification_join', 'notification_id', None,
+                     ('task_id', 'notification_id'))
+}
+
+# URL path segment -> relation
+RELATION_PATHS = {
+    'employees': 'employee',
+    'roles': 'role',
+    'scopes': 'scope',
+    'notifications': 'notification'
+}
+
+# relation -> (entity table, display name SQL)
+ENTITY_NAMES = {
+    'employee': ('employees', "TRIM(COALESCE(e.first_name, '') || ' ' || COALESCE(e.last_name, ''))"),
+    'role': ('roles', 'e.role_name'),
+    'scope': ('inspection_scopes', 'e.scope_name'),
+    'notification': ('notifications', 'e.message')
+}
+
+# Attribute stored when a link request does not give one; a NULL would slip past the unique key
+ATTRIBUTE_DEFAULTS = {
+    'relationship_type': 'assigned',
+    'access_level': 'read'
+}
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _index_statements(relation):
+    table, column, attribute, key = RELATIONS[relation]
+    entity_columns = ', '.join(filter(None, [column, 'task_id', attribute]))
+    return [
+        f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_task ON {table} ({", ".join(key)})',
+        f'CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({entity_columns})'
+    ]
+
+
+def create_link_indexes(conn):
+    """Drop duplicate links (keeping the newest) and create the composite indexes of every join table"""
+    cursor = conn.cursor()
+    for relation, (table, _, _, key) in RELATIONS.items():
+        cursor.execute(f'''
+            DELETE FROM {table}
+            WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY {", ".join(key)})
+        ''')
+        for statement in _index_statements(relation):
+            cursor.execute(statement)
+
+
+def entity_exists(conn, relation, entity_id):
+    table, _ = ENTITY_NAMES[relation]
+    return conn.execute(f'SELECT 1 FROM {table} WHERE id = ?', (entity_id,)).fetchone() is not None
+
+
+def linked_tasks(conn, relation, entity_id, after=0, limit=DEFAULT_PAGE_SIZE, attribute=None, fields=TASK_FIELDS):
+    """One page of the tasks linked to an entity, in task id order after task id `after`.
+
+    Returns (tasks, total, next_after); next_after is None on the last page,
+    and total is only counted for the first page (after=0). Each task
+    carries the link attribute (relationship_type or access_level).
+    """
+    table, column, attribute_column, _ = RELATIONS[relation]
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    link_filter = ''
+    params = [entity_id]
+    if attribute is not None and attribute_column:
+        link_filter = f' AND j.{attribute_column} = ?'
+        params.append(attribute)
+
+    selected = ', '.join(f'd.{field}' for field in fields)
+    link_column = f', j.{attribute_column}' if attribute_column else ''
+    rows = conn.execute(f'''
+        SELECT {selected}{link_column}, j.task_id
+        FROM {table} j
+        JOIN inspection_task_details d ON d.id = j.task_id
+        WHERE j.{column} = ?{link_filter} AND j.task_id > ?
+        ORDER BY j.task_id
+        LIMIT ?
+    ''', params + [int(after), limit + 1]).fetchall()
+
+    # Links to tasks that were removed or archived are not counted; that takes a
+    # seek per link, so later pages skip it
+    total = None
+    if not int(after):
+        total = conn.execute(f'''
+            SELECT COUNT(*) FROM {table} j
+            JOIN inspection_tasks t ON t.id = j.task_id
+            WHERE j.{column} = ?{link_filter}
+        ''', params).fetchone()[0]
+
+    names = list(fields) + ([attribute_column] if attribute_column else [])
+    tasks = [dict(zip(names, row)) for row in rows[:limit]]
+    next_after = rows[limit - 1][-1] if len(rows) > limit else None
+    return tasks, total, next_after
+
+
+def task_links(conn, relation, task_id):
+    """Entities a task is linked to, with their names and the link attribute"""
+    table, column, attribute_column, _ = RELATIONS[relation]
+    entity_table, name_sql = ENTITY_NAMES[relation]
+    link_column = f', j.{attribute_column}' if attribute_column else ''
+    rows = conn.execute(f'''
+        SELECT j.{column}, {name_sql}{link_column}
+        FROM {table} j
+        LEFT JOIN {entity_table} e ON e.id = j.{column}
+        WHERE j.task_id = ?
+        ORDER BY j.{column}
+    ''', (task_id,)).fetchall()
+    names = ['id', 'name'] + ([attribute_column] if attribute_column else [])
+    return [dict(zip(names, row)) for row in rows]
+
+
+def existing_task_ids(conn, task_ids):
+    found = set()
+    for batch in _chunks(task_ids, ID_BATCH_SIZE):
+        placeholders = ', '.join('?' for _ in batch)
+        found.update(task_id for (task_id,) in conn.execute(
+            f'SELECT id FROM inspection_tasks WHERE id IN ({placeholders})', batch))
+    return found
+
+
+def link_tasks(conn, relation, entity_id, task_ids, attribute=None):
+    """Link tasks to an entity in bulk. The caller commits.
+
+    Returns (links added or changed, task ids that do not exist).
+    """
+    table, column, attribute_column, key = RELATIONS[relation]
+    found = existing_task_ids(conn, task_ids)
+    unknown = [task_id for task_id in task_ids if task_id not in found]
+
+    if attribute_column:
+        value = attribute if attribute is not None else ATTRIBUTE_DEFAULTS[attribute_column]
+        # Upsert: a role link keeps one access level; an employee link's type is part of its key
+        conflict = (f'DO UPDATE SET {attribute_column} = excluded.{attribute_column} '
+                    f'WHERE {attribute_column} IS NOT excluded.{attribute_column}'
+                    if attribute_column not in key else 'DO NOTHING')
+        sql = f'''
+            INSERT INTO {table} (task_id, {column}, {attribute_column}) VALUES (?, ?, ?)
+            ON CONFLICT ({", ".join(key)}) {conflict}
+        '''
+        rows = ((task_id, entity_id, value) for task_id in sorted(found))
+    else:
+        sql = f'INSERT INTO {table} (task_id, {column}) VALUES (?, ?) ON CONFLICT ({", ".join(key)}) DO NOTHING'
+        rows = ((task_id, entity_id) for task_id in sorted(found))
+
+    before = conn.total_changes
+    conn.executemany(sql, rows)
+    return conn.total_changes - before, unknown
+
+
+def unlink_tasks(conn, relation, entity_id, task_ids=None, attribute=None):
+    """Remove links between an entity and the given tasks, or all its tasks when task_ids is None.
+
+    Returns the number of links removed. The caller commits.
+    """
+    table, column, attribute_column, _ = RELATIONS[relation]
+    link_filter = ''
+    params = [entity_id]
+    if attribute is not None and attribute_column:
+        link_filter = f' AND {attribute_column} = ?'
+        params.append(attribute)
+
+    if task_ids is None:
+        return conn.execute(f'DELETE FROM {table} WHERE {column} = ?{link_filter}', params).rowcount
+
+    removed = 0
+    for batch in _chunks(task_ids, ID_BATCH_SIZE):
+        placeholders = ', '.join('?' for _ in batch)
+        removed += conn.execute(f'''
+            DELETE FROM {table} WHERE {column} = ?{link_filter} AND task_id IN ({placeholders})
+        ''', params + list(batch)).rowcount
+    return removed
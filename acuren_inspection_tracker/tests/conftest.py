@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# The tracker's modules import each other by their top-level names
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, init_db  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A migrated, empty tracker database"""
+    path = str(tmp_path / 'tracker.db')
+    init_db(path)
+    return path
+
+
+@pytest.fixture
+def make_app(database, tmp_path):
+    """create_app on the test database, with config overrides"""
+    def make(**config):
+        settings = {'DATABASE': database, 'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+                    'ATTACHMENT_FOLDER': str(tmp_path / 'attachments'), 'TESTING': True}
+        settings.update(config)
+        return create_app(settings)
+    return make
@@ -0,0 +1,44 @@
+import os
+import sqlite3
+
+import pytest
+
+import analytics_snapshot
+from analytics_snapshot import claim_lease, refresher, release_lease
+
+
+@pytest.fixture
+def conn(make_app, database):
+    make_app(AUTHORIZATION='off')
+    conn = sqlite3.connect(database)
+    yield conn
+    conn.close()
+
+
+def test_lease_has_one_live_holder(conn):
+    assert claim_lease(conn, 1)
+    assert claim_lease(conn, 1)
+    assert not claim_lease(conn, 2)
+    release_lease(conn, 1)
+    assert claim_lease(conn, 2)
+
+
+def test_expired_lease_can_be_taken_over(conn):
+    assert claim_lease(conn, 1, lease_seconds=-1)
+    assert claim_lease(conn, 2)
+
+
+def test_refresh_waits_out_another_process(conn):
+    claim_lease(conn, os.getpid() + 1)
+    assert refresher.refresh() is None
+    assert not os.path.exists(analytics_snapshot._settings['path'])
+
+    release_lease(conn, os.getpid() + 1)
+    assert refresher.refresh()['change_seq'] is not None
+
+
+def test_fresh_snapshot_is_not_copied_again(conn):
+    first = refresher.refresh()
+    os.utime(analytics_snapshot._settings['path'], (0, 0))
+    assert refresher.refresh(only_if_stale=True)['taken_at'] == first['taken_at']
+    assert os.stat(analytics_snapshot._settings['path']).st_mtime == 0
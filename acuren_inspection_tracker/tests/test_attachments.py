@@ -0,0 +1,114 @@
+import hashlib
+import os
+import sqlite3
+
+import pytest
+
+from attachments import complete_upload, expire_uploads
+from blob_store import BlobStore
+
+CONTENT = b'inspection photo bytes'
+
+
+@pytest.fixture
+def client(make_app):
+    return make_app(AUTHORIZATION='off').test_client()
+
+
+def start_upload(client, content=CONTENT, **fields):
+    body = {'filename': 'photo.txt', 'size': len(content), 'kind': 'document'}
+    body.update(fields)
+    upload_id = client.post('/api/attachments/uploads', json=body).get_json()['upload']['upload_id']
+    client.put(f'/api/attachments/uploads/{upload_id}?offset=0', data=content)
+    return upload_id
+
+
+def upload(client, content=CONTENT, **fields):
+    upload_id = start_upload(client, content, **fields)
+    return client.post(f'/api/attachments/uploads/{upload_id}/complete').get_json()['attachment']
+
+
+@pytest.mark.parametrize('size', ['ten', None, -1, [1]])
+def test_bad_size_is_400(client, size):
+    response = client.post('/api/attachments/uploads', json={'filename': 'a.jpg', 'size': size})
+    assert response.status_code == 400
+
+
+def test_known_digest_alone_does_not_attach_the_blob(client):
+    upload(client)
+    response = client.post('/api/attachments/uploads', json={
+        'filename': 'copy.txt', 'size': len(CONTENT), 'kind': 'document',
+        'sha256': hashlib.sha256(CONTENT).hexdigest()})
+    assert response.status_code == 201
+    assert 'attachment' not in response.get_json()
+    assert len(client.get('/api/attachments').get_json()['attachments']) == 1
+
+
+def test_blob_is_deleted_with_its_last_attachment(client, tmp_path):
+    first, second = upload(client), upload(client)
+    store = BlobStore(str(tmp_path / 'attachments'))
+    assert first['sha256'] == second['sha256']
+
+    assert client.delete(f"/api/attachments/{first['id']}").status_code == 200
+    assert store.exists(second['sha256'])
+    assert client.get(f"/api/attachments/{second['id']}").data == CONTENT
+
+    assert client.delete(f"/api/attachments/{second['id']}").status_code == 200
+    assert not store.exists(second['sha256'])
+    assert client.delete(f"/api/attachments/{second['id']}").status_code == 404
+
+
+def test_failed_completion_leaves_no_blob_row(client, database, tmp_path):
+    upload_id = start_upload(client)
+    store = BlobStore(str(tmp_path / 'attachments'))
+    conn = sqlite3.connect(database)
+    conn.execute("CREATE TRIGGER refuse BEFORE INSERT ON attachments BEGIN SELECT RAISE(ABORT, 'refused'); END")
+    conn.commit()
+
+    with pytest.raises(sqlite3.IntegrityError):
+        complete_upload(conn, store, upload_id)
+    assert conn.execute('SELECT COUNT(*) FROM attachment_blobs').fetchone()[0] == 0
+
+    conn.execute('DROP TRIGGER refuse')
+    conn.commit()
+    attachment, deduplicated = complete_upload(conn, store, upload_id)
+    conn.close()
+    assert not deduplicated
+    assert client.get(f"/api/attachments/{attachment['id']}").data == CONTENT
+    assert not os.path.exists(store.temp_path(f'upload-{upload_id}'))
+
+
+def test_completion_restores_a_blob_deleted_before_its_transaction(client, database, tmp_path):
+    class RacingStore(BlobStore):
+        def link(self, source_path, digest):
+            added = super().link(source_path, digest)
+            if not hasattr(self, 'raced'):
+                self.raced = True
+                self.delete(digest)
+            return added
+
+    upload_id = start_upload(client)
+    store = RacingStore(str(tmp_path / 'attachments'))
+    conn = sqlite3.connect(database)
+    attachment, _ = complete_upload(conn, store, upload_id)
+    conn.close()
+    assert store.exists(attachment['sha256'])
+    assert client.get(f"/api/attachments/{attachment['id']}").data == CONTENT
+
+
+def test_abandoned_uploads_expire(client, database, tmp_path):
+    response = client.post('/api/attachments/uploads', json={'filename': 'a.jpg', 'size': 10})
+    upload_id = response.get_json()['upload']['upload_id']
+    store = BlobStore(str(tmp_path / 'attachments'))
+    partial = store.temp_path(f'upload-{upload_id}')
+    assert os.path.exists(partial)
+
+    conn = sqlite3.connect(database)
+    assert expire_uploads(conn, store, max_age_hours=1) == 0
+    conn.execute("UPDATE attachment_uploads SET updated_at = datetime('now', '-2 hours')")
+    assert expire_uploads(conn, store, max_age_hours=1) == 1
+    conn.commit()
+    conn.close()
+
+    assert not os.path.exists(partial)
+    assert client.get(f'/api/attachments/uploads/{upload_id}').status_code == 404
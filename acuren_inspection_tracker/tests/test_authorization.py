@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+import authorization
+from authorization import EMPLOYEE_HEADER
+
+
+@pytest.fixture
+def client(make_app, database):
+    conn = sqlite3.connect(database)
+    roles = dict(conn.execute('SELECT role_name, id FROM roles'))
+    conn.executemany('INSERT INTO employees (employee_id, role_id, active) VALUES (?, ?, ?)', [
+        ('EMP001', roles['Inspection Manager'], 1),
+        ('EMP004', roles['Field Inspector'], 1),
+        ('EMP009', roles['Inspection Manager'], 0)
+    ])
+    conn.commit()
+    conn.close()
+    return make_app(AUTHORIZATION='enforce', AUTHORIZATION_RECHECK_SECONDS=0).test_client()
+
+
+def test_roles_are_seeded_by_migration(database):
+    conn = sqlite3.connect(database)
+    compiled = dict(conn.execute('SELECT role_name, permissions FROM roles'))
+    conn.close()
+    assert 'manage_users' in authorization.parse_permissions(compiled['Inspection Manager'])
+    assert 'claim_tasks' in authorization.parse_permissions(compiled['Field Inspector'])
+
+
+def test_missing_header_is_401(client):
+    response = client.get('/api/tasks')
+    assert response.status_code == 401
+    assert EMPLOYEE_HEADER in response.get_json()['error']
+
+
+def test_unknown_and_inactive_employees_are_401(client):
+    assert client.get('/api/tasks', headers={EMPLOYEE_HEADER: 'EMP404'}).status_code == 401
+    assert client.get('/api/tasks', headers={EMPLOYEE_HEADER: 'EMP009'}).status_code == 401
+
+
+def test_role_without_permission_is_403(client):
+    response = client.get('/api/maintenance', headers={EMPLOYEE_HEADER: 'EMP004'})
+    assert response.status_code == 403
+    assert 'manage_users' in response.get_json()['error']
+
+
+def test_role_with_permission_is_allowed(client):
+    assert client.get('/api/tasks', headers={EMPLOYEE_HEADER: 'EMP004'}).status_code == 200
+    response = client.get('/api/authorization', headers={EMPLOYEE_HEADER: 'EMP001'})
+    assert response.status_code == 200
+    assert response.get_json()['role'] == 'Inspection Manager'
+
+
+def test_public_routes_need_no_header(client):
+    assert client.get('/api/health').status_code == 200
+
+
+def test_role_changes_apply_without_restart(client, database):
+    headers = {EMPLOYEE_HEADER: 'EMP004'}
+    assert client.get('/api/maintenance', headers=headers).status_code == 403
+    conn = sqlite3.connect(database)
+    conn.execute('''UPDATE roles SET permissions = '["manage_users"]' WHERE role_name = 'Field Inspector' ''')
+    conn.commit()
+    conn.close()
+    assert client.get('/api/maintenance', headers=headers).status_code == 200
+
+
+def test_audit_mode_lets_denied_requests_through(make_app):
+    client = make_app(AUTHORIZATION='audit').test_client()
+    assert client.get('/api/tasks').status_code == 200
+
+
+def test_audit_is_the_default(make_app):
+    make_app()
+    assert authorization._settings['mode'] == 'audit'
+
+
+@pytest.mark.parametrize('headers', [{}, {EMPLOYEE_HEADER: 'EMP404'}])
+def test_audit_mode_reports_no_permissions_for_unknown_callers(make_app, headers):
+    client = make_app(AUTHORIZATION='audit').test_client()
+    response = client.get('/api/authorization', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['permissions'] == []
+    assert response.get_json()['id'] is None
@@ -0,0 +1,94 @@
+import sqlite3
+
+import pytest
+
+from delta_sync import check_conflicts, needs_full_resync, prune_tombstones, sync_horizon
+
+
+@pytest.fixture
+def conn(database):
+    conn = sqlite3.connect(database)
+    conn.executemany('INSERT INTO inspection_tasks (id) VALUES (?)', [(task_id,) for task_id in range(1, 6)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def seq(conn, task_id):
+    return conn.execute('SELECT change_seq FROM inspection_tasks WHERE id = ?', (task_id,)).fetchone()[0]
+
+
+def delete_tasks(conn, task_ids, days_ago):
+    for task_id in task_ids:
+        conn.execute('DELETE FROM inspection_tasks WHERE id = ?', (task_id,))
+    conn.execute("UPDATE task_tombstones SET deleted_at = datetime('now', ?)", (f'-{days_ago} days',))
+    conn.commit()
+
+
+def test_check_conflicts_sorts_changes(conn):
+    base = seq(conn, 2)
+    conn.execute("UPDATE inspection_tasks SET comments = 'server edit' WHERE id = 2")
+    delete_tasks(conn, [3], days_ago=0)
+
+    accepted, conflicts = check_conflicts(conn, [
+        {'id': 1, 'base_seq': seq(conn, 1)},
+        {'id': 2, 'base_seq': base},
+        {'id': 3, 'base_seq': 1},
+        {'id': 1, 'base_seq': seq(conn, 1)},
+    ])
+
+    assert [change['id'] for change in accepted] == [1]
+    reasons = {(conflict['id'], conflict['reason']) for conflict in conflicts}
+    assert reasons == {(2, 'modified'), (3, 'deleted'), (1, 'duplicate')}
+    modified = next(conflict for conflict in conflicts if conflict['reason'] == 'modified')
+    assert modified['server']['comments'] == 'server edit'
+    assert modified['server_seq'] == seq(conn, 2)
+
+
+@pytest.mark.parametrize('change', [
+    {'id': 1},
+    {'id': 1, 'base_seq': 'abc'},
+    {'id': 1, 'base_seq': None},
+    {'id': 'x', 'base_seq': 1},
+    {'id': 1, 'base_seq': 1, 'fields': []},
+])
+def test_push_rejects_malformed_changes(make_app, conn, change):
+    client = make_app(AUTHORIZATION='off').test_client()
+    response = client.post('/api/sync/push', json={'changes': [change]})
+    assert response.status_code == 400
+
+
+def test_prune_keeps_newest_tombstone_and_raises_horizon(conn):
+    delete_tasks(conn, [1, 2, 3], days_ago=100)
+    newest = conn.execute('SELECT MAX(change_seq) FROM task_tombstones').fetchone()[0]
+
+    assert prune_tombstones(conn, retention_days=90) == 2
+    conn.commit()
+
+    assert [seq for (seq,) in conn.execute('SELECT change_seq FROM task_tombstones')] == [newest]
+    assert 0 < sync_horizon(conn) < newest
+    assert needs_full_resync(conn, 1)
+    assert not needs_full_resync(conn, 0)
+    assert not needs_full_resync(conn, sync_horizon(conn))
+
+
+def test_prune_leaves_recent_tombstones(conn):
+    delete_tasks(conn, [1, 2], days_ago=10)
+    assert prune_tombstones(conn, retention_days=90) == 0
+    assert sync_horizon(conn) == 0
+
+
+def test_sync_behind_horizon_is_a_full_resync(make_app, conn):
+    delete_tasks(conn, [1, 2, 3], days_ago=100)
+    prune_tombstones(conn, retention_days=90)
+    conn.commit()
+    client = make_app(AUTHORIZATION='off').test_client()
+
+    body = client.get('/api/sync?since=1').get_json()
+    assert body['full_resync'] is True
+    assert body['since'] == 0
+    assert {task['id'] for task in body['tasks']} == {4, 5}
+
+    body = client.get('/api/sync?since=1&full=1').get_json()
+    assert body['full_resync'] is False
+    assert body['since'] == 1
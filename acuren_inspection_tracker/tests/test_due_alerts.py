@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from due_alerts import sweep_due_alerts
+from lookup_encoding import lookup_id
+
+TODAY = '2026-03-10'
+
+
+@pytest.fixture
+def conn(database):
+    conn = sqlite3.connect(database)
+    closed = lookup_id(conn, 'status', 'Field Complete')
+    conn.executemany('INSERT INTO inspection_tasks (id, due_date, status_id) VALUES (?, ?, ?)', [
+        (1, '2025-01-15', None),    # long overdue
+        (2, '2026-03-09', None),    # overdue since yesterday
+        (3, TODAY, None),           # due today
+        (4, '2026-03-15', None),    # due soon
+        (5, '2026-04-30', None),    # outside every window
+        (6, '2026-03-01', closed),  # overdue but closed
+        (7, None, None),            # no due date
+    ])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def alerts(conn):
+    return dict(conn.execute('SELECT task_id, alert_type FROM due_alerts').fetchall())
+
+
+def test_first_sweep_alerts_tasks_already_in_a_window(conn):
+    new_alerts = sweep_due_alerts(conn, today=TODAY, due_soon_days=7)
+
+    assert new_alerts == {'overdue': 2, 'due_today': 1, 'due_soon': 1}
+    assert alerts(conn) == {1: 'overdue', 2: 'overdue', 3: 'due_today', 4: 'due_soon'}
+    assert conn.execute('SELECT COUNT(*) FROM notifications').fetchone()[0] == 4
+
+
+def test_repeated_sweep_raises_nothing_new(conn):
+    sweep_due_alerts(conn, today=TODAY, due_soon_days=7)
+    assert sweep_due_alerts(conn, today=TODAY, due_soon_days=7) == {'overdue': 0, 'due_today': 0, 'due_soon': 0}
+
+
+def test_later_sweep_alerts_tasks_crossing_into_a_window(conn):
+    sweep_due_alerts(conn, today=TODAY, due_soon_days=7)
+    new_alerts = sweep_due_alerts(conn, today='2026-03-11', due_soon_days=7)
+
+    assert new_alerts == {'overdue': 1, 'due_today': 0, 'due_soon': 0}
+    assert conn.execute(
+        "SELECT 1 FROM due_alerts WHERE task_id = 3 AND alert_type = 'overdue'").fetchone()
+
+
+def test_rescheduled_task_is_alerted_by_its_change(conn):
+    sweep_due_alerts(conn, today=TODAY, due_soon_days=7)
+    conn.execute("UPDATE inspection_tasks SET due_date = '2026-03-12' WHERE id = 5")
+    conn.commit()
+
+    assert sweep_due_alerts(conn, today=TODAY, due_soon_days=7)['due_soon'] == 1
+    assert alerts(conn)[5] == 'due_soon'
@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+from due_dates import recompute_due_dates
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE inspection_tasks (
+            id INTEGER PRIMARY KEY, last_inspection_date DATE, frequency REAL, interval_type TEXT, due_date DATE
+        )
+    ''')
+    conn.execute('CREATE TABLE time_intervals (interval_name TEXT, interval_value INTEGER, interval_unit TEXT)')
+    # As complete_schema seeds them: months and years given as day counts
+    conn.executemany('INSERT INTO time_intervals VALUES (?, ?, ?)', [
+        ('Days', 1, 'days'), ('Weeks', 7, 'days'), ('Months', 30, 'days'), ('Years', 365, 'days'),
+        ('Quarters', 3, 'months')
+    ])
+    yield conn
+    conn.close()
+
+
+def due_date(conn, last_inspection_date, frequency, interval_type):
+    task_id = conn.execute(
+        'INSERT INTO inspection_tasks (last_inspection_date, frequency, interval_type) VALUES (?, ?, ?)',
+        (last_inspection_date, frequency, interval_type)).lastrowid
+    recompute_due_dates(conn, [task_id])
+    return conn.execute('SELECT due_date FROM inspection_tasks WHERE id = ?', (task_id,)).fetchone()[0]
+
+
+@pytest.mark.parametrize('last, frequency, interval, expected', [
+    ('2024-01-15', 1, 'Months', '2024-02-15'),
+    ('2024-01-15', 6, 'Months', '2024-07-15'),
+    ('2024-03-15', 5, 'Years', '2029-03-15'),
+    ('2024-03-15 10:30:00', 1, 'years', '2025-03-15'),
+    ('2024-11-30', 1, 'Quarters', '2025-02-28'),
+    ('2024-01-15', 2, 'Weeks', '2024-01-29'),
+    ('2024-01-15', 10, 'Days', '2024-01-25')
+])
+def test_calendar_and_day_intervals(conn, last, frequency, interval, expected):
+    assert due_date(conn, last, frequency, interval) == expected
+
+
+@pytest.mark.parametrize('last, frequency, interval, expected', [
+    ('2024-01-31', 1, 'Months', '2024-02-29'),
+    ('2023-01-31', 1, 'Months', '2023-02-28'),
+    ('2024-03-31', 1, 'Months', '2024-04-30'),
+    ('2024-02-29', 1, 'Years', '2025-02-28')
+])
+def test_month_end_is_clamped_to_the_target_month(conn, last, frequency, interval, expected):
+    assert due_date(conn, last, frequency, interval) == expected
+
+
+def test_monthly_schedule_does_not_drift(conn):
+    last = '2024-01-15'
+    for _ in range(24):
+        last = due_date(conn, last, 1, 'Months')
+    assert last == '2026-01-15'
+
+
+def test_fractional_months_add_the_remainder_in_days(conn):
+    assert due_date(conn, '2024-01-15', 1.5, 'Months') == '2024-03-01'
+
+
+def test_unparseable_dates_are_left_alone(conn):
+    assert due_date(conn, 'not a date', 1, 'Months') is None
@@ -0,0 +1,95 @@
+import sqlite3
+from collections import Counter
+
+import pytest
+
+from facets import FACET_COLUMNS, NULL_KEYS, task_facets
+from lookup_encoding import lookup_id
+from task_archive import archive_closed_tasks
+
+KEY_SQL = ', '.join(f'IFNULL({column}, {NULL_KEYS.get(column, 0)})' for column in FACET_COLUMNS.values())
+
+
+@pytest.fixture
+def conn(database):
+    conn = sqlite3.connect(database)
+    yield conn
+    conn.close()
+
+
+def add_tasks(conn, count, start=1):
+    sites = [lookup_id(conn, 'site', name) for name in ('North', 'South', None)]
+    inspectors = [lookup_id(conn, 'inspector', name) for name in ('Kent Manuel', 'Ada Osei')]
+    statuses = [lookup_id(conn, 'status', name) for name in ('UnInitiated', 'Claimed', 'Reported')]
+    methods = [lookup_id(conn, 'method', name) for name in ('UT', 'VI')]
+    conn.executemany('''
+        INSERT INTO inspection_tasks (id, site_id, inspector_id, status_id, method_id, inspection_priority)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(task_id, sites[task_id % 3], inspectors[task_id % 2] if task_id % 5 else None,
+           statuses[task_id // 2 % 3], methods[task_id // 3 % 2], task_id % 4 or None)
+          for task_id in range(start, start + count)])
+    conn.commit()
+
+
+def stored(conn):
+    return Counter({row[:-1]: row[-1] for row in conn.execute(
+        f'SELECT {", ".join(FACET_COLUMNS.values())}, tasks FROM task_facet_counts WHERE tasks <> 0')})
+
+
+def direct(conn):
+    return Counter({row[:-1]: row[-1] for row in conn.execute(
+        f'SELECT {KEY_SQL}, COUNT(*) FROM main.inspection_tasks GROUP BY {KEY_SQL}')})
+
+
+def test_counts_match_a_direct_group_by_through_writes(conn, tmp_path):
+    add_tasks(conn, 60)
+    assert stored(conn) == direct(conn)
+
+    add_tasks(conn, 5, start=61)
+    conn.execute('UPDATE inspection_tasks SET status_id = ? WHERE id % 4 = 0', (lookup_id(conn, 'status', 'Claimed'),))
+    conn.execute('UPDATE inspection_tasks SET inspector_id = NULL, inspection_priority = 9 WHERE id % 6 = 0')
+    conn.execute('UPDATE inspection_tasks SET site_id = NULL, method_id = NULL WHERE id IN (2, 3)')
+    conn.execute("UPDATE inspection_tasks SET comments = 'not a facet' WHERE id = 4")
+    conn.commit()
+    assert stored(conn) == direct(conn)
+
+    conn.execute('DELETE FROM inspection_tasks WHERE id % 9 = 0')
+    conn.commit()
+    assert stored(conn) == direct(conn)
+
+    conn.execute("UPDATE inspection_tasks SET updated_at = datetime('now', '-400 days')")
+    conn.commit()
+    assert archive_closed_tasks(conn, str(tmp_path / 'archive.db'), after_days=180) > 0
+    assert stored(conn) == direct(conn)
+
+
+def test_each_facet_excludes_its_own_filter(conn):
+    add_tasks(conn, 60)
+    facets, total = task_facets(conn, {'site': 'North', 'status': 'Claimed'})
+
+    north, claimed = lookup_id(conn, 'site', 'North'), lookup_id(conn, 'status', 'Claimed')
+    assert 0 < total == conn.execute('SELECT COUNT(*) FROM inspection_tasks WHERE site_id = ? AND status_id = ?',
+                                     (north, claimed)).fetchone()[0]
+    site_counts = dict(conn.execute('''
+        SELECT IFNULL(s.site_code, ''), COUNT(*) FROM inspection_tasks t LEFT JOIN sites s ON s.id = t.site_id
+        WHERE t.status_id = ? GROUP BY 1
+    ''', (claimed,)))
+    assert {item['value']: item['count'] for item in facets['site']} == site_counts
+    method_counts = dict(conn.execute('''
+        SELECT m.method_name, COUNT(*) FROM inspection_tasks t JOIN methods m ON m.id = t.method_id
+        WHERE t.site_id = ? AND t.status_id = ? GROUP BY 1
+    ''', (north, claimed)))
+    assert {item['value']: item['count'] for item in facets['method']} == method_counts
+
+
+def test_cached_facets_follow_task_changes(make_app, conn):
+    add_tasks(conn, 10)
+    client = make_app(AUTHORIZATION='off').test_client()
+    first = client.get('/api/tasks/facets?status=Claimed').get_json()
+    assert client.get('/api/tasks/facets?status=Claimed').get_json()['cached'] is True
+
+    conn.execute('UPDATE inspection_tasks SET status_id = ? WHERE id = 1', (lookup_id(conn, 'status', 'Claimed'),))
+    conn.commit()
+    after = client.get('/api/tasks/facets?status=Claimed').get_json()
+    assert after['cached'] is False
+    assert after['total'] == first['total'] + 1
@@ -0,0 +1,90 @@
+import sqlite3
+from collections import Counter
+
+import pytest
+
+from hierarchy import hierarchy_path, index_new_tasks
+from lookup_encoding import lookup_id
+from task_archive import archive_closed_tasks
+
+
+@pytest.fixture
+def conn(database):
+    conn = sqlite3.connect(database)
+    yield conn
+    conn.close()
+
+
+def add_tasks(conn, tasks):
+    """tasks: (id, hierarchy item name, status, due date)"""
+    conn.executemany('INSERT INTO inspection_tasks (id, hierarchy_item_name, status_id, due_date) VALUES (?, ?, ?, ?)',
+                     [(task_id, name, lookup_id(conn, 'status', status), due) for task_id, name, status, due in tasks])
+    index_new_tasks(conn)
+    conn.commit()
+
+
+def rollup(conn):
+    return Counter({(node_id, status_id, month): tasks for node_id, status_id, month, tasks in conn.execute(
+        'SELECT node_id, status_id, due_month, tasks FROM hierarchy_rollup WHERE tasks <> 0')})
+
+
+def expected_rollup(conn):
+    """The rollup counted directly from the tasks and the node paths"""
+    node_ids = dict(conn.execute('SELECT path, id FROM hierarchy_nodes'))
+    ancestors = {}
+    for node_id, ancestor_id in conn.execute('SELECT node_id, ancestor_id FROM hierarchy_closure'):
+        ancestors.setdefault(node_id, []).append(ancestor_id)
+    counts = Counter()
+    for name, status_id, month, tasks in conn.execute('''
+        SELECT hierarchy_item_name, IFNULL(status_id, 0), IFNULL(substr(due_date, 1, 7), ''), COUNT(*)
+        FROM inspection_tasks GROUP BY 1, 2, 3
+    '''):
+        for ancestor_id in ancestors[node_ids[hierarchy_path(name)]]:
+            counts[(ancestor_id, status_id, month)] += tasks
+    return +counts
+
+
+def test_renamed_task_moves_to_its_new_node(conn):
+    add_tasks(conn, [
+        (1, 'Unit 30 / Area 11 / VI-1', 'UnInitiated', '2026-01-15'),
+        (2, 'Unit 30 / Area 12 / VI-2', 'UnInitiated', '2026-02-15'),
+    ])
+    conn.execute("UPDATE inspection_tasks SET hierarchy_item_name = 'Unit 31 / Area 1 / VI-1' WHERE id = 1")
+    conn.execute('UPDATE inspection_tasks SET hierarchy_item_name = ?, status_id = ?, due_date = ? WHERE id = 2',
+                 ('Unit 31 / Area 2 / VI-2', lookup_id(conn, 'status', 'Field Complete'), '2026-03-01'))
+    assert index_new_tasks(conn) == 2
+    conn.commit()
+
+    assert rollup(conn) == expected_rollup(conn)
+    node = conn.execute("SELECT id FROM hierarchy_nodes WHERE path = 'Unit 30'").fetchone()[0]
+    assert conn.execute('SELECT SUM(tasks) FROM hierarchy_rollup WHERE node_id = ?', (node,)).fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM hierarchy_remap').fetchone()[0] == 0
+
+
+def test_rollup_matches_a_direct_count_through_writes(conn, tmp_path):
+    add_tasks(conn, [(task_id, f'Unit {task_id % 3} / Area {task_id % 5} / VI-{task_id}', 'UnInitiated',
+                      f'2026-{task_id % 12 + 1:02d}-10' if task_id % 4 else None) for task_id in range(1, 41)])
+    assert rollup(conn) == expected_rollup(conn)
+
+    add_tasks(conn, [(41, 'Unit 9 > VI-41', 'Claimed', '2027-01-01'), (42, '', None, None)])
+    assert rollup(conn) == expected_rollup(conn)
+
+    conn.execute('UPDATE inspection_tasks SET status_id = ? WHERE id % 2 = 0',
+                 (lookup_id(conn, 'status', 'Field Complete'),))
+    conn.execute("UPDATE inspection_tasks SET due_date = '2026-12-31' WHERE id % 3 = 0")
+    conn.execute("UPDATE inspection_tasks SET due_date = NULL, status_id = NULL WHERE id = 5")
+    conn.execute("UPDATE inspection_tasks SET due_date = '2026-03-20' WHERE id = 7")
+    conn.commit()
+    assert rollup(conn) == expected_rollup(conn)
+
+    conn.execute('DELETE FROM inspection_tasks WHERE id IN (1, 3, 41)')
+    conn.commit()
+    assert rollup(conn) == expected_rollup(conn)
+
+    conn.execute("UPDATE inspection_tasks SET updated_at = datetime('now', '-400 days')")
+    conn.commit()
+    archived = archive_closed_tasks(conn, str(tmp_path / 'archive.db'), after_days=180, batch_size=7)
+    assert archived == conn.execute('SELECT COUNT(*) FROM archive.inspection_tasks').fetchone()[0] > 0
+    assert rollup(conn) == expected_rollup(conn)
+    live = conn.execute('SELECT COUNT(*) FROM main.inspection_tasks').fetchone()[0]
+    assert sum(count for (node_id, _, _), count in rollup(conn).items() if node_id == 0) == live
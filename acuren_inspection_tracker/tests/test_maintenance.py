@@ -0,0 +1,61 @@
+import json
+import sqlite3
+
+import pytest
+
+from instrumentation import registry
+from maintenance import is_due, run_maintenance, scheduler
+
+
+class FailingCheckConnection(sqlite3.Connection):
+    """Raises on the integrity pragma, like a check cut short by an I/O error"""
+
+    def execute(self, sql, *args):
+        if 'quick_check' in sql:
+            raise sqlite3.DatabaseError('disk I/O error')
+        return super().execute(sql, *args)
+
+
+def integrity_runs(database):
+    conn = sqlite3.connect(database)
+    rows = [json.loads(result) for (result,) in
+            conn.execute("SELECT result FROM maintenance_runs WHERE task = 'integrity' ORDER BY id")]
+    conn.close()
+    return rows
+
+
+def test_failed_integrity_check_is_recorded_and_retried(database):
+    registry.reset()
+    conn = sqlite3.connect(database, factory=FailingCheckConnection)
+    results = run_maintenance(conn, ['integrity'])
+
+    assert results['integrity']['error'] == 'disk I/O error'
+    assert integrity_runs(database) == [{'check': 'quick_check', 'ok': False, 'error': 'disk I/O error'}]
+    assert is_due(conn, 'integrity')
+    assert 'acuren_maintenance_runs_total{task="integrity",outcome="failed"} 1' in registry.render()
+    conn.close()
+
+
+def test_integrity_check_records_its_result(database):
+    conn = sqlite3.connect(database)
+    assert run_maintenance(conn, ['integrity'])['integrity']['ok'] is True
+    assert not is_due(conn, 'integrity')
+    conn.close()
+    assert integrity_runs(database)[-1]['messages'] == ['ok']
+
+
+@pytest.fixture
+def client(make_app):
+    return make_app(AUTHORIZATION='off', MAINTENANCE_CHECK_SECONDS=0).test_client()
+
+
+def test_run_endpoint_queues_and_returns_202(client, database):
+    response = client.post('/api/maintenance/run?task=integrity')
+    assert response.status_code == 202
+
+    scheduler.drain()
+    assert integrity_runs(database)[-1]['ok'] is True
+
+
+def test_run_endpoint_rejects_unknown_tasks(client):
+    assert client.post('/api/maintenance/run?task=defrag').status_code == 400
@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+
+from instrumentation import MetricsRegistry, merge_snapshots, _render_families
+
+
+def worker_registry(requests, latency):
+    registry = MetricsRegistry()
+    registry.inc('requests_total', (('route', '/a'),), requests, help_text='Requests.')
+    registry.observe('latency_seconds', (), (latency,), (0.1, 1), help_text='Latency.')
+    registry.set('queue_depth', (), requests, help_text='Queue depth.')
+    return registry
+
+
+def test_merge_sums_counters_and_histograms_and_labels_gauges():
+    snapshots = {pid: json.loads(json.dumps(worker_registry(requests, latency).snapshot()))
+                 for pid, requests, latency in [(101, 2, 0.05), (102, 3, 0.5)]}
+    text = _render_families(merge_snapshots(snapshots))
+
+    assert 'requests_total{route="/a"} 5' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_count 2' in text
+    assert 'queue_depth{pid="101"} 2' in text
+    assert 'queue_depth{pid="102"} 3' in text
+
+
+def test_metrics_endpoint_adds_up_every_worker(make_app, tmp_path):
+    metrics_dir = tmp_path / 'metrics'
+    client = make_app(AUTHORIZATION='off', METRICS_DIR=str(metrics_dir)).test_client()
+    # Another worker's snapshot, as its writer thread leaves it
+    other = MetricsRegistry()
+    other.inc('acuren_http_requests_total', (('route', '/api/health'), ('method', 'GET'), ('status', '200')), 40)
+    (metrics_dir / 'metrics-1.json').write_text(json.dumps(other.snapshot()))
+
+    client.get('/api/health')
+    text = client.get('/api/metrics').get_data(as_text=True)
+
+    assert 'acuren_http_requests_total{route="/api/health",method="GET",status="200"} 41' in text
+    assert os.path.exists(metrics_dir / f'metrics-{os.getpid()}.json')
+
+
+def test_exited_workers_are_folded_into_the_retired_snapshot(make_app, tmp_path):
+    metrics_dir = tmp_path / 'metrics'
+    client = make_app(AUTHORIZATION='off', METRICS_DIR=str(metrics_dir)).test_client()
+    exited = []
+    for requests in (5, 7):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        exited.append(process.pid)
+        registry = worker_registry(requests, 0.5)
+        (metrics_dir / f'metrics-{process.pid}.json').write_text(json.dumps(registry.snapshot()))
+
+    for _ in range(2):
+        text = client.get('/api/metrics').get_data(as_text=True)
+        assert 'requests_total{route="/a"} 12' in text
+        assert 'latency_seconds_count 2' in text
+        assert 'queue_depth' not in text
+
+    assert sorted(path.name for path in metrics_dir.glob('metrics-*.json')) == [
+        f'metrics-{os.getpid()}.json', 'metrics-retired.json']
@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from migrations import LATEST_VERSION, MIGRATIONS, Backfill, applied_versions, migrate, schema_status
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'fresh.db'))
+    yield conn
+    conn.close()
+
+
+def test_versions_are_unique_and_increasing():
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert versions == sorted(set(versions))
+    assert LATEST_VERSION == versions[-1]
+
+
+def test_migrate_applies_everything_once(conn):
+    assert migrate(conn) == [version for version, _, _ in MIGRATIONS]
+    assert migrate(conn) == []
+    applied, pending = schema_status(conn)
+    assert [migration['version'] for migration in applied] == [version for version, _, _ in MIGRATIONS]
+    assert pending == []
+
+
+def test_target_stops_and_a_later_run_continues(conn):
+    assert migrate(conn, target=3) == [1, 2, 3]
+    conn.execute('INSERT INTO inspection_tasks (id, comments) VALUES (1, ?)', ('kept',))
+    conn.commit()
+
+    assert migrate(conn)[0] == 4
+    assert applied_versions(conn) == {version for version, _, _ in MIGRATIONS}
+    row = conn.execute('SELECT comments, change_seq FROM inspection_tasks WHERE id = 1').fetchone()
+    assert row[0] == 'kept' and row[1] is not None
+
+
+def test_failed_migration_is_not_recorded_and_reruns(conn, monkeypatch):
+    calls = []
+
+    def create_table(conn):
+        calls.append('create')
+        conn.execute('CREATE TABLE IF NOT EXISTS widgets (id INTEGER PRIMARY KEY)')
+
+    def fail(conn):
+        raise sqlite3.OperationalError('interrupted')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [(1, 'widgets', [create_table, fail])])
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(conn)
+    assert applied_versions(conn) == set()
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [(1, 'widgets', [create_table])])
+    assert migrate(conn) == [1]
+    assert calls == ['create', 'create']
+
+
+def test_backfill_resumes_from_recorded_progress(conn):
+    migrations.create_migration_tables(conn)
+    conn.execute('CREATE TABLE widgets (id INTEGER PRIMARY KEY, done INTEGER DEFAULT 0)')
+    conn.executemany('INSERT INTO widgets (id) VALUES (?)', [(widget_id,) for widget_id in range(1, 8)])
+    # A previous run got through id 3 before it was interrupted
+    conn.execute("INSERT INTO schema_backfills (version, name, last_id, rows_changed) VALUES (1, 'done', 3, 3)")
+    conn.commit()
+
+    backfill = Backfill('done', 'widgets', 'UPDATE widgets SET done = 1 WHERE id > ? AND id <= ?',
+                        batch_size=2, pause=0)
+    assert backfill.run(conn, 1) == 4
+
+    assert [widget_id for (widget_id,) in conn.execute('SELECT id FROM widgets WHERE done = 1')] == [4, 5, 6, 7]
+    assert conn.execute("SELECT last_id, rows_changed FROM schema_backfills WHERE name = 'done'").fetchone() == (7, 7)
+    assert backfill.run(conn, 1) == 0
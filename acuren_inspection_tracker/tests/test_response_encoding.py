@@ -0,0 +1,25 @@
+import json
+
+import numpy as np
+import pytest
+
+import response_encoding
+from response_encoding import OrjsonProvider
+
+NON_FINITE = {'nan': float('nan'), 'inf': [float('-inf')], 'np64': np.float64('nan'), 'np32': np.float32('inf'),
+              'finite': (1.5, np.float32(2.0))}
+EXPECTED = {'nan': None, 'inf': [None], 'np64': None, 'np32': None, 'finite': [1.5, 2.0]}
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_non_finite_floats_become_null(make_app, monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(response_encoding, 'orjson', None)
+    elif response_encoding.orjson is None:
+        pytest.skip('orjson is not installed')
+    app = make_app()
+    assert isinstance(app.json, OrjsonProvider)
+
+    assert json.loads(app.json.dumps(NON_FINITE)) == EXPECTED
+    with app.app_context():
+        assert json.loads(app.json.response(NON_FINITE).get_data()) == EXPECTED
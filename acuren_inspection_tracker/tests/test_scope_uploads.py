@@ -0,0 +1,88 @@
+import io
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from data_loader import SCOPE_SHEET
+from lookup_encoding import lookup_id
+
+
+@pytest.fixture
+def client(make_app, database):
+    conn = sqlite3.connect(database)
+    lookup_id(conn, 'inspector', 'Kent Manuel')
+    lookup_id(conn, 'site', 'North')
+    conn.commit()
+    conn.close()
+    return make_app(AUTHORIZATION='off').test_client()
+
+
+def workbook(rows):
+    """An xlsx scope sheet of (hierarchy item name, site, inspector) rows"""
+    frame = pd.DataFrame(rows, columns=['Hierarchy Item Name', 'Site', 'Inspector'])
+    buffer = io.BytesIO()
+    frame.to_excel(buffer, sheet_name=SCOPE_SHEET, index=False)
+    return buffer.getvalue()
+
+
+def upload(client, content, filename='scope.xlsx'):
+    return client.post('/api/scope/upload', data={'file': (io.BytesIO(content), filename)},
+                       content_type='multipart/form-data')
+
+
+def task_count(database, upload_id=None):
+    conn = sqlite3.connect(database)
+    if upload_id is None:
+        count = conn.execute('SELECT COUNT(*) FROM inspection_tasks').fetchone()[0]
+    else:
+        count = conn.execute('SELECT COUNT(*) FROM inspection_tasks WHERE upload_id = ?', (upload_id,)).fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_same_workbook_returns_the_earlier_upload(client, database):
+    content = workbook([('Unit 1 / VI-1', 'North', 'Kent Manuel'), ('Unit 1 / VI-2', 'North', 'Kent Manuel')])
+    first = upload(client, content).get_json()
+    assert first['duplicate'] is False
+    assert first['records_processed'] == 2
+
+    again = upload(client, content, filename='renamed.xlsx').get_json()
+    assert again['duplicate'] is True
+    assert again['upload_id'] == first['upload_id']
+    assert task_count(database) == 2
+
+
+def test_rejecting_an_upload_removes_only_its_tasks(client, database):
+    kept = upload(client, workbook([('Unit 1 / VI-1', 'North', 'Kent Manuel')])).get_json()['upload_id']
+    rejected = upload(client, workbook([(f'Unit 2 / VI-{n}', 'North', 'Kent Manuel') for n in range(3)]))
+    rejected = rejected.get_json()['upload_id']
+
+    response = client.put(f'/api/scope/review/{rejected}', json={'status': 'rejected'})
+    assert response.get_json()['tasks_removed'] == 3
+    assert task_count(database, rejected) == 0
+    assert task_count(database, kept) == 1
+    assert task_count(database) == 1
+
+    response = client.put(f'/api/scope/review/{rejected}', json={'status': 'approved'})
+    assert response.status_code == 409
+
+
+def test_unknown_lookup_names_refuse_the_whole_sheet(client, database):
+    response = upload(client, workbook([
+        ('Unit 1 / VI-1', 'North', 'Kent Manuel'),
+        ('Unit 1 / VI-2', 'Nroth', ''),
+        ('Unit 1 / VI-3', 'North', 'Kent Manual'),
+    ]))
+    assert response.status_code == 400
+    body = response.get_json()
+    violations = body['validation']['violations']
+    assert violations['Site']['rows'] == [3]
+    assert violations['Inspector']['rows'] == [4]
+    assert body['validation']['rows_rejected'] == 2
+    assert task_count(database) == 0
+
+    report = client.get(f"/api/scope/{body['upload_id']}/validation").get_json()
+    assert report['validation'] == body['validation']
+    response = client.put(f"/api/scope/review/{body['upload_id']}", json={'status': 'approved'})
+    assert response.status_code == 409
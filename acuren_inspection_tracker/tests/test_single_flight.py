@@ -0,0 +1,96 @@
+import threading
+import time
+
+from flask import Flask, jsonify
+
+from single_flight import CoalesceTimeout, SingleFlight, coalesce
+
+CALLERS = 8
+
+
+def run_concurrently(target, count=CALLERS):
+    """Call target(index) from count threads at once; returns the results or exceptions by index"""
+    results = [None] * count
+    arrived = threading.Barrier(count)
+
+    def call(index):
+        arrived.wait()
+        try:
+            results[index] = target(index)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+class SlowQuery:
+    """Stands in for an aggregate: counts its runs and holds each until every caller has had time to arrive"""
+
+    def __init__(self, result='rows', error=None):
+        self.runs = 0
+        self.result = result
+        self.error = error
+
+    def __call__(self):
+        self.runs += 1
+        time.sleep(0.2)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_identical_calls_run_once():
+    flights, query = SingleFlight(), SlowQuery()
+    results = run_concurrently(lambda index: flights.do('overview', query, 'overview'))
+
+    assert query.runs == 1
+    assert sorted(coalesced for _, coalesced in results) == [False] + [True] * (CALLERS - 1)
+    assert {result for result, _ in results} == {'rows'}
+    assert flights.do('overview', query, 'overview') == ('rows', False)
+    assert query.runs == 2
+
+
+def test_different_keys_run_separately():
+    flights, query = SingleFlight(), SlowQuery()
+    run_concurrently(lambda index: flights.do(index % 2, query, 'overview'))
+    assert query.runs == 2
+
+
+def test_leader_error_reaches_every_waiter():
+    flights, query = SingleFlight(), SlowQuery(error=RuntimeError('database is locked'))
+    results = run_concurrently(lambda index: flights.do('overview', query, 'overview'))
+    assert query.runs == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_waiter_times_out():
+    flights, query = SingleFlight(), SlowQuery()
+    results = run_concurrently(lambda index: flights.do('overview', query, 'overview', timeout=0.01), count=2)
+    assert query.runs == 1
+    assert sum(isinstance(result, CoalesceTimeout) for result in results) == 1
+
+
+def test_coalesced_route_shares_one_response():
+    app = Flask(__name__)
+    query = SlowQuery()
+
+    @app.route('/overview')
+    @coalesce()
+    def overview():
+        query()
+        return jsonify({'runs': query.runs}), 200, {'X-Source': 'overview'}
+
+    def get(index):
+        response = app.test_client().get(f'/overview?site={index % 2}')
+        return index % 2, response.status_code, response.get_json()['runs'], response.headers['X-Source']
+
+    results = set(run_concurrently(get))
+    assert query.runs == 2
+    assert len(results) == 2
+    assert {(site, status, source) for site, status, _, source in results} == {
+        (0, 200, 'overview'), (1, 200, 'overview')}
@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def client(make_app, database):
+    conn = sqlite3.connect(database)
+    conn.executemany('INSERT INTO inspection_tasks (id) VALUES (?)', [(task_id,) for task_id in range(1, 13)])
+    conn.execute("INSERT INTO employees (id, employee_id, first_name, last_name) VALUES (1, 'E1', 'Kent', 'Manuel')")
+    conn.execute("INSERT INTO roles (id, role_name) VALUES (100, 'Reviewer')")
+    conn.commit()
+    conn.close()
+    return make_app(AUTHORIZATION='off').test_client()
+
+
+def linked_ids(client, path, per_page=5, **filters):
+    """Every linked task id, page by page, and the total reported with the first page"""
+    ids, after, total = [], 0, None
+    while after is not None:
+        body = client.get(path, query_string=dict(filters, after=after, per_page=per_page)).get_json()
+        if after == 0:
+            total = body['total']
+        else:
+            assert body['total'] is None
+        assert len(body['tasks']) <= per_page
+        ids.extend(task['id'] for task in body['tasks'])
+        after = body['next_after']
+    return ids, total
+
+
+def test_link_page_and_unlink(client):
+    response = client.post('/api/employees/1/tasks', json={'task_ids': list(range(12, 0, -1)) + [99]})
+    assert response.get_json()['linked'] == 12
+    assert response.get_json()['unknown_task_ids'] == [99]
+    assert client.post('/api/employees/1/tasks', json={'task_ids': [1, 2]}).get_json()['linked'] == 0
+
+    assert linked_ids(client, '/api/employees/1/tasks') == (list(range(1, 13)), 12)
+    assert linked_ids(client, '/api/employees/1/tasks', per_page=12) == (list(range(1, 13)), 12)
+    links = client.get('/api/tasks/3/employees').get_json()['employees']
+    assert links == [{'id': 1, 'name': 'Kent Manuel', 'relationship_type': 'assigned'}]
+
+    response = client.delete('/api/employees/1/tasks', json={'task_ids': [1, 2, 99]})
+    assert response.get_json()['unlinked'] == 2
+    assert linked_ids(client, '/api/employees/1/tasks') == (list(range(3, 13)), 10)
+
+    assert client.delete('/api/employees/1/tasks', json={'all': True}).get_json()['unlinked'] == 10
+    assert linked_ids(client, '/api/employees/1/tasks') == ([], 0)
+    assert client.get('/api/tasks/3/employees').get_json()['employees'] == []
+
+
+def test_link_attributes(client):
+    client.post('/api/employees/1/tasks', json={'task_ids': [1, 2], 'relationship_type': 'reviewer'})
+    client.post('/api/employees/1/tasks', json={'task_ids': [2, 3]})
+    assert linked_ids(client, '/api/employees/1/tasks', relationship_type='reviewer') == ([1, 2], 2)
+    response = client.delete('/api/employees/1/tasks', json={'task_ids': [2], 'relationship_type': 'reviewer'})
+    assert response.get_json()['unlinked'] == 1
+    assert linked_ids(client, '/api/employees/1/tasks') == ([1, 2, 3], 3)
+
+    client.post('/api/roles/100/tasks', json={'task_ids': [1], 'access_level': 'read'})
+    response = client.post('/api/roles/100/tasks', json={'task_ids': [1], 'access_level': 'write'})
+    assert response.get_json()['linked'] == 1
+    roles = client.get('/api/tasks/1/roles').get_json()['roles']
+    assert roles == [{'id': 100, 'name': 'Reviewer', 'access_level': 'write'}]
+
+
+def test_link_to_missing_entity_is_404(client):
+    assert client.post('/api/roles/999/tasks', json={'task_ids': [1]}).status_code == 404
+    assert client.post('/api/employees/1/tasks', json={'task_ids': []}).status_code == 400
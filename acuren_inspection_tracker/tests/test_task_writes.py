@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+from lookup_encoding import lookup_id
+
+
+@pytest.fixture
+def client(make_app, database):
+    conn = sqlite3.connect(database)
+    conn.execute('INSERT INTO inspection_tasks (id, inspector_id, status_id) VALUES (1, NULL, ?)',
+                 (lookup_id(conn, 'status', 'UnInitiated'),))
+    lookup_id(conn, 'inspector', 'Kent Manuel')
+    conn.commit()
+    conn.close()
+    return make_app(AUTHORIZATION='off').test_client()
+
+
+def lookup_names(database, table, column):
+    conn = sqlite3.connect(database)
+    names = {name for (name,) in conn.execute(f'SELECT {column} FROM {table}')}
+    conn.close()
+    return names
+
+
+def test_assign_to_unknown_inspector_is_400_and_adds_nothing(client, database):
+    response = client.post('/api/tasks/assign', json={'task_id': 1, 'assigned_to': 'Nobody Known'})
+    assert response.status_code == 400
+    assert 'Nobody Known' not in lookup_names(database, 'inspectors', 'name')
+
+
+def test_claim_by_unknown_inspector_is_400(client, database):
+    assert client.post('/api/tasks/1/claim', json={'inspector': 'Nobody Known'}).status_code == 400
+    assert 'Nobody Known' not in lookup_names(database, 'inspectors', 'name')
+
+
+def test_update_to_unknown_status_is_400_and_changes_nothing(client, database):
+    response = client.put('/api/tasks/1/update', json={'status': 'Bogus Status', 'comments': 'x'})
+    assert response.status_code == 400
+    assert 'Bogus Status' not in lookup_names(database, 'status_types', 'status_name')
+    assert client.get('/api/tasks/1').get_json()['status'] == 'UnInitiated'
+
+
+def test_known_names_are_applied(client):
+    assert client.post('/api/tasks/1/claim', json={'inspector': 'Kent Manuel'}).status_code == 200
+    task = client.get('/api/tasks/1').get_json()
+    assert (task['inspector'], task['status']) == ('Kent Manuel', 'Claimed')
+
+
+def test_push_rejects_unknown_names_per_change(client, database):
+    conn = sqlite3.connect(database)
+    base_seq = conn.execute('SELECT change_seq FROM inspection_tasks WHERE id = 1').fetchone()[0]
+    conn.close()
+    response = client.post('/api/sync/push', json={'changes': [
+        {'id': 1, 'base_seq': base_seq, 'fields': {'inspector': 'Nobody Known'}}
+    ]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['applied'] == []
+    assert body['rejected'][0]['id'] == 1
+
+
+@pytest.mark.parametrize('body', [
+    {'limit': 'many'},
+    {'limit': 0},
+    {'limit': 2.5},
+    {'limit': True},
+    {'max_tasks_per_inspector': -1},
+    {'max_tasks_per_inspector': [3]},
+    {'site_penalty': 'high'},
+    {'site_penalty': -1},
+    {'site_penalty': 'Infinity'},
+])
+def test_auto_assign_rejects_bad_numbers(client, body):
+    response = client.post('/api/tasks/auto-assign', json=body)
+    assert response.status_code == 400
+    assert next(iter(body)) in response.get_json()['error']
+
+
+def test_auto_assign_accepts_numeric_options(client):
+    response = client.post('/api/tasks/auto-assign', json={
+        'limit': '10', 'max_tasks_per_inspector': 5.0, 'site_penalty': 2})
+    assert response.status_code == 200
+    assert response.get_json()['dry_run'] is True
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Export of the tracker as a workbook in the layout data_loader reads.
+
+The 'All Units Ext Scope Data' sheet is written with the scope headers in
+their original order, followed by the dropdown sheets, so an exported file
+can be edited in Excel and uploaded again. Rows are read from the database
+in fetchmany batches and deflated into the sheet's XML as they arrive, so
+memory stays flat however many tasks are exported; the finished file is
+streamed from a temporary file and removed once sent.
+
+    python xlsx_export.py inspection_tracker.db tracker.xlsx --site SITE1 --status Claimed
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+from datetime import date
+from xml.sax.saxutils import escape
+
+from blob_store import CHUNK_SIZE
+from data_loader import DATE_COLUMNS, LOOKUP_SHEETS, SCOPE_COLUMNS, SCOPE_SHEET
+
+FETCH_SIZE = 2000
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Dropdown sheet -> query for its values
+LOOKUP_SHEET_SQL = {
+    'Inspectors': 'SELECT name FROM inspectors WHERE active = 1 ORDER BY name',
+    'Site': 'SELECT site_code FROM sites WHERE active = 1 ORDER BY site_code',
+    'Method': 'SELECT method_name FROM methods WHERE active = 1 ORDER BY method_name',
+    'Status': 'SELECT status_name FROM status_types WHERE active = 1 ORDER BY status_name',
+    'Inspection Priority': ('SELECT DISTINCT inspection_priority FROM inspection_tasks '
+                            'WHERE inspection_priority IS NOT NULL ORDER BY 1'),
+    'Interval': "SELECT DISTINCT interval_type FROM inspection_tasks WHERE IFNULL(interval_type, '') <> '' ORDER BY 1",
+    'Frequency': 'SELECT DISTINCT frequency FROM inspection_tasks WHERE frequency IS NOT NULL ORDER BY 1'
+}
+
+EXCEL_EPOCH = date(1899, 12, 30).toordinal()
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+# Style 1 is the built-in short date format, for the date columns
+STYLES_XML = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="{MAIN_NS}"><fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts><fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills><borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders><cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs><cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs><cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles></styleSheet>'''
+
+
+def _column_letters(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _cell(reference, value):
+    """One <c> element; None is an empty cell, dates are date serials in the date style"""
+    if value is None or value == '':
+        return ''
+    if isinstance(value, date):
+        return f'<c r="{reference}" s="1"><v>{value.toordinal() - EXCEL_EPOCH}</v></c>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{reference}"><v>{value!r}</v></c>'
+    text = escape(INVALID_XML_CHARS.sub('', str(value)))
+    space = ' xml:space="preserve"' if text[:1].isspace() or text[-1:].isspace() else ''
+    return f'<c r="{reference}" t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+
+class StreamingWorkbook:
+    """Minimal write-only XLSX writer: each sheet's XML is deflated into the zip as rows arrive.
+
+    Strings are written inline rather than to a shared strings table, so
+    nothing is kept per row. Sheets are written one after another.
+    """
+
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=1)
+        self.sheets = []
+
+    def write_sheet(self, name, rows):
+        """Write a sheet from an iterable of row lists; returns the number of rows"""
+        self.sheets.append(name)
+        letters = []
+        count = 0
+        with self.zip.open(f'xl/worksheets/sheet{len(self.sheets)}.xml', 'w') as handle:
+            handle.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                         f'<worksheet xmlns="{MAIN_NS}"><sheetData>'.encode())
+            chunk = []
+            for count, row in enumerate(rows, 1):
+                while len(letters) < len(row):
+                    letters.append(_column_letters(len(letters)))
+                cells = ''.join(_cell(f'{letters[index]}{count}', value) for index, value in enumerate(row))
+                chunk.append(f'<row r="{count}">{cells}</row>')
+                if len(chunk) >= FETCH_SIZE:
+                    handle.write(''.join(chunk).encode())
+                    chunk = []
+            chunk.append('</sheetData></worksheet>')
+            handle.write(''.join(chunk).encode())
+        return count
+
+    def close(self):
+        sheet_count = len(self.sheets)
+        overrides = ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{number}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for number in range(1, sheet_count + 1))
+        self.zip.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f'{overrides}</Types>'))
+        self.zip.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{PACKAGE_REL_NS}"><Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>'))
+        sheets = ''.join(f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{number}" r:id="rId{number}"/>'
+                         for number, name in enumerate(self.sheets, 1))
+        self.zip.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>{sheets}</sheets></workbook>'))
+        relationships = ''.join(
+            f'<Relationship Id="rId{number}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{number}.xml"/>'
+            for number in range(1, sheet_count + 1))
+        self.zip.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{PACKAGE_REL_NS}">{relationships}'
+            f'<Relationship Id="rId{sheet_count + 1}" Type="{REL_NS}/styles" Target="styles.xml"/></Relationships>'))
+        self.zip.writestr('xl/styles.xml', STYLES_XML)
+        self.zip.close()
+
+
+def export_filter(sites=None, statuses=None):
+    """WHERE clause and parameters limiting the export to the named sites and statuses"""
+    where = ''
+    params = []
+    if sites:
+        where += ' AND site_id IN (SELECT id FROM sites WHERE site_code IN ({}))'.format(', '.join('?' for _ in sites))
+        params.extend(sites)
+    if statuses:
+        where += ' AND status_id IN (SELECT id FROM status_types WHERE status_name IN ({}))'.format(
+            ', '.join('?' for _ in statuses))
+        params.extend(statuses)
+    return (' WHERE' + where[4:] if where else ''), params
+
+
+def _scope_rows(conn, sites=None, statuses=None):
+    """Tracker rows in scope column order, dates as dates, fetched in batches"""
+    fields = [column for _, column in SCOPE_COLUMNS]
+    date_positions = [fields.index(column) for column in DATE_COLUMNS]
+    where, params = export_filter(sites, statuses)
+    cursor = conn.execute(f'SELECT {", ".join(fields)} FROM inspection_task_details{where} ORDER BY id', params)
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        for row in rows:
+            row = list(row)
+            for position in date_positions:
+                value = row[position]
+                if value:
+                    try:
+                        row[position] = date.fromisoformat(value[:10])
+                    except ValueError:
+                        pass
+            yield row
+
+
+def write_tracker_workbook(conn, path, sites=None, statuses=None):
+    """Write the scope sheet and dropdown sheets to path; returns the number of task rows"""
+    workbook = StreamingWorkbook(path)
+    try:
+        header = [header for header, _ in SCOPE_COLUMNS]
+        count = workbook.write_sheet(SCOPE_SHEET, _with_header(header, _scope_rows(conn, sites, statuses))) - 1
+        for sheet_name, header in LOOKUP_SHEETS:
+            values = ([value] for (value,) in conn.execute(LOOKUP_SHEET_SQL[sheet_name]))
+            workbook.write_sheet(sheet_name, _with_header([header], values))
+    finally:
+        workbook.close()
+    return count
+
+
+def _with_header(header, rows):
+    yield header
+    yield from rows
+
+
+def export_to_temp_file(conn, sites=None, statuses=None, directory=None):
+    """Write the workbook to a new temporary file; returns (path, task rows). The caller removes it."""
+    handle, path = tempfile.mkstemp(suffix='.xlsx', prefix='tracker_export_', dir=directory)
+    os.close(handle)
+    try:
+        return path, write_tracker_workbook(conn, path, sites, statuses)
+    except Exception:
+        os.remove(path)
+        raise
+
+
+def stream_and_remove(path, chunk_size=CHUNK_SIZE):
+    """Yield a file in chunks and remove it once it has been sent (or the client went away)"""
+    try:
+        with open(path, 'rb') as handle:
+            while True:
+                chunk = handle.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the tracker as an Excel workbook')
+    parser.add_argument('database')
+    parser.add_argument('output')
+    parser.add_argument('--site', action='append', help='Only this site (repeatable)')
+    parser.add_argument('--status', action='append', help='Only this status (repeatable)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    started = time.perf_counter()
+    count = write_tracker_workbook(conn, args.output, args.site, args.status)
+    print(f"Exported {count} tasks to {args.output} in {time.perf_counter() - started:.1f}s")
+    conn.close()